@@ -0,0 +1,633 @@
+"""Benchmarks of the maze package
+
+Run all of them by ``python benchmark.py`` or only some, e.g.
+``python benchmark.py import``.
+"""
+import subprocess
+import sys
+import timeit
+
+
+def _run( code, repeat = 5 ):
+    """Best wall time of ``code`` in a fresh interpreter, in seconds"""
+    script = 'import time; _t = time.perf_counter()\n' + code + \
+             '\nprint( time.perf_counter() - _t )'
+    return min( float( subprocess.check_output( [ sys.executable, '-c', script ] ) )
+                for i in range( repeat ) )
+
+
+def bench_import():
+    """Startup cost of the headless solver against the whole application"""
+
+    headless = _run( 'import numpy, maze\nmaze.analyze( numpy.zeros((3,3)) )' )
+    # what the package used to import eagerly
+    eager = _run( 'import numpy, maze\nmaze.analyze( numpy.zeros((3,3)) )\nimport maze.gui, matplotlib.pyplot' )
+
+    loaded = subprocess.check_output( [ sys.executable, '-c',
+        'import sys, numpy, maze\nmaze.analyze( numpy.zeros((3,3)) ); maze.generate_maze( 11, 11 )\n'
+        'print( [m for m in ("PyQt5", "quamash", "docutils", "matplotlib") if m in sys.modules] )' ] )
+
+    print( 'import maze + analyze:      {:8.1f} ms'.format( headless * 1000 ) )
+    print( 'same + gui + matplotlib:    {:8.1f} ms'.format( eager * 1000 ) )
+    print( 'heavy modules loaded:       {}'.format( loaded.decode().strip() ) )
+
+
+def bench_batch( count = 5000, size = 21 ):
+    """analyze_batch against a Python loop over analyze"""
+    import numpy
+    from maze import maze_generator, maze_solver
+
+    stack = numpy.array( [ maze_generator.generate_maze( size, size ) for i in range( count ) ] )
+
+    loop = timeit.timeit( lambda: [ maze_solver.analyze( a ) for a in stack ], number = 1 )
+    batch = timeit.timeit( lambda: maze_solver.analyze_batch( stack ), number = 1 )
+
+    print( '{} mazes {}x{}'.format( count, size, size ) )
+    print( 'analyze loop:               {:8.2f} us/maze'.format( loop / count * 1e6 ) )
+    print( 'analyze_batch:              {:8.2f} us/maze  ({:.1f}x)'.format( batch / count * 1e6, loop / batch ) )
+
+
+def bench_threads( size = 5000 ):
+    """Serial and threaded BFS on an open board"""
+    import numpy
+    from maze import maze_solver
+
+    array = numpy.zeros( (size, size), dtype=numpy.int32 )
+    array[8,7] = 1
+
+    print( 'open board {}x{}'.format( size, size ) )
+    for threads in ( 1, 2, 4, 8 ):
+        seconds = min( timeit.repeat( lambda: maze_solver.analyze( array, threads ), number = 1, repeat = 3 ) )
+        print( 'threads={}:                  {:8.1f} ms'.format( threads, seconds * 1000 ) )
+
+
+def bench_memory( size = 4000 ):
+    """Bytes per cell kept by Solved_maze and the peak while solving
+
+    Before the compact layout the solver kept a framed int32 copy of the
+    maze, int32 distances and byte directions: 9 bytes per cell.
+    """
+    import numpy
+    import tracemalloc
+    from maze import maze_solver
+
+    array = numpy.zeros( (size, size), dtype=numpy.int8 )
+    array[8,7] = 1
+    cells = array.size
+
+    print( 'open board {}x{}'.format( size, size ) )
+    for compact, packed in ( ( False, False ), ( True, False ), ( True, True ) ):
+        tracemalloc.start()
+        solved = maze_solver.analyze( array, compact = compact, packed = packed )
+        kept, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print( 'compact={!s:5} packed={!s:5}: {:5.2f} B/cell kept, {:5.2f} B/cell peak'.format(
+            compact, packed, kept / cells, peak / cells ) )
+        del solved
+
+
+def bench_paths( size = 1000, dudes = 500 ):
+    """paths_union against walking every dude's path in Python"""
+    import numpy
+    from maze import maze_solver
+
+    rng = numpy.random.RandomState( 0 )
+    array = numpy.zeros( (size, size), dtype=numpy.int32 )
+    array[0,0] = 1
+    sources = rng.randint( 0, size, size=(dudes, 2) )
+    solved = maze_solver.analyze( array )
+    directions = solved.directions
+    line = { b'^': 0, b'>': 1, b'v': 2, b'<': 3 }
+
+    def python_loop():
+        paths = numpy.zeros( array.shape, dtype=numpy.uint8 )
+        for source in sources:
+            path = solved.path( *source )
+            line_in = line[ directions[ path[0] ] ]
+            for p in path:
+                paths[p] |= 1 << line_in
+                if directions[p] == b'X': break
+                line_out = line[ directions[p] ]
+                paths[p] |= 1 << line_out
+                line_in = ( line_out + 2 ) % 4
+        return paths
+
+    loop = timeit.timeit( python_loop, number = 1 )
+    union = min( timeit.repeat( lambda: solved.paths_union( sources ), number = 1, repeat = 5 ) )
+    print( '{} dudes on {}x{}'.format( dudes, size, size ) )
+    print( 'python loop over paths:     {:8.1f} ms'.format( loop * 1000 ) )
+    print( 'paths_union:                {:8.1f} ms  ({:.0f}x)'.format( union * 1000, loop / union ) )
+
+
+def bench_paint( size = 41, frames = 20 ):
+    """ms per frame of a full GridWidget repaint, SVG per cell against cached tiles"""
+    import os
+    os.environ.setdefault( 'QT_QPA_PLATFORM', 'offscreen' )
+    import numpy
+    from PyQt5 import QtGui, QtCore
+    from maze import gui, maze_generator
+
+    window = gui.Gui()
+    grid = window.grid
+    array = maze_generator.generate_maze( size, size )
+    for i, (r, c) in enumerate( numpy.argwhere( array == 0 )[:20] ):
+        array[r, c] = 2 + i % 5
+    grid.array = array
+    grid.change_maze()
+    paths = grid.solved.paths_union( numpy.argwhere( array >= 2 ) )
+    target = QtGui.QImage( grid.size(), QtGui.QImage.Format_ARGB32_Premultiplied )
+
+    def svg_frame():
+        # what paintEvent did before: rasterize every layer of every cell
+        painter = QtGui.QPainter( target )
+        for (row, column), value in numpy.ndenumerate( array ):
+            x, y = grid._ltop( row, column )
+            rect = QtCore.QRectF( x, y, grid.cell_size, grid.cell_size )
+            gui.IMG['Grass'].svg.render( painter, rect )
+            if paths[row, column]:
+                gui.LINES[ gui.LINE_NAMES[ paths[row, column] ] ].svg.render( painter, rect )
+                if grid.directions[row, column] != b'X':
+                    gui.ARROWS[ str( gui.DIR_TO_NUM[ grid.directions[row, column] ] ) ].svg.render( painter, rect )
+            if value != 0:
+                gui.NUM_INDEX[ value ].svg.render( painter, rect )
+        painter.end()
+
+    def tile_frame():
+        grid.render( target )
+
+    tile_frame() # warm the cache
+    svg = min( timeit.repeat( svg_frame, number = 1, repeat = frames ) )
+    tiles = min( timeit.repeat( tile_frame, number = 1, repeat = frames ) )
+    print( '{}x{} cells of {} px'.format( size, size, grid.cell_size ) )
+    print( 'SVG per cell:               {:8.1f} ms/frame ({:6.1f} fps)'.format( svg * 1000, 1 / svg ) )
+    print( 'cached tiles:               {:8.1f} ms/frame ({:6.1f} fps)'.format( tiles * 1000, 1 / tiles ) )
+
+
+def bench_play( size = 41, dudes = 100, frames = 200, big = 2000 ):
+    """ms per actor update in play mode: re-tiling the dirty cell against the static layer"""
+    import os
+    os.environ.setdefault( 'QT_QPA_PLATFORM', 'offscreen' )
+    import numpy
+    from PyQt5 import QtGui, QtCore
+    from maze import gui, maze_generator, actor
+
+    window = gui.Gui()
+    grid = window.grid
+    array = maze_generator.generate_maze( size, size )
+    grid.array = array
+    grid.change_maze()
+    free = numpy.argwhere( array == 0 )
+    grid.dudes = [ actor.Actor( grid, float(r), float(c), 2 + i % 5 ) for i, (r, c) in enumerate( free[:dudes] ) ]
+    window.play_action.setChecked( True )
+    target = QtGui.QImage( grid.size(), QtGui.QImage.Format_ARGB32_Premultiplied )
+    rects = [ QtCore.QRect( *grid._ltop( int(dude.row), int(dude.column) ), grid.cell_size, grid.cell_size ) for dude in grid.dudes ]
+
+    def cell_frame():
+        # what paintEvent did before: grass and objects of the rect, then every dude
+        for rect in rects:
+            painter = QtGui.QPainter( target )
+            painter.setClipRect( rect )
+            row, column = grid._ptol( rect.left(), rect.top() )
+            x, y = grid._ltop( row, column )
+            painter.drawPixmap( x, y, grid._tile( gui.IMG['Grass'] ) )
+            if array[row, column] != 0 and array[row, column] < 2:
+                painter.drawPixmap( x, y, grid._tile( gui.NUM_INDEX[ array[row, column] ] ) )
+            for dude in grid.dudes:
+                painter.drawPixmap( QtCore.QPointF( *grid._ltop( dude.row, dude.column ) ),
+                                    grid._tile( gui.IMG[ "Dude" + str( dude.kind - 1 ) ] ) )
+            painter.end()
+
+    def layer_frame():
+        # what paintEvent does now
+        for rect in rects:
+            painter = QtGui.QPainter( target )
+            painter.setClipRect( rect )
+            grid._paint_layer( painter, rect )
+            grid._repaint_dudes( painter, QtCore.QRectF( rect ) )
+            painter.end()
+
+    layer_frame() # warm the caches
+    cells = min( timeit.repeat( cell_frame, number = 1, repeat = frames ) ) / len( rects )
+    layer = min( timeit.repeat( layer_frame, number = 1, repeat = frames ) ) / len( rects )
+    print( '{} dudes on {}x{}'.format( len( rects ), size, size ) )
+    print( 'tiles + all dudes:          {:8.3f} ms/update'.format( cells * 1000 ) )
+    print( 'static layer + culled:      {:8.3f} ms/update'.format( layer * 1000 ) )
+
+    # the first frame of a big board composes only the tiles in view
+    grid.array = maze_generator.generate_maze( big, big )
+    grid.change_maze()
+    grid.dudes = []
+    view = QtGui.QImage( 1280, 960, QtGui.QImage.Format_ARGB32_Premultiplied )
+    first = timeit.timeit( lambda: grid.render( view, QtCore.QPoint(), QtGui.QRegion( view.rect() ) ), number = 1 )
+    print( 'first 1280x960 frame of {}x{}:  {:8.1f} ms, {} of {} tiles'.format(
+        big, big, first * 1000, len( grid._layers ), ( -( -big // gui.LAYER_TILE ) ) ** 2 ) )
+
+
+def bench_simulate( size = 41, dudes = 20 ):
+    """Virtual seconds of play simulated per wall-clock second"""
+    import numpy
+    from maze import actor, maze_generator
+
+    array = maze_generator.generate_maze( size, size )
+    free = numpy.argwhere( array == 0 )
+    for i, (r, c) in enumerate( free[ numpy.random.RandomState( 0 ).choice( len( free ), dudes, replace = False ) ] ):
+        array[r, c] = 2 + i % 5
+
+    finish = []
+    seconds = timeit.timeit( lambda: finish.extend( actor.simulate( array, seed = 0 ) ), number = 1 )
+    # dudes that never arrive are played until the limit of an hour
+    played = sum( 3600.0 if t is None else t for t in finish )
+    print( '{} dudes on {}x{}, {} reached a castle'.format( dudes, size, size, sum( t is not None for t in finish ) ) )
+    print( 'simulated {:8.0f} dude-seconds in {:6.1f} ms ({:.0f}x real time)'.format(
+        played, seconds * 1000, played / seconds ) )
+
+
+def bench_swarm( size = 201, dudes = 10000, limit = 300.0 ):
+    """Swarm against one actor.simulate coroutine per dude"""
+    import numpy
+    from maze import actor, maze_generator, swarm
+
+    array = maze_generator.generate_maze( size, size )
+    free = numpy.argwhere( array == 0 )
+    for i, (r, c) in enumerate( free[ numpy.random.RandomState( 0 ).choice( len( free ), dudes, replace = False ) ] ):
+        array[r, c] = 2 + i % 5
+
+    coroutines = timeit.timeit( lambda: actor.simulate( array, limit = limit, seed = 0 ), number = 1 )
+    arrays = timeit.timeit( lambda: swarm.Swarm( array, seed = 0 ).run( limit = limit, dt = 0.05 ), number = 1 )
+    print( '{} dudes on {}x{}, {:.0f} s of play at 20 ticks/s'.format( dudes, size, size, limit ) )
+    print( 'actor.simulate:             {:8.2f} s'.format( coroutines ) )
+    print( 'Swarm:                      {:8.2f} s  ({:.1f}x), {:.2f} ms/tick'.format(
+        arrays, coroutines / arrays, arrays / ( ( limit + 1 ) * 20 ) * 1000 ) )
+
+
+def bench_randomize( size = 1000 ):
+    """randomize against numpy.vectorize over val_to_rand"""
+    import numpy
+    from maze import maze_generator
+
+    array = maze_generator.generate_maze( size, size )
+    vectorized = timeit.timeit( lambda: numpy.vectorize( maze_generator.val_to_rand )( array ), number = 1 )
+    generator = min( timeit.repeat( lambda: maze_generator.randomize( array, 0 ), number = 1, repeat = 5 ) )
+    print( 'maze {}x{}'.format( size, size ) )
+    print( 'numpy.vectorize:            {:8.1f} ms'.format( vectorized * 1000 ) )
+    print( 'randomize:                  {:8.1f} ms  ({:.0f}x)'.format( generator * 1000, vectorized / generator ) )
+
+
+def bench_generate( sizes = ( 51, 201, 1001, 4001 ) ):
+    """generate_maze across sizes and methods"""
+    from maze import maze_generator
+
+    for method in maze_generator.METHODS:
+        for size in sizes:
+            seconds = min( timeit.repeat( lambda: maze_generator.generate_maze( size, size, seed = 0, method = method ),
+                                          number = 1, repeat = 3 ) )
+            print( '{:8} {:5}x{:<5}        {:8.2f} ms  ({:.1f} ns/cell)'.format(
+                method, size, size, seconds * 1000, seconds / size ** 2 * 1e9 ) )
+
+
+def bench_many( count = 20000, size = 31 ):
+    """generate_many against a Python loop over generate_maze"""
+    from maze import maze_generator
+
+    loop = timeit.timeit( lambda: [ maze_generator.generate_maze( size, size ) for i in range( count ) ], number = 1 )
+    print( '{} mazes {}x{}'.format( count, size, size ) )
+    print( 'generate_maze loop:         {:8.2f} us/maze'.format( loop / count * 1e6 ) )
+    for workers in ( 1, 2, 4, 8 ):
+        seconds = timeit.timeit( lambda: maze_generator.generate_many( count, size, size, 0, workers ), number = 1 )
+        print( 'generate_many workers={}:    {:8.2f} us/maze  ({:.1f}x)'.format(
+            workers, seconds / count * 1e6, loop / seconds ) )
+
+
+def bench_stream( width = 10001, height = 10001 ):
+    """generate_rows streamed into a bit-encoded file"""
+    import os
+    import tempfile
+    import tracemalloc
+    from maze import maze_generator, mazefile
+
+    path = os.path.join( tempfile.mkdtemp(), 'stream.maze' )
+    tracemalloc.start()
+    seconds = timeit.timeit( lambda: mazefile.write_rows( path, maze_generator.generate_rows( width, height, seed = 0 ), width ),
+                             number = 1 )
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    size = os.path.getsize( path )
+    os.remove( path )
+    print( 'maze {}x{}'.format( width, height ) )
+    print( 'generate + write:           {:8.2f} s  ({:.1f} ns/cell)'.format( seconds, seconds / width / height * 1e9 ) )
+    print( 'peak memory:                {:8.1f} MB  (int32 grid {:.0f} MB)'.format( peak / 2**20, width * height * 4 / 2**20 ) )
+    print( 'file:                       {:8.1f} MB'.format( size / 2**20 ) )
+
+
+def bench_outofcore( size = 6001, budget = 1 << 24 ):
+    """analyze_into over memmaps against analyze in memory"""
+    import os
+    import tempfile
+    import numpy
+    from maze import maze_generator, maze_solver
+
+    folder = tempfile.mkdtemp()
+    def memmap( name, dtype ):
+        return numpy.memmap( os.path.join( folder, name ), dtype = dtype, mode = 'w+', shape = ( size, size ) )
+
+    array = memmap( 'maze', numpy.int8 )
+    start = 0
+    for rows in maze_generator.generate_rows( size, size, seed = 0 ):
+        array[ start : start + len( rows ) ] = rows
+        start += len( rows )
+    distances = memmap( 'distances', numpy.int32 )
+    directions = memmap( 'directions', 'S1' )
+
+    memory = timeit.timeit( lambda: maze_solver.analyze( array ), number = 1 )
+    mapped = timeit.timeit( lambda: maze_solver.analyze_into( array, distances, directions, budget ), number = 1 )
+    for name in ( 'maze', 'distances', 'directions' ):
+        os.remove( os.path.join( folder, name ) )
+    print( 'maze {}x{} in an int8 memmap'.format( size, size ) )
+    print( 'analyze:                    {:8.2f} s  (~{:.0f} MB of arrays)'.format( memory, size * size * 9 / 2**20 ) )
+    print( 'analyze_into:               {:8.2f} s  ({:.0f} MB budget)'.format( mapped, budget / 2**20 ) )
+
+
+def bench_files( size = 2000 ):
+    """maze.save/maze.load against numpy.savetxt/numpy.loadtxt"""
+    import os
+    import tempfile
+    import numpy
+    from maze import maze_generator, mazefile
+
+    folder = tempfile.mkdtemp()
+    text, binary = os.path.join( folder, 'maze.txt' ), os.path.join( folder, 'maze.maze' )
+    array = maze_generator.randomize( maze_generator.generate_maze( size, size, seed = 0 ), 0 )
+
+    results = [
+        ( 'savetxt', timeit.timeit( lambda: numpy.savetxt( text, array ), number = 1 ) ),
+        ( 'loadtxt', timeit.timeit( lambda: numpy.loadtxt( text ).astype( numpy.int32 ), number = 1 ) ),
+        ( 'save', timeit.timeit( lambda: mazefile.save( binary, array ), number = 1 ) ),
+        ( 'load (mmap, summed)', timeit.timeit( lambda: mazefile.load( binary ).sum(), number = 1 ) ),
+    ]
+    sizes = os.path.getsize( text ), os.path.getsize( binary )
+    os.remove( text )
+    os.remove( binary )
+    print( 'maze {}x{}, text {:.1f} MB, .maze {:.1f} MB'.format( size, size, sizes[0] / 2**20, sizes[1] / 2**20 ) )
+    for name, seconds in results:
+        print( '{:28}{:8.1f} ms'.format( name + ':', seconds * 1000 ) )
+
+
+def bench_cache( size = 2001 ):
+    """analyze with a Solution_cache: first solve, then hits mapped from the file"""
+    import shutil
+    import tempfile
+    from maze import cache, maze_generator, maze_solver
+
+    folder = tempfile.mkdtemp()
+    array = maze_generator.generate_maze( size, size, seed = 0 )
+    solutions = cache.Solution_cache( folder )
+    try:
+        results = [
+            ( 'analyze', timeit.timeit( lambda: maze_solver.analyze( array ), number = 1 ) ),
+            ( 'miss (solve and store)', timeit.timeit( lambda: maze_solver.analyze( array, cache = solutions ), number = 1 ) ),
+            ( 'hit', min( timeit.repeat( lambda: maze_solver.analyze( array, cache = solutions ), number = 1, repeat = 5 ) ) ),
+            ( 'fingerprint', min( timeit.repeat( lambda: cache.fingerprint( array ), number = 1, repeat = 5 ) ) ),
+        ]
+    finally:
+        shutil.rmtree( folder )
+    print( 'maze {}x{}'.format( size, size ) )
+    for name, seconds in results:
+        print( '{:28}{:8.1f} ms'.format( name + ':', seconds * 1000 ) )
+
+
+def bench_memo( size = 2001 ):
+    """analyze with a Solution_memo, as the editor returns to a recent maze"""
+    import numpy
+    from maze import cache, maze_generator, maze_solver
+
+    array = maze_generator.generate_maze( size, size, seed = 0 )
+    memo = cache.Solution_memo()
+    key = memo.key( array )
+    maze_solver.analyze( array, cache = memo, key = key )
+    row, column = numpy.argwhere( array == 0 )[ 1000 ]
+
+    def toggle():
+        # one cell walled and freed again, the key follows by zobrist_edit
+        edited = cache.zobrist_edit( key, row, column, 0, -1 )
+        back = cache.zobrist_edit( edited, row, column, -1, 0 )
+        return maze_solver.analyze( array, cache = memo, key = back )
+
+    results = [
+        ( 'analyze', min( timeit.repeat( lambda: maze_solver.analyze( array ), number = 1, repeat = 3 ) ) ),
+        ( 'zobrist (full key)', min( timeit.repeat( lambda: cache.zobrist( array ), number = 1, repeat = 3 ) ) ),
+        ( 'zobrist_edit x2 + hit', min( timeit.repeat( toggle, number = 1, repeat = 5 ) ) ),
+    ]
+    print( 'maze {}x{}, hits {}, misses {}'.format( size, size, memo.hits, memo.misses ) )
+    for name, seconds in results:
+        print( '{:28}{:8.1f} ms'.format( name + ':', seconds * 1000 ) )
+
+
+def _heap_dijkstra( array ):
+    """Weighted distances by heapq, the reference for bench_weighted"""
+    import heapq
+    import numpy
+
+    sx, sy = array.shape
+    flat = array.ravel().tolist()
+    dist = [ -1 ] * len( flat )
+    heap = [ ( 0, i ) for i, value in enumerate( flat ) if value == 1 ]
+    for _, i in heap:
+        dist[i] = 0
+    while heap:
+        d, c = heapq.heappop( heap )
+        if d > dist[c]:
+            continue
+        x, y = divmod( c, sy )
+        for v, ok in ( ( c - sy, x > 0 ), ( c + sy, x < sx - 1 ), ( c - 1, y > 0 ), ( c + 1, y < sy - 1 ) ):
+            if ok and flat[v] >= 0 and flat[v] != 1:
+                nd = d + max( flat[v], 1 )
+                if dist[v] < 0 or nd < dist[v]:
+                    dist[v] = nd
+                    heapq.heappush( heap, ( nd, v ) )
+    return numpy.array( dist ).reshape( sx, sy )
+
+
+def bench_weighted( size = 2001, heap_size = 501 ):
+    """analyze(weighted=True) on randomized terrain against BFS and a heapq Dijkstra"""
+    from maze import maze_generator, maze_solver
+
+    array = maze_generator.randomize( maze_generator.generate_maze( size, size, seed = 0 ), 0 )
+    small = array[ :heap_size, :heap_size ]
+    assert ( maze_solver.analyze( small, weighted = True ).distances == _heap_dijkstra( small ) ).all()
+
+    print( 'randomized {0}x{0}'.format( size ) )
+    for name, run in [
+        ( 'analyze (BFS)', lambda: maze_solver.analyze( array ) ),
+        ( 'analyze weighted (Dial)', lambda: maze_solver.analyze( array, weighted = True ) ),
+    ]:
+        print( '{:28}{:8.1f} ms'.format( name + ':', min( timeit.repeat( run, number = 1, repeat = 3 ) ) * 1000 ) )
+
+    dial = min( timeit.repeat( lambda: maze_solver.analyze( small, weighted = True ), number = 1, repeat = 3 ) )
+    heap = timeit.timeit( lambda: _heap_dijkstra( small ), number = 1 )
+    print( 'randomized {0}x{0}'.format( heap_size ) )
+    print( '{:28}{:8.1f} ms'.format( 'analyze weighted (Dial):', dial * 1000 ) )
+    print( '{:28}{:8.1f} ms  ({:.0f}x)'.format( 'heapq Dijkstra:', heap * 1000, heap / dial ) )
+
+
+def bench_shortest( size = 4001, queries = 200 ):
+    """shortest_path between nearby cells against solving the whole maze"""
+    import numpy
+    from maze import maze_generator, maze_solver
+
+    array = maze_generator.generate_maze( size, size, seed = 0 )
+    rng = numpy.random.default_rng( 0 )
+    free = numpy.argwhere( array >= 0 )
+    starts = free[ rng.integers( 0, len( free ), queries ) ]
+    # goals up to 10 cells away in both coordinates
+    goals = []
+    for row, column in starts:
+        near = array[ max( row - 10, 0 ) : row + 11, max( column - 10, 0 ) : column + 11 ]
+        cells = numpy.argwhere( near >= 0 ) + [ max( row - 10, 0 ), max( column - 10, 0 ) ]
+        goals.append( tuple( cells[ rng.integers( len( cells ) ) ] ) )
+
+    print( 'maze {0}x{0}, {1} queries of goals within 10 rows and columns'.format( size, queries ) )
+    print( '{:28}{:8.1f} ms'.format( 'analyze:', timeit.timeit( lambda: maze_solver.analyze( array ), number = 1 ) * 1000 ) )
+    finder = maze_solver.Path_finder( array )
+    for method in maze_solver.PATH_METHODS:
+        visited = []
+        def run():
+            for start, goal in zip( starts, goals ):
+                try:
+                    finder.path( tuple( start ), goal, method )
+                except ValueError:
+                    pass
+                visited.append( finder.visited )
+        seconds = timeit.timeit( run, number = 1 )
+        print( '{:28}{:8.3f} ms/query, {:.0f} cells visited on average'.format(
+            method + ':', seconds * 1000 / queries, numpy.mean( visited ) ) )
+
+
+def bench_jps( size = 5000, queries = 20 ):
+    """Path_finder methods on an open board, as the editor creates them"""
+    import numpy
+    from maze import maze_solver
+
+    array = numpy.zeros( ( size, size ), dtype=numpy.int32 )
+    rng = numpy.random.default_rng( 0 )
+    array[ rng.integers( 0, size, size ), rng.integers( 0, size, size ) ] = -1
+    cells = rng.integers( 0, size, ( queries, 2, 2 ) )
+    cells = [ ( tuple( a ), tuple( b ) ) for a, b in cells if array[ tuple( a ) ] == 0 and array[ tuple( b ) ] == 0 ]
+
+    finder = maze_solver.Path_finder( array )
+    table = timeit.timeit( lambda: finder.path( cells[0][0], cells[0][0], 'jps' ), number = 1 )
+    print( 'open {0}x{0} with {0} walls, {1} random queries'.format( size, len( cells ) ) )
+    print( '{:28}{:8.1f} ms'.format( 'jps jump table:', table * 1000 ) )
+    for method, compressed in [ ( 'astar', False ), ( 'bidirectional', False ), ( 'jps', False ), ( 'jps', True ) ]:
+        visited = []
+        def run():
+            for start, goal in cells:
+                finder.path( start, goal, method, compressed )
+                visited.append( finder.visited )
+        seconds = timeit.timeit( run, number = 1 )
+        name = method + ( ' compressed' if compressed else '' )
+        print( '{:28}{:8.2f} ms/query, {:.0f} cells visited on average'.format(
+            name + ':', seconds * 1000 / len( cells ), numpy.mean( visited ) ) )
+
+
+def bench_hpa( size = 2001, queries = 100 ):
+    """Path_index queries and updates against analyze and Path_finder"""
+    import numpy
+    from maze import maze_generator, maze_solver
+
+    array = maze_generator.generate_maze( size, size, seed = 0 )
+    # a few holes, so that there is more than one way
+    rng = numpy.random.default_rng( 0 )
+    holes = rng.integers( 1, size - 1, ( size * 4, 2 ) )
+    array[ holes[:,0], holes[:,1] ] = 0
+    free = numpy.argwhere( array >= 0 )
+    starts = free[ rng.integers( 0, len( free ), queries ) ]
+    far = [ ( tuple( a ), tuple( b ) ) for a, b in zip( starts, free[ rng.integers( 0, len( free ), queries ) ] ) ]
+    near = []
+    for a in starts:
+        cells = free[ ( numpy.abs( free - a ) <= 32 ).all( axis = 1 ) ]
+        near.append( ( tuple( a ), tuple( cells[ rng.integers( len( cells ) ) ] ) ) )
+
+    indexes = []
+    build = timeit.timeit( lambda: indexes.append( maze_solver.Path_index( array ) ), number = 1 )
+    index = indexes[0]
+    finder = maze_solver.Path_finder( array )
+    print( 'maze {0}x{0} with {1} holes, {2} entrances'.format( size, len( holes ), index.nodes ) )
+    print( '{:28}{:8.1f} ms'.format( 'analyze:', timeit.timeit( lambda: maze_solver.analyze( array ), number = 1 ) * 1000 ) )
+    print( '{:28}{:8.1f} ms'.format( 'Path_index build:', build * 1000 ) )
+
+    for name, pairs in [ ( 'goals within 32 cells', near ), ( 'random goals', far ) ]:
+        print( '{} queries, {}'.format( queries, name ) )
+        exact, found = [], []
+        seconds = timeit.timeit( lambda: exact.extend( len( finder.path( a, b, 'bidirectional' ) ) - 1 for a, b in pairs ), number = 1 )
+        print( '{:28}{:10.1f} us/query'.format( '  Path_finder bidirectional:', seconds * 1e6 / queries ) )
+        seconds = timeit.timeit( lambda: found.extend( index.distance( a, b ) for a, b in pairs ), number = 1 )
+        ratio = numpy.array( found ) / numpy.maximum( exact, 1 )
+        print( '{:28}{:10.1f} us/query, {:.3f}x optimal on average, {:.2f}x at worst'.format(
+            '  Path_index distance:', seconds * 1e6 / queries, ratio.mean(), ratio.max() ) )
+        seconds = timeit.timeit( lambda: [ index.path( a, b ) for a, b in pairs ], number = 1 )
+        print( '{:28}{:10.1f} us/query'.format( '  Path_index path:', seconds * 1e6 / queries ) )
+
+    cells = free[ rng.integers( 0, len( free ), 1000 ) ]
+    def toggle():
+        for row, column in cells:
+            index.update_cell( row, column, -1 )
+            index.update_cell( row, column, 0 )
+    print( '{:28}{:10.1f} us/update'.format( 'Path_index update_cell:', timeit.timeit( toggle, number = 1 ) * 1e6 / 2000 ) )
+
+
+def bench_compress( size = 4001, queries = 20 ):
+    """Corridor graph against analyze and Path_finder, with and without loops"""
+    import numpy
+    from maze import maze_generator, maze_solver
+
+    for method in ( 'walk', 'kruskal' ):
+        array = maze_generator.generate_maze( size, size, seed = 0, method = method )
+        graphs = []
+        build = timeit.timeit( lambda: graphs.append( maze_solver.compress( array ) ), number = 1 )
+        graph = graphs[0]
+        print( "{} {}x{}: {} free cells, {} nodes, {} edges, {}a forest".format(
+            method, size, size, numpy.count_nonzero( array >= 0 ), len( graph ), len( graph.targets ) // 2,
+            '' if graph.forest else 'not ' ) )
+        print( '{:24}{:10.1f} ms'.format( '  compress:', build * 1000 ) )
+        print( '{:24}{:10.1f} ms'.format( '  analyze:', min( timeit.repeat( lambda: maze_solver.analyze( array ), number = 1, repeat = 3 ) ) * 1000 ) )
+        print( '{:24}{:10.1f} ms'.format( '  distances:', min( timeit.repeat( graph.distances, number = 1, repeat = 3 ) ) * 1000 ) )
+
+        rng = numpy.random.default_rng( 0 )
+        free = numpy.argwhere( array >= 0 )
+        pairs = [ ( tuple( free[a] ), tuple( free[b] ) ) for a, b in rng.integers( 0, len( free ), ( queries, 2 ) ) ]
+        finder = maze_solver.Path_finder( array )
+        for name, query in [ ( 'bidirectional BFS', lambda a, b: finder.path( a, b, 'bidirectional' ) ),
+                             ( 'graph distance', graph.distance ),
+                             ( 'graph path', graph.path ) ]:
+            seconds = timeit.timeit( lambda: [ query( a, b ) for a, b in pairs ], number = 1 )
+            print( '{:24}{:10.1f} us/query'.format( '  ' + name + ':', seconds * 1e6 / queries ) )
+
+BENCHMARKS = {
+    'import': bench_import,
+    'batch': bench_batch,
+    'threads': bench_threads,
+    'memory': bench_memory,
+    'paths': bench_paths,
+    'paint': bench_paint,
+    'play': bench_play,
+    'simulate': bench_simulate,
+    'swarm': bench_swarm,
+    'randomize': bench_randomize,
+    'generate': bench_generate,
+    'many': bench_many,
+    'stream': bench_stream,
+    'outofcore': bench_outofcore,
+    'files': bench_files,
+    'cache': bench_cache,
+    'memo': bench_memo,
+    'weighted': bench_weighted,
+    'shortest': bench_shortest,
+    'jps': bench_jps,
+    'hpa': bench_hpa,
+    'compress': bench_compress,
+}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or sorted( BENCHMARKS ):
+        print( '##', name )
+        BENCHMARKS[name]()
@@ -1,5 +1,40 @@
-from .maze_generator import generate_maze, print_maze, randomize, remove_frame
-from .maze_solver import analyze
-from .gui import main
-from .actor import Actor
-__all__ = ['maze_generator', 'maze_solver', 'gui','actor']
+import importlib
+
+__all__ = ['maze_generator', 'maze_solver', 'gui','actor', 'swarm', 'mazefile', 'cache']
+
+# Submodules are imported on first use, so that the solver can be used
+# without Qt or matplotlib installed.
+_ATTRIBUTES = {
+    'generate_maze': 'maze_generator',
+    'generate_many': 'maze_generator',
+    'generate_rows': 'maze_generator',
+    'print_maze': 'maze_generator',
+    'randomize': 'maze_generator',
+    'remove_frame': 'maze_generator',
+    'analyze': 'maze_solver',
+    'analyze_batch': 'maze_solver',
+    'analyze_into': 'maze_solver',
+    'shortest_path': 'maze_solver',
+    'compress': 'maze_solver',
+    'main': 'gui',
+    'Actor': 'actor',
+    'simulate': 'actor',
+    'Swarm': 'swarm',
+    'write_rows': 'mazefile',
+    'read_rows': 'mazefile',
+    'load': 'mazefile',
+    'save': 'mazefile',
+    'Solution_cache': 'cache',
+}
+
+def __getattr__( name ):
+    if name in __all__:
+        return importlib.import_module( '.' + name, __name__ )
+    if name in _ATTRIBUTES:
+        value = getattr( importlib.import_module( '.' + _ATTRIBUTES[name], __name__ ), name )
+        globals()[name] = value
+        return value
+    raise AttributeError( 'module {!r} has no attribute {!r}'.format( __name__, name ) )
+
+def __dir__():
+    return sorted( set( globals() ) | set( __all__ ) | set( _ATTRIBUTES ) )
@@ -1,13 +1,21 @@
 """This file has been placed in the public domain"""
 import asyncio
 import contextlib
+import heapq
 import time
 import random
 
+import numpy
+
 DIR = [ ( b'v', (1,0) ), ( b'>', (0,1) ) , ( b'^', (-1,0) ), ( b'<', (0,-1) ) ]
 #RIGHT = { ( (1,0),(0,-1)), ( (0,1),(1,0)), ( (-1,0),(0,1)) , ( (0,-1),(-1,0))  }
 
 class Actor:
+
+    # source of randomness of the behaviors, replaced by a seeded
+    # random.Random in simulations
+    _random = random
+
     def __init__(self, grid, row, column, kind):
         """Coroutine-based actor on a grid
 
@@ -223,11 +231,11 @@ class Teleported_Actor ( Actor ):
                         self.grid.end_game()
                         return
 
-            if random.randint(0,10) <= 1:
+            if self._random.randint(0,10) <= 1:
 
 
                 shape = self.grid.directions.shape
-                move = ( random.randint( 0,shape[0] - 1 ), random.randint( 0,shape[0] - 1 ) )
+                move = ( self._random.randint( 0,shape[0] - 1 ), self._random.randint( 0,shape[0] - 1 ) )
 
                 if self.is_ok( *move ) and distances[move] > 5:
                     for i in range(4):
@@ -310,9 +318,9 @@ class Confused_Actor (Actor):
 
             chosen = 0
 
-            r1 = random.randint(0,2)
+            r1 = self._random.randint(0,2)
             if r1 == 0:
-                r_dir = random.randint(0,3)
+                r_dir = self._random.randint(0,3)
                 move = DIR[r_dir][1]
                 if self.is_ok( self.row + move[0], self.column + move[1] ):
                     chosen = 1
@@ -383,7 +391,7 @@ class Right_hand_Actor ( Actor ):
                 if move[0] == 0: move = -move[1], move[0]
                 else: move = move[1], move[0]
 
-            speed = 1.0-random.randint(0,99)/100.0
+            speed = 1.0-self._random.randint(0,99)/100.0
             alpha = 0.7
             speed = (speed *  alpha + last_speed * (1.0 - alpha))
 
@@ -391,3 +399,106 @@ class Right_hand_Actor ( Actor ):
             last_speed = speed
             await self.step( *move, speed ) #cca 75% faster.
 
+
+KINDS = { 2: Right_hand_Actor, 3: Confused_Actor, 4: Fast_Actor, 5: Accelerated_Actor, 6: Teleported_Actor }
+
+
+class _Delay:
+    """Awaitable that hands its duration to the simulation loop"""
+    def __init__(self, duration):
+        self.duration = duration
+
+    def __await__(self):
+        yield self.duration
+
+
+class _Simulated:
+    """Moves of an actor on the virtual clock of ``simulate``
+
+    Every move takes its whole duration at once, the actor lands on
+    the final position right after it.
+    """
+
+    async def step(self, dr, dc, duration=1):
+        await _Delay(duration)
+        self.row += dr
+        self.column += dc
+
+    async def jump(self, duration=0.2):
+        await _Delay(duration)
+
+    async def shiver(self, duration=0.1):
+        await _Delay(duration)
+
+
+SIMULATED = { kind: type( cls.__name__, (_Simulated, cls), {} ) for kind, cls in KINDS.items() }
+
+
+class _Board:
+    """The part of GridWidget the behaviors use, without Qt"""
+
+    cell_size = 1
+
+    def __init__(self, array):
+        from . import maze_solver
+        self.array = array
+        self.solved = maze_solver.analyze( array )
+        self.directions = self.solved.directions
+        self.state = None
+
+    def update_actor(self, actor):
+        pass
+
+    def end_game(self):
+        self.state = 'castle'
+
+    def no_path(self):
+        self.state = 'no path'
+
+
+def simulate(array, limit=3600.0, seed=None):
+    """Plays the dudes of a maze on a virtual clock, without Qt
+
+    :param array: the maze, dudes are the cells with values 2 to 6 (the
+        kinds of ``KINDS``), other values above 1 are skipped like in the game
+    :param limit: virtual seconds after which the simulation stops
+    :param seed: seed of the dudes' random decisions
+
+    Returns a list with the finish time of every dude, in the order of
+    ``numpy.argwhere(numpy.isin(array, list(KINDS)))``. Times are counted like the game time,
+    without the starting jump. Dudes with no path to a castle, or that
+    do not reach one within ``limit``, get ``None``.
+    """
+    board = _Board( array )
+    rng = random.Random( seed )
+
+    queue = []
+    for i, (row, column) in enumerate( numpy.argwhere( numpy.isin( board.array, list( SIMULATED ) ) ) ):
+        kind = int( board.array[row, column] )
+        dude = SIMULATED[kind]( board, int(row), int(column), kind )
+        dude._random = random.Random( rng.getrandbits( 64 ) )
+        queue.append( ( -1.0, i, dude.behavior() ) ) # -1.0 for the starting jump
+    finish = [ None ] * len( queue )
+
+    heapq.heapify( queue )
+    while queue:
+        now, i, behavior = heapq.heappop( queue )
+        if now > limit:
+            break
+
+        board.state = None
+        try:
+            duration = behavior.send( None )
+        except StopIteration:
+            if board.state == 'castle':
+                finish[i] = now
+            continue
+
+        if board.state == 'no path':
+            behavior.close()
+            continue
+        heapq.heappush( queue, ( now + duration, i, behavior ) )
+
+    for now, i, behavior in queue:
+        behavior.close()
+    return finish
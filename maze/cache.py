@@ -0,0 +1,226 @@
+"""Solved mazes kept on disk or in memory, keyed by the content of the maze
+
+``Solution_cache`` keeps one file per maze, named by a hash of its walls,
+empty cells and castles (the dudes do not change the solution). A file
+starts with a header of 32 bytes, little endian:
+
+    magic       4s  b'MSOL'
+    version     B   1
+    reserved    3x
+    height      Q   of the maze, without the frame
+    width       Q
+    unreached   q   empty cells without a path to a castle
+
+followed by the distances (int32) and the directions (one byte) of the
+maze with a frame of walls, as ``Solved_maze`` keeps them, so that they
+can be mapped as they are.
+
+``Solution_memo`` keeps the last solutions in memory, keyed by a hash that
+is updated in constant time when one cell changes.
+"""
+import collections
+import hashlib
+import os
+import struct
+import tempfile
+
+import numpy
+
+MAGIC = b'MSOL'
+VERSION = 1
+SUFFIX = '.sol'
+
+HEADER = struct.Struct( '<4sB3xQQq' )
+
+
+def fingerprint( array ):
+    """Hash of the shape and the walls, empty cells and castles of a maze"""
+    array = numpy.asarray( array )
+    kinds = ( array < 0 ).view( numpy.uint8 ) * 2 + ( array == 1 ).view( numpy.uint8 )
+    h = hashlib.blake2b( digest_size = 16 )
+    h.update( struct.pack( '<QQ', *array.shape ) )
+    h.update( numpy.ascontiguousarray( kinds ) )
+    return h.hexdigest()
+
+
+def _mix( x ):
+    """splitmix64 finalizer of an uint64 array"""
+    x = ( x ^ ( x >> numpy.uint64(30) ) ) * numpy.uint64( 0xbf58476d1ce4e5b9 )
+    x = ( x ^ ( x >> numpy.uint64(27) ) ) * numpy.uint64( 0x94d049bb133111eb )
+    return x ^ ( x >> numpy.uint64(31) )
+
+
+def _cells( index, castle ):
+    # a random 64-bit value for every wall and castle cell, empty cells add nothing
+    return _mix( numpy.asarray( index, dtype=numpy.uint64 ) * numpy.uint64(2) + castle + numpy.uint64(1) )
+
+
+def zobrist( array ):
+    """Key of a maze that ``zobrist_edit`` can update when one cell changes
+
+    The XOR of a random value per wall and per castle, with the shape.
+    """
+    array = numpy.asarray( array )
+    flat = array.ravel()
+    h = numpy.bitwise_xor.reduce( _cells( numpy.flatnonzero( flat < 0 ), 0 ) )
+    h ^= numpy.bitwise_xor.reduce( _cells( numpy.flatnonzero( flat == 1 ), 1 ) )
+    return int( h ), array.shape
+
+
+def _kind( value ):
+    return 0 if value < 0 else 1 if value == 1 else None
+
+
+def zobrist_edit( key, row, column, old, new ):
+    """Key of the maze ``key`` was computed for, after a cell changed from ``old`` to ``new``"""
+    h, shape = key
+    index = row * shape[1] + column
+    for kind in ( _kind( old ), _kind( new ) ):
+        if kind is not None:
+            h ^= int( _cells( [ index ], kind )[0] )
+    return h, shape
+
+
+class Solution_memo:
+    def __init__(self, budget = 1 << 28):
+        """The last solved mazes in memory, up to ``budget`` bytes
+
+        Use it as ``maze_solver.analyze( array, cache = Solution_memo() )``,
+        with ``key`` to pass a key kept up to date by ``zobrist_edit``.
+        Solutions are copied in and out, so changing a returned solution by
+        ``update_cell`` leaves the stored one as it was.
+        ``hits`` and ``misses`` count the lookups.
+        """
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._solutions = collections.OrderedDict()
+
+    key = staticmethod( zobrist )
+
+    def __len__(self):
+        return len( self._solutions )
+
+    def get(self, key):
+        """Copies of the framed distances, directions and unreached count, or None"""
+        found = self._solutions.get( key )
+        if found is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._solutions.move_to_end( key )
+        distances, directions, unreached = found
+        return distances.copy(), directions.copy(), unreached
+
+    def put(self, key, distances, directions, unreached):
+        """Stores copies of a solution, then forgets the least recently used ones over the budget"""
+        size = distances.nbytes + directions.nbytes
+        if size > self.budget:
+            return
+        old = self._solutions.pop( key, None )
+        if old is not None:
+            self.size -= old[0].nbytes + old[1].nbytes
+        self._solutions[ key ] = ( numpy.array( distances ), numpy.array( directions ), unreached )
+        self.size += size
+        while self.size > self.budget:
+            _, ( distances, directions, _ ) = self._solutions.popitem( last = False )
+            self.size -= distances.nbytes + directions.nbytes
+
+    def clear(self):
+        self._solutions.clear()
+        self.size = 0
+
+
+class Solution_cache:
+    def __init__(self, path, budget = 1 << 30):
+        """Solutions of mazes in the folder ``path``, up to ``budget`` bytes
+
+        Use it as ``maze_solver.analyze( array, cache = Solution_cache( path ) )``.
+        Reading a solution touches its file, and when the folder grows over
+        the budget the least recently used files are removed. The folder can
+        be shared by several processes.
+        ``hits`` and ``misses`` count the lookups of this instance.
+        """
+        self.path = path
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        os.makedirs( path, exist_ok = True )
+
+    key = staticmethod( fingerprint )
+
+    def _file(self, key):
+        return os.path.join( self.path, key + SUFFIX )
+
+    def get(self, key):
+        """Framed distances, directions and unreached count, or None
+
+        The arrays are mapped copy-on-write: changes to them stay in memory.
+        """
+        path = self._file( key )
+        try:
+            with open( path, 'rb' ) as f:
+                magic, version, height, width, unreached = HEADER.unpack( f.read( HEADER.size ) )
+        except ( OSError, struct.error ):
+            magic = None
+        if magic != MAGIC or version != VERSION:
+            self.misses += 1
+            return None
+
+        shape = ( height + 2, width + 2 )
+        try:
+            distances = numpy.memmap( path, dtype=numpy.int32, mode='c', offset=HEADER.size, shape=shape )
+            directions = numpy.memmap( path, dtype=('a',1), mode='c',
+                                       offset=HEADER.size + distances.nbytes, shape=shape )
+            os.utime( path )
+        except ( OSError, ValueError ):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return distances, directions, unreached
+
+    def put(self, key, distances, directions, unreached):
+        """Stores a solution, then evicts the least recently used ones over the budget"""
+        size = HEADER.size + distances.nbytes + directions.nbytes
+        if size > self.budget:
+            return
+        height, width = distances.shape[0] - 2, distances.shape[1] - 2
+
+        # written aside and renamed, so that readers never see half a file
+        fd, temp = tempfile.mkstemp( dir = self.path, suffix = '.tmp' )
+        try:
+            with os.fdopen( fd, 'wb' ) as f:
+                f.write( HEADER.pack( MAGIC, VERSION, height, width, unreached ) )
+                numpy.ascontiguousarray( distances, dtype=numpy.int32 ).tofile( f )
+                numpy.ascontiguousarray( directions ).tofile( f )
+            os.replace( temp, self._file( key ) )
+        except BaseException:
+            os.remove( temp )
+            raise
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used solutions until they fit into the budget"""
+        entries = []
+        for entry in os.scandir( self.path ):
+            if entry.name.endswith( SUFFIX ):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append( ( stat.st_mtime, stat.st_size, entry.path ) )
+
+        total = sum( size for _, size, _ in entries )
+        for _, size, path in sorted( entries ):
+            if total <= self.budget: break
+            try:
+                os.remove( path )
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        for entry in os.scandir( self.path ):
+            if entry.name.endswith( SUFFIX ):
+                os.remove( entry.path )
@@ -36,9 +36,16 @@ import random
 import math
 import time
 from docutils.core import publish_parts
-from . import maze_generator, maze_solver, actor
+from . import maze_generator, maze_solver, actor, mazefile, cache, swarm
 
 CELL_SIZE = 32
+# cells per side of the tiles of the play-mode layer
+LAYER_TILE = 64
+# games with this many dudes are played by one Swarm on a timer,
+# instead of a coroutine per dude
+SWARM_DUDES = 100
+# milliseconds between the ticks of the Swarm
+SWARM_TICK = 16
 
 
 class image:
@@ -53,7 +60,7 @@ NUM_INDEX = {}
 
 for (item, num) in [ ('Grass',0), ('Wall',-1), ('Wall2',-2), ('Castle',1), ('Dude1',2), ('Dude2',3), ('Dude3',4), ('Dude4',5), ('Dude5',6) ]:
     IMG[ item ] = image( item, 'img/' + item.lower() + '.svg', num )
-    NUM_INDEX[ num ] = IMG[item].svg
+    NUM_INDEX[ num ] = IMG[item]
 
 LINES = {}
 for item in glob.glob('img/lines/*.svg'):
@@ -66,18 +73,32 @@ for item in glob.glob('img/arrows/*.svg'):
     ARROWS[ name ] = image( name, item)
 
 DIR_TO_NUM = {b'^':0,b'>':1,b'v':2,b'<':3}
+# paths_union bitmask -> name of the line image, e.g. 0b0101 -> '1010'
+LINE_NAMES = [ ''.join( str( (mask >> i) & 1 ) for i in range(4) ) for mask in range(16) ]
 
 VALUE_ROLE = QtCore.Qt.UserRole
 
 
 class GridWidget(QtWidgets.QWidget):
 
+    # a cache.Solution_cache, to map the solutions of reopened mazes instead of solving them
+    cache = None
+
     def __init__(self, array, gui):
 
         super().__init__()
         self.gui = gui
         self.cell_size = CELL_SIZE
         self.array = array
+        self._tiles = {}
+        # tiles of the play-mode layer, by their row and column of tiles
+        self._layers = {}
+        # recent solutions, by a key that follows the edits of the cells
+        self.memo = cache.Solution_memo()
+        self._key = None
+        self.swarm = None
+        self.timer = QtCore.QTimer( self )
+        self.timer.timeout.connect( self._tick )
         self.set_grid_size()
 
         self._solve()
@@ -106,39 +127,50 @@ class GridWidget(QtWidgets.QWidget):
 
 
     def _solve(self):
-        self.solved = maze_solver.analyze( self.array )
+        if self.cache is not None:
+            self.solved = maze_solver.analyze( self.array, cache = self.cache )
+        else:
+            if self._key is None:
+                self._key = self.memo.key( self.array )
+            self.solved = maze_solver.analyze( self.array, cache = self.memo, key = self._key )
         self.directions = self.solved.directions
 
-
-    def change_maze(self):
+    def _update_cell(self, point, value):
+        # repairs the solution in place, self.directions is a view of it
+        if self._key is not None:
+            self._key = cache.zobrist_edit( self._key, *point, self.array[point], value )
+        self.array[point] = value
+        changed = self.solved.update_cell( *point, value )
+        if self.swarm is not None:
+            self.swarm.update_cell( *point, value )
+        return changed
+
+
+    def _tile(self, img):
+        # each tile is rasterized once per zoom level, then only blitted
+        key = ( img.name, self.cell_size )
+        pixmap = self._tiles.get( key )
+        if pixmap is None:
+            pixmap = QtGui.QPixmap( self.cell_size, self.cell_size )
+            pixmap.fill( QtCore.Qt.transparent )
+            painter = QtGui.QPainter( pixmap )
+            img.svg.render( painter )
+            painter.end()
+            self._tiles[ key ] = pixmap
+        return pixmap
+
+    def change_maze(self, key = None):
+        # key of the new array, if known
+        self._key = key
+        self._layers.clear()
         self.set_grid_size()
         self._solve()
         self.update()
 
     def __get_paths(self):
 
-
-        paths = numpy.full( (*self.array.shape,4)  , b'0', dtype=('a',1))
-
         dudes = numpy.argwhere(self.array >= 2)
-
-        for dude in dudes:
-            try:
-                path = self.solved.path( *dude )
-            except ValueError:
-                continue
-
-            get_in = DIR_TO_NUM[ self.directions[ path[0] ] ]  #first p doesn't have in, use out instead
-
-            for p in path:
-                #if paths[ (*p) , get_in ] == b'1': break #optimization for too many dudes
-                paths[ (*p) , get_in ] = b'1'
-                if self.directions[p] == b'X': break
-                get_out = DIR_TO_NUM[ self.directions[p] ]
-                paths[ (*p) , get_out ] = b'1'
-                get_in = (get_out + 2 ) % 4   # 0->2, 1->3, 2->0, 3->1
-
-        return paths
+        return self.solved.paths_union( dudes )
 
     def update_actor( self, actor ):
 
@@ -150,36 +182,53 @@ class GridWidget(QtWidgets.QWidget):
 
         self.dudes = []
         self.futures = []
+        self._layers.clear()
         self.old_array = self.array.copy()
+        self.old_key = self._key
+        # the maze edited so far is what the end of the game goes back to
+        if self.cache is None:
+            self.solved.store( self.memo, self._key )
         self.last = (-1,-1) # (-1,-1) means no path for dude at the beginning of the game
 
+        if numpy.isin( self.array, list( actor.KINDS ) ).sum() >= SWARM_DUDES:
+            self.swarm = swarm.Swarm( self.array, solved = self.solved )
+            if not self.swarm.active.all():
+                self.no_path()
+                return
+            self.tick_time = time.monotonic()
+            self.timer.start( SWARM_TICK )
+            return
+
         row_size, col_size = self.array.shape
         for row in range(row_size):
             for column in range(col_size):
                 kind = self.array[row,column]
-                if kind >= 2:
+                #values above the kinds of dudes have no behavior, they stay put
+                if kind in actor.KINDS:
                     point = (row, column)
-                    if kind == 2:
-                        dude = actor.Right_hand_Actor(self, *point, self.array[row,column] )
-                    elif kind == 3:
-                        dude = actor.Confused_Actor(self, *point, self.array[row,column] )
-                    elif kind == 4:
-                        dude = actor.Fast_Actor(self, *point, self.array[row,column] )
-                    elif kind == 5:
-                        dude = actor.Accelerated_Actor(self, *point, self.array[row,column] )
-                    elif kind == 6:
-                        dude = actor.Teleported_Actor(self, *point, self.array[row,column] )
+                    dude = actor.KINDS[kind](self, *point, self.array[row,column] )
 
                     fut = asyncio.ensure_future( dude.behavior() )
                     self.futures.append(fut)
                     self.dudes.append( dude )
 
 
+    def _tick( self ):
+        # one step of the whole swarm, then a repaint of what is in view
+        now = time.monotonic()
+        self.swarm.tick( now - self.tick_time )
+        self.tick_time = now
+        self.update()
+        if not numpy.isnan( self.swarm.finish ).all():
+            self.end_game()
+
     def _end_game(self):
         for fut in self.futures:
             fut.cancel()
+        self.timer.stop()
+        self.swarm = None
         self.array = self.old_array.copy()
-        self.change_maze()
+        self.change_maze( self.old_key )
 
 
     def end_game( self , dialog_function = "final_time_dialog" ):
@@ -191,13 +240,86 @@ class GridWidget(QtWidgets.QWidget):
 
         self.end_game( "no_suitable_path_dialog" )
 
-    def _repaint_dudes( self, painter ):
+    def _repaint_dudes( self, painter, rect ):
+
+        if self.swarm is not None:
+            positions = self.swarm.positions * self.cell_size
+            inside = ( ( positions[:,1] + self.cell_size > rect.left() ) & ( positions[:,1] < rect.right() ) &
+                       ( positions[:,0] + self.cell_size > rect.top() ) & ( positions[:,0] < rect.bottom() ) )
+            for ( y, x ), kind in zip( positions[inside], self.swarm.kind[inside] ):
+                painter.drawPixmap( QtCore.QPointF(x, y), self._tile( IMG[ "Dude"+ str(kind - 1) ] ) )
+            return
 
         for dude in self.dudes:
             x, y = self._ltop(dude.row, dude.column)
-            rect = QtCore.QRectF(x, y, self.cell_size, self.cell_size )
-            IMG[ "Dude"+ str(dude.kind - 1) ].svg.render(painter,rect)
+            if rect.intersects( QtCore.QRectF(x, y, self.cell_size, self.cell_size ) ):
+                painter.drawPixmap( QtCore.QPointF(x, y), self._tile( IMG[ "Dude"+ str(dude.kind - 1) ] ) )
+
+    def _paint_cell( self, painter, row, column, paths = None ):
+
+        x, y = self._ltop(row, column)
+        painter.drawPixmap( x, y, self._tile( IMG['Grass'] ) )
 
+        if paths is not None:
+
+            if paths[row,column]:
+                painter.drawPixmap( x, y, self._tile( LINES[ LINE_NAMES[ paths[row,column] ] ] ) )
+                if self.directions[row,column] != b'X':
+                    painter.drawPixmap( x, y, self._tile( ARROWS[ str(DIR_TO_NUM[self.directions[row,column] ])  ] ) )
+
+            if self.array[row,column] != 0 :
+                painter.drawPixmap( x, y, self._tile( NUM_INDEX[self.array[row,column]] ) )
+        else:
+            if self.array[row,column] != 0 and self.array[row,column] < 2 :
+                painter.drawPixmap( x, y, self._tile( NUM_INDEX[self.array[row,column]] ) )
+
+    def _layer_tile( self, i, j ):
+        # grass, walls and castles of the play mode, composed offscreen
+        # a tile at a time, the first time the tile is shown
+        pixmap = self._layers.get( (i, j) )
+        if pixmap is None:
+            row_min, col_min = i * LAYER_TILE, j * LAYER_TILE
+            row_max = min( row_min + LAYER_TILE, self.array.shape[0] )
+            col_max = min( col_min + LAYER_TILE, self.array.shape[1] )
+            pixmap = QtGui.QPixmap( *self._ltop( row_max - row_min, col_max - col_min ) )
+            pixmap.fill( QtCore.Qt.transparent )
+            painter = QtGui.QPainter( pixmap )
+            x, y = self._ltop( row_min, col_min )
+            painter.translate( -x, -y )
+            for row in range(row_min, row_max):
+                for column in range(col_min, col_max):
+                    self._paint_cell( painter, row, column )
+            painter.end()
+            self._layers[ (i, j) ] = pixmap
+        return pixmap
+
+    def _paint_layer( self, painter, rect ):
+        # only the tiles under rect are drawn, and composed if needed
+        span = LAYER_TILE * self.cell_size
+        rows = -( -self.array.shape[0] // LAYER_TILE )
+        columns = -( -self.array.shape[1] // LAYER_TILE )
+        for i in range( max( rect.top(), 0 ) // span, min( rect.bottom() // span + 1, rows ) ):
+            for j in range( max( rect.left(), 0 ) // span, min( rect.right() // span + 1, columns ) ):
+                tile = self._layer_tile( i, j )
+                origin = QtCore.QPoint( j * span, i * span )
+                target = rect.intersected( QtCore.QRect( origin, tile.size() ) )
+                painter.drawPixmap( target, tile, target.translated( -origin ) )
+
+    def _redraw_cell( self, point ):
+
+        x, y = self._ltop(*point)
+        rect = QtCore.QRect(x, y, self.cell_size, self.cell_size )
+        i, j = point[0] // LAYER_TILE, point[1] // LAYER_TILE
+        # a tile not composed yet will be painted with the cell already changed
+        if (i, j) in self._layers:
+            painter = QtGui.QPainter( self._layers[ (i, j) ] )
+            painter.translate( *( -v for v in self._ltop( i * LAYER_TILE, j * LAYER_TILE ) ) )
+            painter.setCompositionMode( QtGui.QPainter.CompositionMode_Source )
+            painter.fillRect( rect, QtCore.Qt.transparent )
+            painter.setCompositionMode( QtGui.QPainter.CompositionMode_SourceOver )
+            self._paint_cell( painter, *point )
+            painter.end()
+        self.update( rect )
 
     def paintEvent(self, event):
 
@@ -205,6 +327,12 @@ class GridWidget(QtWidgets.QWidget):
         painter = QtGui.QPainter(self)  #we will paint
 
         rect = event.rect()
+
+        if self.play_mode:
+            self._paint_layer( painter, rect )
+            self._repaint_dudes( painter, QtCore.QRectF(rect) )
+            return
+
         row_min, col_min = self._ptol(rect.left(), rect.top())
         row_min = max(row_min, 0)
         col_min = max(col_min, 0)
@@ -212,42 +340,11 @@ class GridWidget(QtWidgets.QWidget):
         row_max = min(row_max + 1, self.array.shape[0])
         col_max = min(col_max + 1, self.array.shape[1])
 
-        row_size, col_size = self.array.shape
-
-        if not self.play_mode:
-            paths = self.__get_paths( )
-            paths_view = paths.view('S4')
-
+        paths = self.__get_paths( )
 
         for row in range(row_min, row_max):
             for column in range(col_min, col_max):
-                # získáme čtvereček, který budeme vybarvovat
-                x, y = self._ltop(row, column)
-                rect = QtCore.QRectF(x, y, self.cell_size, self.cell_size )
-
-                #color = QtGui.QColor(255, 255, 255)
-
-                # vyplníme čtvereček barvou
-                #painter.fillRect(rect, QtGui.QBrush(color))
-
-                #if self.play_mode:
-                IMG['Grass'].svg.render(painter,rect)
-
-                if not self.play_mode:
-
-                    if paths_view[row,column][0] != b'0000':
-                        LINES[ paths_view[row,column][0].decode("utf-8") ].svg.render(painter,rect)
-                        if self.directions[row,column] != b'X':
-                            ARROWS[ str(DIR_TO_NUM[self.directions[row,column] ])  ].svg.render(painter,rect)
-
-                    if self.array[row,column] != 0 :
-                        NUM_INDEX[self.array[row,column]].render(painter,rect)
-                else:
-                    if self.array[row,column] != 0 and self.array[row,column] < 2 :
-                        NUM_INDEX[self.array[row,column]].render(painter,rect)
-
-        if self.play_mode:
-            self._repaint_dudes(painter)
+                self._paint_cell( painter, row, column, paths )
 
 
     def wheelEvent(self, event):
@@ -255,6 +352,8 @@ class GridWidget(QtWidgets.QWidget):
         if event.modifiers() == QtCore.Qt.ControlModifier:
             degrees = event.angleDelta().y() / 8
             self.cell_size += round(self.cell_size*degrees/100)
+            self._tiles.clear()
+            self._layers.clear()
             event.accept()
         else:
             event.ignore()
@@ -264,23 +363,33 @@ class GridWidget(QtWidgets.QWidget):
 
     def can_put_wall(self, *point ):
         if self.array[point] < 0 or self.array[point] == 1: return
+        if self.swarm is not None:
+            positions = self.swarm.positions
+            cells = numpy.rint( positions ).astype( int )
+            if ( ( numpy.floor( positions ) <= point ).all( axis = 1 ) &
+                 ( numpy.ceil( positions ) >= point ).all( axis = 1 ) ).any(): return
+            old = self.array[point]
+            if self._update_cell( point, -1 ) and ( self.directions[ cells[:,0], cells[:,1] ] == b' ' ).any():
+                self._update_cell( point, old )
+                return
+            self._redraw_cell( point )
+            return
+
         for dude in self.dudes:
 
             for x in range ( int(math.floor(dude.row)), int(math.ceil(dude.row)) + 1 ):
                  for y in range ( int(math.floor(dude.column)), int(math.ceil(dude.column)) + 1 ):
                     if (x,y) == point: return
 
-        self.array[point] = -1
-        self._solve()
-
+        old = self.array[point]
 
-        for dude in self.dudes:
-            if self.directions[ int(round( dude.row )), int( round(dude.column)) ] == b' ':
-                self.array[point] = 0
-                self._solve()
-                return
+        if self._update_cell( point, -1 ):
+            for dude in self.dudes:
+                if self.directions[ int(round( dude.row )), int( round(dude.column)) ] == b' ':
+                    self._update_cell( point, old )
+                    return
 
-        self.update()
+        self._redraw_cell( point )
 
     def mousePressEvent(self, event):
 
@@ -292,13 +401,12 @@ class GridWidget(QtWidgets.QWidget):
 
             if not self.play_mode:
                 if event.button() == QtCore.Qt.LeftButton:
-                        self.array[row,column] = self.selected
+                        self._update_cell( (row,column), self.selected )
 
                 elif event.button() == QtCore.Qt.RightButton:
-                        self.array[row,column] = 0
+                        self._update_cell( (row,column), 0 )
 
-                #todo only if changed
-                self.change_maze()
+                self.update()
 
             else:
 
@@ -309,8 +417,8 @@ class GridWidget(QtWidgets.QWidget):
                 elif event.button() == QtCore.Qt.RightButton:
 
                     if self.array[row,column] == -1:
-                        self.array[row,column] = 0
-                        self.change_maze()
+                        self._update_cell( (row,column), 0 )
+                        self._redraw_cell( (row,column) )
                 else:
                     return
 
@@ -374,7 +482,7 @@ class Gui():
 
         path = dialog.selectedFiles()[0]
         try:
-            self.grid.array = numpy.loadtxt(path, dtype=numpy.int32)
+            self.grid.array = numpy.array( mazefile.load(path), dtype=numpy.int32 )
 
         except OSError as e:
             self._alert_dialog( True, 'Error', 'File not found!', str(e), QtWidgets.QMessageBox.Warning )
@@ -463,12 +571,12 @@ class Gui():
 
     def _save_dialog(self):
 
-        path, _ = QtWidgets.QFileDialog.getSaveFileName(self.window)
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self.window, filter='Mazes (*.maze);;All files (*)')
 
         if not path:
             return
         try:
-            numpy.savetxt(path, self.grid.array )
+            mazefile.save(path, self.grid.array )
         except BaseException as e:
             self._alert_dialog( True, 'Save Error', path , str(e), QtWidgets.QMessageBox.Warning )
             return
@@ -497,9 +605,7 @@ class Gui():
             self.grid.array = numpy.zeros((rows, cols), dtype=numpy.int32)
 
 
-        self.grid.set_grid_size()
-
-        self.grid.update() #TODO --when big resolution update only currently visible field
+        self.grid.change_maze() #TODO --when big resolution update only currently visible field
 
     def _add_item( self, palette, img ):
 
@@ -1,60 +1,483 @@
+# distutils: extra_compile_args = -fopenmp
+# distutils: extra_link_args = -fopenmp
 import numpy
 import random
 cimport numpy
 cimport cython
-import matplotlib.pyplot as pyplot
-from libc.stdlib cimport rand, srand
-from libc.time cimport time
+from cython.parallel cimport prange
+from libc.stdint cimport uint64_t
+from libc.stdlib cimport malloc, free
+
+
+cdef inline uint64_t _next( uint64_t* state ) nogil:
+    """splitmix64"""
+    state[0] += 0x9E3779B97F4A7C15ULL
+    cdef uint64_t z = state[0]
+    z = ( z ^ ( z >> 30 ) ) * 0xBF58476D1CE4E5B9ULL
+    z = ( z ^ ( z >> 27 ) ) * 0x94D049BB133111EBULL
+    return z ^ ( z >> 31 )
+
+
+@cython.cdivision(True)
+cdef void _carve( int* Z, int height, int width, int complexity, int density, uint64_t* state ) nogil:
+    """Walls of the frame and the aisles, into a zeroed height x width maze"""
+    cdef int i, j, k, n, x, y
+    cdef int nx[4]
+    cdef int ny[4]
+
+    if height < 1 or width < 1: return
+    for x in range( width ):
+        Z[x] = Z[ (height - 1) * width + x ] = -1
+    for y in range( height ):
+        Z[ y * width ] = Z[ y * width + width - 1 ] = -1
+    if height < 2 or width < 2: return
+
+    for i in range( density ):
+        x = _next( state ) % ( width // 2 ) * 2
+        y = _next( state ) % ( height // 2 ) * 2
+        Z[ y * width + x ] = -1
+        for j in range( complexity ):
+            n = 0
+            if x > 1:
+                nx[n] = x - 2; ny[n] = y; n += 1
+            if x < width - 2:
+                nx[n] = x + 2; ny[n] = y; n += 1
+            if y > 1:
+                nx[n] = x; ny[n] = y - 2; n += 1
+            if y < height - 2:
+                nx[n] = x; ny[n] = y + 2; n += 1
+            if n == 0: break
+            k = _next( state ) % ( n - 1 ) if n > 1 else 0
+            if Z[ ny[k] * width + nx[k] ] == 0:
+                Z[ ny[k] * width + nx[k] ] = -1
+                Z[ ( ny[k] + ( y - ny[k] ) // 2 ) * width + nx[k] + ( x - nx[k] ) // 2 ] = -1
+                x = nx[k]
+                y = ny[k]
+            else:
+                # the walk is stuck for good when no neighbour it can
+                # choose is free, the rest of the steps would do nothing
+                for k in range( n - 1 if n > 1 else 1 ):
+                    if Z[ ny[k] * width + nx[k] ] == 0: break
+                else:
+                    break
+
+
+@cython.cdivision(True)
+cdef bint _place_castle( int* Z, Py_ssize_t size, uint64_t* state ) nogil:
+    """Puts the castle on a random free cell, False if there is none"""
+    cdef Py_ssize_t i, free = 0
+    for i in range( size ):
+        if Z[i] == 0: free += 1
+    if free == 0: return False
+    free = _next( state ) % free
+    for i in range( size ):
+        if Z[i] == 0:
+            if free == 0:
+                Z[i] = 1
+                return True
+            free -= 1
+
+
+cdef inline void _walls( int* Z, Py_ssize_t size ) nogil:
+    cdef Py_ssize_t i
+    for i in range( size ):
+        Z[i] = -1
+
+
+cdef inline int _find( int* parent, int i ) nogil:
+    while parent[i] != i:
+        parent[i] = parent[ parent[i] ]
+        i = parent[i]
+    return i
+
+
+cdef inline void _link( int* parent, int a, int b ) nogil:
+    # cheaper than union by size and keeps the trees about as shallow
+    if a < b: parent[a] = b
+    else: parent[b] = a
+
+
+@cython.cdivision(True)
+cdef bint _kruskal( int* Z, int height, int width, uint64_t* state ) nogil:
+    """Perfect maze from the cell walls in random order, joining what
+    union-find does not see connected yet"""
+    cdef int rows = ( height - 1 ) // 2, cols = ( width - 1 ) // 2
+    cdef Py_ssize_t cells = <Py_ssize_t> rows * cols
+    cdef Py_ssize_t across = <Py_ssize_t> rows * ( cols - 1 ) if cols else 0
+    cdef Py_ssize_t edges = across + ( <Py_ssize_t> ( rows - 1 ) * cols if rows else 0 )
+    cdef Py_ssize_t i, j, e, r, c
+    cdef int a, b
+
+    _walls( Z, <Py_ssize_t> height * width )
+    if cells == 0: return True
+    cdef int* parent = <int*> malloc( cells * sizeof(int) )
+    cdef Py_ssize_t* order = <Py_ssize_t*> malloc( ( edges + 1 ) * sizeof(Py_ssize_t) )
+    if parent == NULL or order == NULL:
+        free( parent ); free( order )
+        return False
+
+    for i in range( cells ):
+        parent[i] = i
+        Z[ ( 2 * ( i // cols ) + 1 ) * width + 2 * ( i % cols ) + 1 ] = 0
+    for i in range( edges ):
+        order[i] = i
+    for i in range( edges - 1, 0, -1 ):
+        j = _next( state ) % ( i + 1 )
+        order[i], order[j] = order[j], order[i]
+
+    for i in range( edges ):
+        e = order[i]
+        if e < across:
+            r = e // ( cols - 1 ); c = e % ( cols - 1 )
+            a = _find( parent, r * cols + c ); b = _find( parent, r * cols + c + 1 )
+            if a != b:
+                _link( parent, a, b )
+                Z[ ( 2 * r + 1 ) * width + 2 * c + 2 ] = 0
+        else:
+            e -= across
+            r = e // cols; c = e % cols
+            a = _find( parent, r * cols + c ); b = _find( parent, ( r + 1 ) * cols + c )
+            if a != b:
+                _link( parent, a, b )
+                Z[ ( 2 * r + 2 ) * width + 2 * c + 1 ] = 0
+
+    free( parent ); free( order )
+    return True
+
+
+cdef struct Eller:
+    # sets of the cells of the current row, labels are below cols
+    int cols
+    int* label      # per column, -1 for a cell starting a new set
+    int* parent     # union-find over the labels
+    int* count      # cells of a set still to be decided in the row
+    int* fresh      # stack of the unused labels
+    int nfresh
+    char* down      # the set already goes to the next row
+
+
+cdef bint _eller_init( Eller* e, int cols ) nogil:
+    cdef int i
+    e.cols = cols
+    e.label = <int*> malloc( ( cols + 1 ) * sizeof(int) )
+    e.parent = <int*> malloc( ( cols + 1 ) * sizeof(int) )
+    e.count = <int*> malloc( ( cols + 1 ) * sizeof(int) )
+    e.fresh = <int*> malloc( ( cols + 1 ) * sizeof(int) )
+    e.down = <char*> malloc( cols + 1 )
+    if e.label == NULL or e.parent == NULL or e.count == NULL or e.fresh == NULL or e.down == NULL:
+        _eller_free( e )
+        return False
+    for i in range( cols ):
+        e.label[i] = -1
+        e.fresh[i] = cols - 1 - i
+        e.count[i] = 0
+    e.nfresh = cols
+    return True
+
+
+cdef void _eller_free( Eller* e ) nogil:
+    free( e.label ); free( e.parent ); free( e.count ); free( e.fresh ); free( e.down )
+    e.label = e.parent = e.count = e.fresh = NULL
+    e.down = NULL
+
+
+cdef void _eller_row( Eller* e, int* cells, int* below, bint last, uint64_t* state ) nogil:
+    """Opens the cells of one row of cells and the passages to the next
+
+    ``cells`` and ``below`` are the maze rows of the cells and of the walls
+    under them, already filled with walls.
+    """
+    cdef int c, a, b, l, cols = e.cols
+    for c in range( cols ):
+        if e.label[c] < 0:
+            e.nfresh -= 1
+            e.label[c] = e.fresh[ e.nfresh ]
+        e.parent[ e.label[c] ] = e.label[c]
+        cells[ 2 * c + 1 ] = 0
+
+    for c in range( cols - 1 ):
+        a = _find( e.parent, e.label[c] )
+        b = _find( e.parent, e.label[c + 1] )
+        if a != b and ( last or _next( state ) & 1 ):
+            e.parent[b] = a
+            cells[ 2 * c + 2 ] = 0
+    for c in range( cols ):
+        e.label[c] = _find( e.parent, e.label[c] )
+    if last: return
+
+    for c in range( cols ):
+        e.count[ e.label[c] ] += 1
+        e.down[ e.label[c] ] = 0
+    for c in range( cols ):
+        l = e.label[c]
+        e.count[l] -= 1
+        # every set goes down at least once
+        if _next( state ) & 1 or ( e.count[l] == 0 and not e.down[l] ):
+            e.down[l] = 1
+            below[ 2 * c + 1 ] = 0
+        else:
+            e.label[c] = -1
+
+    # count is all zeros again, borrow it to mark the labels in use
+    for c in range( cols ):
+        if e.label[c] >= 0: e.count[ e.label[c] ] = 1
+    e.nfresh = 0
+    for l in range( cols ):
+        if e.count[l] == 0:
+            e.fresh[ e.nfresh ] = l
+            e.nfresh += 1
+        e.count[l] = 0
+
+
+cdef bint _eller( int* Z, int height, int width, uint64_t* state ) nogil:
+    """Perfect maze one row at a time, keeping only the sets of one row"""
+    cdef int rows = ( height - 1 ) // 2, cols = ( width - 1 ) // 2, r
+    cdef Eller e
+    _walls( Z, <Py_ssize_t> height * width )
+    if rows == 0 or cols == 0: return True
+    if not _eller_init( &e, cols ): return False
+    for r in range( rows ):
+        _eller_row( &e, Z + <Py_ssize_t> ( 2 * r + 1 ) * width, Z + <Py_ssize_t> ( 2 * r + 2 ) * width,
+                    r == rows - 1, state )
+    _eller_free( &e )
+    return True
+
+
+@cython.cdivision(True)
+cdef Py_ssize_t _eller_castle( int height, int width, uint64_t* state ) nogil:
+    """Random cell of the maze of _eller, -1 if there is none"""
+    cdef int rows = ( height - 1 ) // 2, cols = ( width - 1 ) // 2, r, c
+    if rows == 0 or cols == 0: return -1
+    r = _next( state ) % rows
+    c = _next( state ) % cols
+    return <Py_ssize_t> ( 2 * r + 1 ) * width + 2 * c + 1
 
-@cython.wraparound(False)
-@cython.boundscheck(False)
-def generate_maze(width=81, height=51, _complexity=.75, _density=.75):
 
-    srand(time(NULL))
+cdef class _Eller_stream:
+    """State of _eller between blocks of rows"""
+
+    cdef Eller e
+    cdef uint64_t state
+    cdef int height, width, rows
+    cdef Py_ssize_t castle
+    cdef int[::1] below     # walls under the last row of cells
+
+    def __cinit__( self, int width, int height, seed ):
+        self.width = width
+        self.height = height
+        self.rows = ( height - 1 ) // 2
+        self.state = seed & 0xFFFFFFFFFFFFFFFF
+        self.castle = _eller_castle( height, width, &self.state )
+        if self.castle < 0:
+            raise IndexError( 'no free cell for the castle' )
+        if not _eller_init( &self.e, ( width - 1 ) // 2 ):
+            raise MemoryError()
+        self.below = numpy.full( width, -1, dtype=numpy.intc )
+
+    def __dealloc__( self ):
+        _eller_free( &self.e )
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    def fill( self, int[:, ::1] block, int start ):
+        """Rows start, start + 1, ... of the maze into block"""
+        cdef int g, i, r, c
+        cdef int* row
+        with nogil:
+            for i in range( block.shape[0] ):
+                g = start + i
+                row = &block[i, 0]
+                for c in range( self.width ):
+                    row[c] = -1
+                if g % 2 == 1 and ( g - 1 ) // 2 < self.rows:
+                    r = ( g - 1 ) // 2
+                    for c in range( self.width ):
+                        self.below[c] = -1
+                    _eller_row( &self.e, row, &self.below[0], r == self.rows - 1, &self.state )
+                    if self.castle // self.width == g:
+                        row[ self.castle % self.width ] = 1
+                elif g > 0 and g % 2 == 0 and ( g - 2 ) // 2 < self.rows:
+                    for c in range( self.width ):
+                        row[c] = self.below[c]
+
+
+def generate_rows(width=81, height=51, seed=None, block=1024):
+    """The maze of ``generate_maze(width, height, seed=seed, method='eller')``
+    as arrays of up to ``block`` rows, from the top
+
+    Only the sets of one row of cells are kept between the blocks, so the
+    memory used depends on the width and the block, not on the height.
+    """
+    if seed is None:
+        seed = random.getrandbits( 64 )
+    stream = _Eller_stream( width, height, seed )
+    for start in range( 0, height, block ):
+        rows = numpy.empty( ( min( block, height - start ), width ), dtype=numpy.int32 )
+        stream.fill( rows, start )
+        yield rows
+
+
+@cython.cdivision(True)
+cdef bint _wilson( int* Z, int height, int width, uint64_t* state ) nogil:
+    """Uniform spanning tree by loop-erased random walks"""
+    cdef int rows = ( height - 1 ) // 2, cols = ( width - 1 ) // 2
+    cdef Py_ssize_t cells = <Py_ssize_t> rows * cols
+    cdef Py_ssize_t i, u, v
+    cdef int d, r, c
+    cdef int dr[4]
+    cdef int dc[4]
+    dr[0] = 1; dr[1] = 0; dr[2] = -1; dr[3] = 0
+    dc[0] = 0; dc[1] = 1; dc[2] = 0; dc[3] = -1
+
+    _walls( Z, <Py_ssize_t> height * width )
+    if cells == 0: return True
+    cdef char* step = <char*> malloc( cells )   # last exit of the walk, -1 in the tree
+    if step == NULL: return False
+    for i in range( cells ):
+        step[i] = 0
+    step[ _next( state ) % cells ] = -1
+
+    for i in range( cells ):
+        # random walk until the tree, remembering only the last exit
+        u = i
+        while step[u] != -1:
+            r = u // cols; c = u % cols
+            while True:
+                d = _next( state ) & 3
+                if 0 <= r + dr[d] < rows and 0 <= c + dc[d] < cols: break
+            step[u] = d
+            u = ( r + dr[d] ) * cols + c + dc[d]
+        # the walk without its loops joins the tree
+        u = i
+        while step[u] != -1:
+            r = u // cols; c = u % cols; d = step[u]
+            Z[ ( 2 * r + 1 ) * width + 2 * c + 1 ] = 0
+            Z[ ( 2 * r + 1 + dr[d] ) * width + 2 * c + 1 + dc[d] ] = 0
+            step[u] = -1
+            u = ( r + dr[d] ) * cols + c + dc[d]
+        Z[ ( 2 * ( u // cols ) + 1 ) * width + 2 * ( u % cols ) + 1 ] = 0
+
+    free( step )
+    return True
+
+
+METHODS = ( 'walk', 'kruskal', 'eller', 'wilson' )
+
+
+cdef int _build( int* Z, int height, int width, int method, int complexity, int density, uint64_t* state ) nogil:
+    """Maze of the method into the zeroed Z; 1 when out of memory, 2 without a free cell"""
+    cdef Py_ssize_t castle
+    if method == 0:
+        _carve( Z, height, width, complexity, density, state )
+    elif method == 1:
+        if not _kruskal( Z, height, width, state ): return 1
+    elif method == 2:
+        # the castle is chosen first, as generate_rows has to
+        castle = _eller_castle( height, width, state )
+        if castle < 0: return 2
+        if not _eller( Z, height, width, state ): return 1
+        Z[castle] = 1
+        return 0
+    else:
+        if not _wilson( Z, height, width, state ): return 1
+    if not _place_castle( Z, <Py_ssize_t> height * width, state ): return 2
+    return 0
+
+
+cdef int _method( method ) except -1:
+    if method not in METHODS:
+        raise ValueError( 'unknown method {!r}, expected one of {}'.format( method, METHODS ) )
+    return METHODS.index( method )
+
+
+cdef _raise( int status ):
+    if status == 1:
+        raise MemoryError()
+    if status == 2:
+        raise IndexError( 'no free cell for the castle' )
+
+
+cdef _sizes( width, height, _complexity, _density ):
+    if width < 1 or height < 1:
+        raise ValueError( 'a maze is at least 1x1, not {}x{}'.format( width, height ) )
     # Only odd shapes
-    origin_shape = (height, width)
     shape = ((height // 2) * 2 + 1, (width // 2) * 2 + 1)  #can be bigger then original but it doesn't matter
     # Adjust complexity and density relative to maze size
-    cdef int complexity = int(_complexity * (5 * (shape[0] + shape[1])))
-    cdef int density    = int(_density * ((shape[0] // 2) * (shape[1] // 2)))
-
-    if complexity > 607: compexity = 607
-    if density > 1200: density = 1200
-
-    # Build actual maze
-    cpdef numpy.ndarray[numpy.int32_t, ndim=2] Z = numpy.full( origin_shape, 0, dtype=numpy.int32 )
-    # Fill borders
-    Z[0, :] = Z[-1, :] = -1
-    Z[:, 0] = Z[:, -1] = -1
-
-    cdef int i,j, x, y, x_, y_
-
-    # Make aisles
-    for i in range(density):
-        x = rand()%( shape[1] // 2) * 2
-        y = rand()%(shape[0] // 2) * 2
-        Z[y, x] = -1
-        for j in range(complexity):
-            neighbours = []
-            if x > 1:             neighbours.append((y, x - 2))
-            if x < shape[1] - 2:  neighbours.append((y, x + 2))
-            if y > 1:             neighbours.append((y - 2, x))
-            if y < shape[0] - 2:  neighbours.append((y + 2, x))
-            if len(neighbours):
-                y_,x_ = neighbours[rand()%( len(neighbours) - 1)]
-                if Z[y_, x_] == 0:
-                    Z[y_, x_] = -1
-                    Z[ y_ + (y - y_) // 2,x_ + (x - x_) // 2 ] = -1
-                    x = x_
-                    y = y_
-
-    # Make start point
-    #x, y = random.randint(0, shape[1] // 2) * 2, random.randint(0, shape[0] // 2) * 2
-    x, y = random.choice( numpy.column_stack(numpy.where(Z == 0)) )
-    Z[x,y] = 1
+    return ( int(_complexity * (5 * (shape[0] + shape[1]))),
+             int(_density * ((shape[0] // 2) * (shape[1] // 2))) )
+
+
+def generate_maze(width=81, height=51, _complexity=.75, _density=.75, seed=None, method='walk'):
+    """Random maze of walls (-1) with one castle (1)
+
+    The same ``seed`` gives the same maze, by default it is taken from
+    the ``random`` module.
+
+    ``method`` is one of ``METHODS``: ``'walk'`` carves random walks of
+    the given complexity and density, the others make perfect mazes
+    (every two free cells joined by exactly one path) in linear time,
+    with union-find (``'kruskal'``), row by row (``'eller'``) or as
+    a uniform spanning tree (``'wilson'``).
+    """
+    if seed is None:
+        seed = random.getrandbits( 64 )
+    cdef uint64_t state = seed & 0xFFFFFFFFFFFFFFFF
+    cdef int complexity, density
+    complexity, density = _sizes( width, height, _complexity, _density )
+    cdef int kind = _method( method )
+
+    cdef numpy.ndarray[numpy.int32_t, ndim=2] Z = numpy.zeros( (height, width), dtype=numpy.int32 )
+    cdef int* data = <int*> Z.data
+    cdef int h = height, w = width
+    cdef int status
+    with nogil:
+        status = _build( data, h, w, kind, complexity, density, &state )
+    _raise( status )
 
     return Z
 
+@cython.wraparound(False)
+@cython.boundscheck(False)
+def generate_many(n, width=81, height=51, seed=None, workers=1, out=None, _complexity=.75, _density=.75, method='walk'):
+    """Stack of ``n`` mazes like ``generate_maze``, of the shape (n, height, width)
+
+    The mazes are carved in ``workers`` threads. Maze i depends only on
+    ``seed`` and i, so the stack is the same for any number of workers.
+    ``out`` is an optional C-contiguous int32 array of that shape to fill.
+    """
+    if seed is None:
+        seed = random.getrandbits( 64 )
+    cdef uint64_t base = seed & 0xFFFFFFFFFFFFFFFF
+    cdef int complexity, density
+    complexity, density = _sizes( width, height, _complexity, _density )
+    cdef int kind = _method( method )
+
+    if out is None:
+        out = numpy.zeros( (n, height, width), dtype=numpy.int32 )
+    # checked before clearing, so that a wrong array is left as it was
+    elif ( not isinstance( out, numpy.ndarray ) or out.shape != (n, height, width)
+           or out.dtype != numpy.int32 or not out.flags.c_contiguous ):
+        raise ValueError( 'out must be a C-contiguous int32 array of the shape {}'.format( (n, height, width) ) )
+    else:
+        out[...] = 0
+    cdef numpy.ndarray[numpy.int32_t, ndim=3, mode='c'] Z = out
+
+    cdef int* data = <int*> Z.data
+    cdef int h = height, w = width, threads = workers
+    cdef Py_ssize_t i, count = n, size = <Py_ssize_t> h * w
+    cdef uint64_t state
+    cdef int[::1] status = numpy.zeros( n, dtype=numpy.intc )
+
+    for i in prange( count, nogil=True, num_threads=threads, schedule='dynamic' ):
+        # an independent stream per maze, not the stream of maze 0 shifted
+        state = base + <uint64_t> i * 0x9E3779B97F4A7C15ULL
+        state = _next( &state )
+        status[i] = _build( data + i * size, h, w, kind, complexity, density, &state )
+
+    if count:
+        _raise( numpy.asarray( status ).max() )
+    return out
+
 def remove_frame( array ):
     return array[1:-1,1:-1]
 
@@ -64,11 +487,28 @@ def val_to_rand( val ):
     if val < 0: return - random.randint(1,10)
     if val >=0: return random.randint(2,10)
 
-def randomize( array ):
-    f = numpy.vectorize( val_to_rand )
-    return f( array )
+def randomize( array, rng = None ):
+    """Gives the cells random kinds of walls and dudes, like ``val_to_rand``
+
+    ``rng`` is a ``numpy.random.Generator`` or a seed, by default it is
+    seeded from the ``random`` module.
+    """
+    if rng is None:
+        rng = random.getrandbits( 64 )
+    rng = numpy.random.default_rng( rng )
+    array = numpy.asarray( array )
+
+    # one draw per cell: below 90 the cell is kept (1/3), the rest is
+    # split evenly among the 10 walls and the 9 dudes
+    r = rng.integers( 0, 270, size=array.shape, dtype=numpy.int16 )
+    keep = ( r < 90 ) | ( array == 1 )
+    r -= 90
+    out = numpy.where( array < 0, -1 - r % 10, 2 + r % 9 ).astype( array.dtype, copy=False )
+    numpy.copyto( out, array, where=keep )
+    return out
 
 def print_maze( Z ):
+    import matplotlib.pyplot as pyplot
     pyplot.figure(figsize=(10, 5))
     pyplot.imshow( -Z, cmap=pyplot.cm.binary, interpolation='nearest')
     pyplot.xticks([]), pyplot.yticks([])
@@ -1,148 +1,2822 @@
-import queue
+# distutils: extra_compile_args = -fopenmp
+# distutils: extra_link_args = -fopenmp
 import numpy
 cimport numpy
 cimport cython
 from maze import maze_generator
 from cpython.mem cimport PyMem_Malloc, PyMem_Realloc, PyMem_Free
+from libc.stdlib cimport qsort, malloc, calloc, realloc, free, abs
+from libc.string cimport memset
+from libc.limits cimport INT_MAX
+from libc.stdio cimport FILE, tmpfile, fwrite, fread, fseek, fclose, SEEK_SET
+from cython.parallel cimport prange
 
 cdef struct coords:
     int x
     int y
 
+cdef struct dist_coords:
+    int dist
+    int x
+    int y
+
+#growable queue of (x, y) pairs
+cdef struct cell_queue:
+    int * data
+    Py_ssize_t size
+    Py_ssize_t capacity
+
+cdef enum:
+    WALL = 0
+    FREE = 1
+    CASTLE = 2
+
+cdef int _push( cell_queue * q, int x, int y ) except -1:
+
+    cdef int * data
+    if q.size == q.capacity:
+        q.capacity = max( 16, q.capacity * 2 )
+        data = <int *>PyMem_Realloc( q.data, (q.capacity * 2) * sizeof(int) )
+        if data == NULL: raise MemoryError()
+        q.data = data
+
+    q.data[ q.size * 2 ] = x
+    q.data[ q.size * 2 + 1 ] = y
+    q.size += 1
+    return 0
+
+cdef int _kind( int value ):
+    if value < 0: return WALL
+    if value == 1: return CASTLE
+    return FREE
+
+cdef inline int _dir_kind( char ch ):
+    if ch == b'#': return WALL
+    if ch == b'X': return CASTLE
+    return FREE
+
+cdef inline int _dir_rank( char ch ):
+    """Order in which the BFS discovers a cell from its parent."""
+    if ch == b'v': return 0
+    if ch == b'^': return 1
+    if ch == b'>': return 2
+    return 3
+
+cdef inline coords _parent( char ch, int x, int y ):
+    if ch == b'v': return coords(x+1, y)
+    if ch == b'^': return coords(x-1, y)
+    if ch == b'>': return coords(x, y+1)
+    return coords(x, y-1)
+
+cdef int _cmp_dist( const void * a, const void * b ) nogil:
+    return (<dist_coords *>a).dist - (<dist_coords *>b).dist
+
+cdef extern from *:
+    """
+    static inline void maze_atomic_min( int * p, int v ) {
+        int old = __atomic_load_n( p, __ATOMIC_RELAXED );
+        while ( v < old && !__atomic_compare_exchange_n( p, &old, v, 1, __ATOMIC_RELAXED, __ATOMIC_RELAXED ) );
+    }
+    """
+    void maze_atomic_min( int * p, int v ) nogil
+
+#direction stored in a cell discovered from its k-th neighbour
+cdef char * DIRECTION_CHARS = b'v^><'
+
+#line leaving a cell in a direction from DIRECTION_CHARS: 0 up, 1 right, 2 down, 3 left
+cdef int[4] LINE_BITS = [ 2, 0, 1, 3 ]
+
+#frontiers smaller than this are expanded by one thread
+DEF PARALLEL_FRONTIER = 4096
+
+
+@cython.wraparound(False)
+@cython.boundscheck(False)
+cdef inline int _neighbour( int c, int k, int sx, int sy ) nogil:
+    """Flat index of the k-th neighbour in the BFS order (up, down, left, right), -1 outside"""
+    cdef int x = c // sy
+    cdef int y = c - x * sy
+    if k == 0: return c - sy if x > 0 else -1
+    if k == 1: return c + sy if x < sx - 1 else -1
+    if k == 2: return c - 1 if y > 0 else -1
+    return c + 1 if y < sy - 1 else -1
+
+
+ctypedef unsigned short ushort
+
+ctypedef fused dist_t:
+    int
+    ushort
+    unsigned int
+
+#uint16 keeps 65535 for no path and 65534 for cells being updated
+DEF OVERFLOW_DISTANCE = 65533
+#returned by the BFS when a distance does not fit into uint16
+DEF OVERFLOW = -2
+
+
+@cython.wraparound(False)
+@cython.boundscheck(False)
+cdef void _init_directions( const int * a, char * dirs, Py_ssize_t n ) nogil:
+    """Mark walls, empty cells and castles of the maze in the directions array."""
+    cdef Py_ssize_t i
+    for i in range(n):
+        if a[i] < 0: dirs[i] = b'#'
+        elif a[i] == 1: dirs[i] = b'X'
+        else: dirs[i] = b' '
+
+
+@cython.wraparound(False)
+@cython.boundscheck(False)
+cdef int _init_starts( dist_t * dist, const char * dirs, int * q, int n ) nogil:
+    """Reset the distances and queue the castles. Returns the number of castles."""
+    cdef int i, size = 0
+
+    for i in range(n):
+        if dirs[i] == b'X':
+            dist[i] = 0
+            q[size] = i
+            size += 1
+        else:
+            dist[i] = <dist_t>-1
+
+    return size
+
+
+@cython.wraparound(False)
+@cython.boundscheck(False)
+cdef Py_ssize_t _bfs( dist_t * dist, char * dirs, int * q, int sx, int sy ) nogil:
+    """Multi-source BFS from the castles, q needs room for sx*sy cells.
+
+    ``dirs`` comes prepared by ``_init_directions``, the distances of cells
+    without a path are -1 (the largest value of an unsigned type).
+    Returns the number of empty cells without a path to a castle.
+    """
+    cdef int n = sx * sy
+    cdef int i, k, c, v
+    cdef int head = 0, tail
+    cdef Py_ssize_t walkable = 0
+
+    tail = _init_starts( dist, dirs, q, n )
+    for i in range(n):
+        if dirs[i] != b'#': walkable += 1
+
+    while head < tail:
+        c = q[head]
+        head += 1
+        if dist_t is ushort and dist[c] >= OVERFLOW_DISTANCE:
+            return OVERFLOW
+        for k in range(4):
+            v = _neighbour( c, k, sx, sy )
+            if v >= 0 and dirs[v] == b' ':
+                dirs[v] = DIRECTION_CHARS[k]
+                dist[v] = dist[c] + 1
+                q[tail] = v
+                tail += 1
+
+    return walkable - tail
+
+
+cdef void _free_all( int * a, int * b, int * c, int * d ) nogil:
+    free(a)
+    free(b)
+    free(c)
+    free(d)
+
+
+@cython.wraparound(False)
+@cython.boundscheck(False)
+cdef Py_ssize_t _bfs_parallel( dist_t * dist, char * dirs, int sx, int sy, int threads ) nogil except -1:
+    """Level-synchronous BFS expanding big frontiers with OpenMP threads.
+
+    Every undiscovered cell is claimed by its first neighbour in the serial
+    queue order (an atomic minimum of position*4 + k), the owners then copy
+    their cells to the next frontier at offsets given by a prefix sum.
+    Distances, directions and queue order are the same as in ``_bfs``.
+    """
+    cdef int n = sx * sy
+    cdef int * q = <int *>malloc( n * sizeof(int) )
+    cdef int * nq = <int *>malloc( n * sizeof(int) )
+    cdef int * claim = <int *>malloc( n * sizeof(int) )
+    cdef int * offset = <int *>malloc( n * sizeof(int) )
+    cdef int * tmp
+    cdef int size, total, i, j, k, c, v, o, time = 0
+    cdef Py_ssize_t walkable = 0, reached
+
+    if q == NULL or nq == NULL or claim == NULL or offset == NULL:
+        _free_all( q, nq, claim, offset )
+        with gil: raise MemoryError()
+
+    size = _init_starts( dist, dirs, q, n )
+    reached = size
+    for i in prange( n, num_threads=threads, schedule='static' ):
+        claim[i] = INT_MAX
+        if dirs[i] != b'#': walkable += 1
+    while size:
+        time += 1
+        if dist_t is ushort and time > OVERFLOW_DISTANCE:
+            _free_all( q, nq, claim, offset )
+            return OVERFLOW
+
+        if size < PARALLEL_FRONTIER:
+            total = 0
+            for i in range(size):
+                c = q[i]
+                for k in range(4):
+                    v = _neighbour( c, k, sx, sy )
+                    if v >= 0 and dirs[v] == b' ':
+                        dirs[v] = DIRECTION_CHARS[k]
+                        dist[v] = <dist_t>time
+                        nq[total] = v
+                        total += 1
+        else:
+            for i in prange( size, num_threads=threads, schedule='static' ):
+                for k in range(4):
+                    v = _neighbour( q[i], k, sx, sy )
+                    if v >= 0 and dirs[v] == b' ':
+                        maze_atomic_min( &claim[v], i*4 + k )
+
+            for i in prange( size, num_threads=threads, schedule='static' ):
+                offset[i] = 0
+                for k in range(4):
+                    v = _neighbour( q[i], k, sx, sy )
+                    if v >= 0 and dirs[v] == b' ' and claim[v] == i*4 + k:
+                        offset[i] += 1
+
+            total = 0
+            for i in range(size):
+                o = offset[i]
+                offset[i] = total
+                total = total + o
+
+            for i in prange( size, num_threads=threads, schedule='static' ):
+                o = offset[i]
+                for k in range(4):
+                    v = _neighbour( q[i], k, sx, sy )
+                    if v >= 0 and dirs[v] == b' ' and claim[v] == i*4 + k:
+                        nq[o] = v
+                        o = o + 1
+
+            for j in prange( total, num_threads=threads, schedule='static' ):
+                v = nq[j]
+                dirs[v] = DIRECTION_CHARS[ claim[v] & 3 ]
+                dist[v] = <dist_t>time
+
+        tmp = q
+        q = nq
+        nq = tmp
+        size = total
+        reached += total
+
+    _free_all( q, nq, claim, offset )
+    return walkable - reached
+
+
+cdef Py_ssize_t _solve( dist_t * dist, char * dirs, int sx, int sy, int threads ) except -1:
+    """Run the serial or the threaded BFS, returns the number of unreached cells or OVERFLOW."""
+    cdef Py_ssize_t unreached
+    cdef int * q
+
+    if threads > 1 and sx * sy < INT_MAX // 4:
+        with nogil:
+            unreached = _bfs_parallel( dist, dirs, sx, sy, threads )
+        return unreached
+
+    q = <int *>PyMem_Malloc( max( sx*sy, 1 ) * sizeof(int) )
+    if q == NULL: raise MemoryError()
+    with nogil:
+        unreached = _bfs( dist, dirs, q, sx, sy )
+    PyMem_Free(q)
+    return unreached
+
+
+#weighted mazes keep a bucket for every distance within the largest cost
+DEF MAX_COST = 1 << 24
+
+
+@cython.wraparound(False)
+@cython.boundscheck(False)
+cdef Py_ssize_t _dial( int * dist, char * dirs, const int * cost, int sx, int sy, int max_cost ) nogil except -1:
+    """Multi-source Dijkstra from the castles over a circular bucket queue (Dial).
+
+    Stepping onto an empty cell costs ``cost`` of the cell, at least 1. The
+    buckets are FIFO lists linked through the cells, so with unit costs the
+    cells are settled in the order of ``_bfs`` and get the same directions.
+    Returns the number of empty cells without a path, or -2 if a distance
+    does not fit into int32.
+    """
+    cdef int n = sx * sy
+    cdef int nb = max_cost + 1
+    cdef int * nxt = <int *>malloc( max( n, 1 ) * sizeof(int) )
+    cdef int * prv = <int *>malloc( max( n, 1 ) * sizeof(int) )
+    cdef int * head = <int *>malloc( nb * sizeof(int) )
+    cdef int * tail = <int *>malloc( nb * sizeof(int) )
+    cdef int i, k, c, v, b
+    cdef long long d = 0, nd
+    cdef Py_ssize_t queued = 0, walkable = 0, settled = 0
+
+    if nxt == NULL or prv == NULL or head == NULL or tail == NULL:
+        _free_all( nxt, prv, head, tail )
+        with gil: raise MemoryError()
+
+    for b in range(nb):
+        head[b] = tail[b] = -1
+
+    #castles start in the bucket of 0, in row-major order
+    for i in range(n):
+        dist[i] = -1
+        if dirs[i] == b'#': continue
+        walkable += 1
+        if dirs[i] == b'X':
+            dist[i] = 0
+            nxt[i] = -1
+            prv[i] = tail[0]
+            if tail[0] >= 0: nxt[ tail[0] ] = i
+            else: head[0] = i
+            tail[0] = i
+            queued += 1
+        else:
+            dirs[i] = b' '
+
+    while queued:
+        b = d % nb
+        c = head[b]
+        if c < 0:
+            d += 1
+            continue
+        head[b] = nxt[c]
+        if head[b] >= 0: prv[ head[b] ] = -1
+        else: tail[b] = -1
+        queued -= 1
+        settled += 1
+
+        for k in range(4):
+            v = _neighbour( c, k, sx, sy )
+            if v < 0 or dirs[v] == b'#' or dirs[v] == b'X': continue
+            nd = d + cost[v]
+            if dist[v] >= 0 and nd >= dist[v]: continue
+            if nd > INT_MAX:
+                _free_all( nxt, prv, head, tail )
+                return OVERFLOW
+
+            if dist[v] >= 0:
+                #still queued, a settled cell is not farther than d
+                b = dist[v] % nb
+                if prv[v] >= 0: nxt[ prv[v] ] = nxt[v]
+                else: head[b] = nxt[v]
+                if nxt[v] >= 0: prv[ nxt[v] ] = prv[v]
+                else: tail[b] = prv[v]
+            else:
+                queued += 1
+
+            dist[v] = <int>nd
+            dirs[v] = DIRECTION_CHARS[k]
+            b = nd % nb
+            nxt[v] = -1
+            prv[v] = tail[b]
+            if tail[b] >= 0: nxt[ tail[b] ] = v
+            else: head[b] = v
+            tail[b] = v
+
+    _free_all( nxt, prv, head, tail )
+    return walkable - settled
+
+
 cdef class Solved_maze:
 
 
     cdef readonly char [:,:] _directions
-    cdef readonly int [:,:] _distances
-    cdef readonly int [:,:] __a
+    cdef readonly object _distances
     cdef readonly bint is_reachable
 
+    #framed _distances and _directions, kept for update_cell
+    cdef object __dist_array
+    cdef void * __dist
+    cdef int __dist_size
+    cdef Py_ssize_t __row
+    cdef Py_ssize_t __walkable #empty cells, counted for compact distances only
+    cdef char [:,:] __dirs
+    cdef unsigned char [:,:] __mark
+    #packed directions, used instead of __dirs until they are needed
+    cdef unsigned char [::1] __packed
+    cdef object __empty
+    cdef Py_ssize_t __unreached
+    #framed int32 step costs of a weighted maze, None for BFS solutions
+    cdef object __costs
+
     @property
     def directions(self):
+        if self.__dirs is None:
+            self.__unpack()
         return numpy.asarray( self._directions )
 
     @property
     def distances(self):
-        return numpy.asarray( self._distances )
+        return self._distances
 
 
-    def __init__(self, array):
+    def __init__(self, array, threads = 1, bint compact = False, bint packed = False, bint weighted = False):
 
+        array = numpy.asarray( array )
         sx, sy = array.shape
-        #create frame
-        self.__a = numpy.full( (sx+2, sy+2), -1, dtype=numpy.int32 )
 
-        #copy data
-        numpy.asarray(self.__a)[1:-1,1:-1] = array
+        #the directions double as the maze: walls, castles and empty cells
+        framed = numpy.full( (sx+2, sy+2), b'#', dtype=('a',1) )
+        inner = framed[1:-1,1:-1]
+        inner[ array >= 0 ] = b' '
+        inner[ array == 1 ] = b'X'
 
-        start_points = numpy.argwhere(  numpy.asarray(self.__a) == 1 )
-        #start_points = numpy.asarray(self.__a)[ numpy.asarray(self.__a) == 1 ]
+        #uint16 is tried first, it fits unless some path is longer than 65533 steps
+        self.__walkable = numpy.count_nonzero( inner != b'#' ) if compact else 0
+        cdef char [:,::1] dirs = framed
 
-        sx = self.__a.shape[0]
-        sy = self.__a.shape[1]
+        self.__costs = None
+        if weighted:
+            if compact:
+                raise ValueError('Weighted distances are not compact.')
+            self.__costs = numpy.ones( (sx+2, sy+2), dtype=numpy.int32 )
+            if array.size and array.max() > MAX_COST:
+                raise ValueError('Step costs are limited to {}.'.format( MAX_COST ))
+            self.__costs[1:-1,1:-1] = numpy.maximum( array, 1 )
+            self.__solve_weighted( dirs )
+        elif not compact:
+            self.__solve( numpy.int32, dirs, threads )
+        elif self.__solve( numpy.uint16, dirs, threads ) == OVERFLOW:
+            framed[ ( framed != b'#' ) & ( framed != b'X' ) ] = b' '
+            self.__solve( numpy.uint32, dirs, threads )
 
-        #init matrices
-        self._distances  = numpy.full( (sx,sy), -1, dtype=numpy.int32 )
-        self._directions = numpy.full( (sx,sy), b'#', dtype=('a',1))
-        #set blank spaces
+        #destroy frame
+        self.__dirs = dirs
+        self._distances = self.__dist_array[1:-1,1:-1]
+        self._directions = dirs[1:-1,1:-1]
 
-        numpy.asarray(self._directions)[ numpy.asarray(self.__a) >= 0  ] = b' ';
+        self.__mark = None
+        self.__packed = None
+        self.is_reachable = self.__unreached == 0
+        if packed:
+            self.__pack()
 
-        self.__bfs( start_points , sx, sy)
+    cdef tuple _framed( self ):
+        """Framed distances, directions and the unreached count, as the cache stores them"""
+        if self.__dirs is None:
+            self.__unpack()
+        return self.__dist_array, numpy.asarray( self.__dirs ), self.__unreached
 
-        #destroy frame
-        self._distances = self._distances[1:-1,1:-1]
-        self._directions = self._directions[1:-1,1:-1]
+    def store( self, cache, key ):
+        """Put the solution into ``cache`` under ``key``, e.g. a key kept by
+        ``cache.zobrist_edit`` through ``update_cell``s, so that ``analyze``
+        of the changed maze with that key is a hit"""
+        if self.__costs is not None or self.__dist_array.dtype != numpy.int32:
+            raise ValueError('The cache keeps plain solutions, not compact, packed or weighted ones.')
+        cache.put( key, *self._framed() )
+
+    cdef Solved_maze _cached( self, dist_array, dirs_array, Py_ssize_t unreached ):
+        """Back a new instance by framed int32 distances and directions, e.g. mapped from the cache"""
+        cdef int [:,::1] dist = dist_array
+        cdef char [:,::1] dirs = dirs_array
+
+        self.__dist_array = dist_array
+        self.__dist = &dist[0,0]
+        self.__dist_size = 4
+        self.__row = dist.shape[1]
+        self.__walkable = 0
+        self.__dirs = dirs
+        self.__mark = None
+        self.__packed = None
+        self.__unreached = unreached
+        self._distances = dist_array[1:-1,1:-1]
+        self._directions = dirs[1:-1,1:-1]
+        self.is_reachable = unreached == 0
+        return self
+
+    cdef Py_ssize_t __solve( self, dtype, char [:,::1] dirs, int threads ) except -1:
+        """Allocate framed distances of the given dtype and run the BFS"""
+        cdef int fx = dirs.shape[0], fy = dirs.shape[1]
+        cdef int [:,::1] dist32
+        cdef unsigned short [:,::1] dist16
+        cdef unsigned int [:,::1] distu32
+
+        self.__dist_array = numpy.empty( (fx,fy), dtype=dtype )
+        self.__dist_size = self.__dist_array.dtype.itemsize
+        self.__row = fy
+
+        if dtype == numpy.int32:
+            dist32 = self.__dist_array
+            self.__dist = &dist32[0,0]
+            self.__unreached = _solve( &dist32[0,0], &dirs[0,0], fx, fy, threads )
+        elif dtype == numpy.uint16:
+            dist16 = self.__dist_array
+            self.__dist = &dist16[0,0]
+            self.__unreached = _solve( &dist16[0,0], &dirs[0,0], fx, fy, threads )
+        else:
+            distu32 = self.__dist_array
+            self.__dist = &distu32[0,0]
+            self.__unreached = _solve( &distu32[0,0], &dirs[0,0], fx, fy, threads )
+
+        return self.__unreached
+
+    cdef __solve_weighted( self, char [:,::1] dirs ):
+        """Allocate framed int32 distances and run the bucket-queue Dijkstra"""
+        cdef int [:,::1] dist
+        cdef const int [:,::1] cost = self.__costs
+        cdef int max_cost = max( self.__costs.max(), 1 )
+        cdef Py_ssize_t unreached
+
+        self.__dist_array = numpy.empty( ( dirs.shape[0], dirs.shape[1] ), dtype=numpy.int32 )
+        self.__dist_size = 4
+        self.__row = dirs.shape[1]
+        dist = self.__dist_array
+        self.__dist = &dist[0,0]
+
+        with nogil:
+            unreached = _dial( &dist[0,0], &dirs[0,0], &cost[0,0], dirs.shape[0], dirs.shape[1], max_cost )
+        if unreached == OVERFLOW:
+            raise OverflowError('A weighted distance does not fit into int32.')
+        self.__unreached = unreached
+
+    cdef bint __update_weighted( self, int x, int y, value ) except -1:
+        """Set the cost of (x, y) and solve the weighted maze again"""
+        before = self.__dist_array >= 0
+        kind = _kind( value )
+        if kind == WALL: self.__dirs[x,y] = b'#'
+        elif kind == CASTLE: self.__dirs[x,y] = b'X'
+        else: self.__dirs[x,y] = b' '
+        if value > MAX_COST:
+            raise ValueError('Step costs are limited to {}.'.format( MAX_COST ))
+        self.__costs[x,y] = max( value, 1 )
+
+        self.__solve_weighted( numpy.asarray( self.__dirs ) )
+        self._distances = self.__dist_array[1:-1,1:-1]
+        self.is_reachable = self.__unreached == 0
+
+        after = self.__dist_array >= 0
+        before[x,y] = after[x,y]
+        return bool( ( before != after ).any() )
+
+    cdef __widen( self ):
+        """Switch compact uint16 distances to uint32 when the maze grows too big for them"""
+        cdef unsigned int [:,::1] dist
+        wide = self.__dist_array.astype( numpy.uint32 )
+        wide[ self.__dist_array == 65535 ] = 0xFFFFFFFF
+        dist = wide
+        self.__dist_array = wide
+        self.__dist = &dist[0,0]
+        self.__dist_size = 4
+        self._distances = wide[1:-1,1:-1]
+
+    cdef inline int __getd( self, int x, int y ):
+        """Distance of a framed cell, -1 without a path and -2 while updating"""
+        cdef Py_ssize_t i = x * self.__row + y
+        cdef unsigned short v
+        if self.__dist_size == 2:
+            v = (<unsigned short *>self.__dist)[i]
+            return v - 65536 if v >= 65534 else v
+        return (<int *>self.__dist)[i]
+
+    cdef inline void __setd( self, int x, int y, int d ):
+        cdef Py_ssize_t i = x * self.__row + y
+        if self.__dist_size == 2:
+            (<unsigned short *>self.__dist)[i] = <unsigned short>d
+        else:
+            (<int *>self.__dist)[i] = d
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef inline int __code( self, int x, int y ):
+        """Direction of a reached framed cell as an index to DIRECTION_CHARS"""
+        cdef Py_ssize_t i
+        if self.__packed is None:
+            return _dir_rank( self.__dirs[x,y] )
+        i = (x-1) * (self.__row-2) + (y-1)
+        return ( self.__packed[ i >> 2 ] >> ( (i & 3) * 2 ) ) & 3
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef __pack( self ):
+        """Keep the directions as 2 bits per cell and a bitmap of empty cells"""
+        cdef Py_ssize_t sx = self.__dirs.shape[0] - 2, sy = self.__dirs.shape[1] - 2
+        cdef Py_ssize_t x, y, i
+        cdef char ch
+        cdef unsigned char [::1] bits = numpy.zeros( (sx*sy + 3) // 4, dtype=numpy.uint8 )
+
+        for x in range(sx):
+            for y in range(sy):
+                ch = self.__dirs[x+1,y+1]
+                if ch != b'#' and ch != b' ' and ch != b'X':
+                    i = x*sy + y
+                    bits[ i >> 2 ] |= _dir_rank(ch) << ( (i & 3) * 2 )
+
+        self.__empty = numpy.packbits( numpy.asarray( self._directions ) != b'#' )
+        self.__packed = bits
+        self.__dirs = None
+        self._directions = None
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef __unpack( self ):
+        """Decode the packed directions back to the byte array"""
+        cdef Py_ssize_t sx = self._distances.shape[0], sy = self._distances.shape[1]
+        cdef Py_ssize_t x, y
+        cdef int d
+        cdef unsigned char [:,::1] empty = numpy.unpackbits( self.__empty, count=sx*sy ).reshape( sx, sy )
+        cdef char [:,::1] dirs = numpy.full( (sx+2, sy+2), b'#', dtype=('a',1) )
 
-        #print( numpy.asarray(self.__a)[ numpy.asarray(self.__a) >= 0 ] )
+        for x in range(sx):
+            for y in range(sy):
+                if not empty[x,y]: continue
+                d = self.__getd( x+1, y+1 )
+                if d < 0: dirs[x+1,y+1] = b' '
+                elif d == 0: dirs[x+1,y+1] = b'X'
+                else: dirs[x+1,y+1] = DIRECTION_CHARS[ self.__code( x+1, y+1 ) ]
 
-        self.is_reachable =  len( numpy.asarray(self.__a)[ numpy.asarray(self.__a) >= 0 ] ) == 0
+        self.__dirs = dirs
+        self._directions = dirs[1:-1,1:-1]
+        self.__packed = None
+        self.__empty = None
 
     @cython.wraparound(False)
     @cython.boundscheck(False)
-    cdef int __update_queue( self, int size, int * q, int x , int y, char ch, int time ):
+    def path_array(self, _x, _y ):
+        """Path from the cell to its castle as an (L, 2) int32 array of rows and columns"""
+        sx, sy = self._distances.shape[0], self._distances.shape[1]
+        if not ( 0 <= _x < sx and 0 <= _y < sy ):
+            raise IndexError('The cell is out of the maze.')
 
-        if self.__a[x,y] >= 0:
-            q[ size * 2 ] = x
-            q[ size * 2 + 1 ] = y
+        cdef int x = _x + 1, y = _y + 1
+        cdef int d = self.__getd( x, y )
+        cdef int i, k
+        if d < 0: raise ValueError('The path doesn\'t exists.')
 
-            self._directions[ x,y ] = ch
-            self._distances[ x,y ] = time
-            self.__a[ x,y ] = -1
-            return size + 1
+        ret = numpy.empty( (d+1, 2), dtype=numpy.int32 )
+        cdef int [:,::1] out = ret
+
+        for i in range(d+1):
+            out[i,0] = x - 1
+            out[i,1] = y - 1
+            k = self.__code( x, y )
+            if k == 0: x += 1
+            elif k == 1: x -= 1
+            elif k == 2: y += 1
+            else: y -= 1
+
+        return ret
+
+    def path(self, _x, _y ):
+        return [ tuple(p) for p in self.path_array( _x, _y ).tolist() ]
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    def paths_union(self, sources):
+        """Union of the paths from all the sources to the castles
+
+        ``sources`` are (row, column) pairs, e.g. from ``numpy.argwhere``.
+        Returns an uint8 array where bits 0-3 mark the path leaving a cell
+        up, right, down and left (the order of the ``img/lines`` names).
+        The first cell of a path gets its outgoing line as the incoming one.
+        A path stops where it joins one that is already marked.
+        """
+        cdef int [:,::1] src = numpy.ascontiguousarray( sources, dtype=numpy.int32 ).reshape( -1, 2 )
+        cdef int sx = self._distances.shape[0], sy = self._distances.shape[1]
+        cdef Py_ssize_t i
+        cdef int x, y, k, line_in, line_out
+        cdef unsigned char seen
+
+        ret = numpy.zeros( (sx, sy), dtype=numpy.uint8 )
+        cdef unsigned char [:,::1] lines = ret
+
+        for i in range( src.shape[0] ):
+            x = src[i,0]
+            y = src[i,1]
+            if not ( 0 <= x < sx and 0 <= y < sy ):
+                raise IndexError('The cell is out of the maze.')
+            x += 1
+            y += 1
+            if self.__getd( x, y ) <= 0: continue
+
+            line_in = LINE_BITS[ self.__code( x, y ) ]
+            while True:
+                seen = lines[x-1,y-1]
+                lines[x-1,y-1] |= 1 << line_in
+                if seen or self.__getd( x, y ) == 0: break
+
+                k = self.__code( x, y )
+                line_out = LINE_BITS[k]
+                lines[x-1,y-1] |= 1 << line_out
+                line_in = ( line_out + 2 ) & 3
+
+                if k == 0: x += 1
+                elif k == 1: x -= 1
+                elif k == 2: y += 1
+                else: y -= 1
+
+        return ret
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef int __compare( self, int ax, int ay, int bx, int by ):
+        """Compare the BFS visiting order of two cells with the same distance.
+
+        The BFS visits a level in the lexicographic order of the shortest
+        paths (start point in row-major order, then the discovery order of
+        every step), so both paths are followed back until they meet.
+        """
+        cdef char da, db
+        cdef coords pa, pb
+
+        while True:
+            da = self.__dirs[ax,ay]
+            db = self.__dirs[bx,by]
+            if da == b'X':
+                if ax != bx: return ax - bx
+                return ay - by
+
+            pa = _parent( da, ax, ay )
+            pb = _parent( db, bx, by )
+            if pa.x == pb.x and pa.y == pb.y:
+                return _dir_rank(da) - _dir_rank(db)
+
+            ax, ay = pa.x, pa.y
+            bx, by = pb.x, pb.y
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef char __best_parent( self, int x, int y ):
+        """Direction the BFS would assign to (x, y), given its distance."""
+        cdef int d = self.__getd( x, y ) - 1
+        cdef char best = 0
+        cdef int bx = 0, by = 0
+
+        if self.__getd( x+1, y ) == d:
+            best, bx, by = b'v', x+1, y
+        if self.__getd( x-1, y ) == d and ( best == 0 or self.__compare( x-1, y, bx, by ) < 0 ):
+            best, bx, by = b'^', x-1, y
+        if self.__getd( x, y+1 ) == d and ( best == 0 or self.__compare( x, y+1, bx, by ) < 0 ):
+            best, bx, by = b'>', x, y+1
+        if self.__getd( x, y-1 ) == d and ( best == 0 or self.__compare( x, y-1, bx, by ) < 0 ):
+            best, bx, by = b'<', x, y-1
+
+        return best
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef bint __remove( self, int x, int y, bint wall ) except -1:
+        """Repair the solution after (x, y) stopped being a castle or became a wall.
+
+        Only cells whose shortest path went through (x, y) can change, so
+        that subtree is cleared and refilled from its reached border.
+        """
+        cdef cell_queue tree, border, cur, nxt, tmp
+        cdef dist_coords * b = NULL
+        cdef Py_ssize_t i, bi = 0
+        cdef int cx, cy, nx, ny, k, L
+        cdef coords p
+        cdef bint changed = False
+
+        if self.__dirs[x,y] == b' ':
+            if wall:
+                self.__dirs[x,y] = b'#'
+                self.__unreached -= 1
+            return False
+
+        tree.data = border.data = cur.data = nxt.data = NULL
+        tree.size = border.size = cur.size = nxt.size = 0
+        tree.capacity = border.capacity = cur.capacity = nxt.capacity = 0
+
+        try:
+            #collect the subtree, -2 marks cells waiting for a new distance
+            _push( &tree, x, y )
+            self.__setd( x, y, -2 )
+            i = 0
+            while i < tree.size:
+                cx = tree.data[ i*2 ]
+                cy = tree.data[ i*2 + 1 ]
+                i += 1
+                for k in range(4):
+                    nx, ny = cx, cy
+                    if k == 0: nx = cx - 1
+                    elif k == 1: nx = cx + 1
+                    elif k == 2: ny = cy - 1
+                    else: ny = cy + 1
+                    if self.__getd( nx, ny ) <= 0: continue
+                    p = _parent( self.__dirs[nx,ny], nx, ny )
+                    if p.x == cx and p.y == cy:
+                        self.__setd( nx, ny, -2 )
+                        _push( &tree, nx, ny )
+
+            for i in range( tree.size ):
+                self.__dirs[ tree.data[ i*2 ], tree.data[ i*2 + 1 ] ] = b' '
+            if wall:
+                self.__dirs[x,y] = b'#'
+                self.__setd( x, y, -1 )
+
+            #reached cells around the subtree, sorted by distance
+            for i in range( tree.size ):
+                cx = tree.data[ i*2 ]
+                cy = tree.data[ i*2 + 1 ]
+                if self.__getd( cx-1, cy ) >= 0: _push( &border, cx-1, cy )
+                if self.__getd( cx+1, cy ) >= 0: _push( &border, cx+1, cy )
+                if self.__getd( cx, cy-1 ) >= 0: _push( &border, cx, cy-1 )
+                if self.__getd( cx, cy+1 ) >= 0: _push( &border, cx, cy+1 )
+
+            b = <dist_coords *>PyMem_Malloc( max( border.size, 1 ) * sizeof(dist_coords) )
+            if b == NULL: raise MemoryError()
+            for i in range( border.size ):
+                cx = border.data[ i*2 ]
+                cy = border.data[ i*2 + 1 ]
+                b[i] = dist_coords( self.__getd( cx, cy ), cx, cy )
+            qsort( b, border.size, sizeof(dist_coords), _cmp_dist )
+
+            #BFS over the subtree, the border joins at its own distance
+            L = b[0].dist if border.size else 0
+            while True:
+                while bi < border.size and b[bi].dist == L:
+                    _push( &cur, b[bi].x, b[bi].y )
+                    bi += 1
+                if cur.size == 0:
+                    if bi == border.size: break
+                    L = b[bi].dist
+                    continue
+
+                nxt.size = 0
+                for i in range( cur.size ):
+                    cx = cur.data[ i*2 ]
+                    cy = cur.data[ i*2 + 1 ]
+                    for k in range(4):
+                        nx, ny = cx, cy
+                        if k == 0: nx = cx - 1
+                        elif k == 1: nx = cx + 1
+                        elif k == 2: ny = cy - 1
+                        else: ny = cy + 1
+                        if self.__getd( nx, ny ) == -2:
+                            self.__setd( nx, ny, L + 1 )
+                            _push( &nxt, nx, ny )
+
+                for i in range( nxt.size ):
+                    cx = nxt.data[ i*2 ]
+                    cy = nxt.data[ i*2 + 1 ]
+                    self.__dirs[cx,cy] = self.__best_parent( cx, cy )
+
+                tmp = cur
+                cur = nxt
+                nxt = tmp
+                cur.size, nxt.size = cur.size, 0
+                L += 1
+
+            for i in range( tree.size ):
+                cx = tree.data[ i*2 ]
+                cy = tree.data[ i*2 + 1 ]
+                if self.__getd( cx, cy ) == -2:
+                    self.__setd( cx, cy, -1 )
+                    self.__unreached += 1
+                    if cx != x or cy != y: changed = True
+
+        finally:
+            PyMem_Free( b )
+            PyMem_Free( tree.data )
+            PyMem_Free( border.data )
+            PyMem_Free( cur.data )
+            PyMem_Free( nxt.data )
+
+        return changed
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef bint __insert( self, int x, int y, bint castle ) except -1:
+        """Repair the solution after (x, y) became a castle or stopped being a wall.
+
+        Distances can only shrink and paths only get earlier in the BFS
+        order, so the change is spread level by level from (x, y) and
+        stops where nothing improves.
+        """
+        cdef cell_queue cur, nxt, tmp
+        cdef Py_ssize_t i
+        cdef int cx, cy, nx, ny, k, L, d
+        cdef char ch
+        cdef coords p
+        cdef bint changed = False
+
+        if castle:
+            if self.__dirs[x,y] == b' ': self.__unreached -= 1
+            self.__setd( x, y, 0 )
+            self.__dirs[x,y] = b'X'
         else:
-            return size
+            self.__dirs[x,y] = b' '
+            self.__setd( x, y, -1 )
+            d = -1
+            for k in range(4):
+                nx, ny = x, y
+                if k == 0: nx = x - 1
+                elif k == 1: nx = x + 1
+                elif k == 2: ny = y - 1
+                else: ny = y + 1
+                if self.__getd( nx, ny ) >= 0 and ( d == -1 or self.__getd( nx, ny ) < d ):
+                    d = self.__getd( nx, ny )
+            if d == -1:
+                self.__unreached += 1
+                return False
+            self.__setd( x, y, d + 1 )
+            self.__dirs[x,y] = self.__best_parent( x, y )
+
+        if self.__mark is None:
+            self.__mark = numpy.zeros( ( self.__dirs.shape[0], self.__dirs.shape[1] ), dtype=numpy.uint8 )
+
+        cur.data = nxt.data = NULL
+        cur.size = nxt.size = 0
+        cur.capacity = nxt.capacity = 0
+
+        try:
+            _push( &cur, x, y )
+            L = self.__getd( x, y )
+            while cur.size:
+                for i in range( cur.size ):
+                    self.__mark[ cur.data[ i*2 ], cur.data[ i*2 + 1 ] ] = 0
+
+                for i in range( cur.size ):
+                    cx = cur.data[ i*2 ]
+                    cy = cur.data[ i*2 + 1 ]
+                    for k in range(4):
+                        nx, ny = cx, cy
+                        if k == 0: nx, ch = cx - 1, b'v'
+                        elif k == 1: nx, ch = cx + 1, b'^'
+                        elif k == 2: ny, ch = cy - 1, b'>'
+                        else: ny, ch = cy + 1, b'<'
+
+                        if self.__dirs[nx,ny] == b'#': continue
+
+                        if self.__getd( nx, ny ) == -1 or self.__getd( nx, ny ) > L + 1:
+                            if self.__getd( nx, ny ) == -1:
+                                self.__unreached -= 1
+                                changed = True
+                            self.__setd( nx, ny, L + 1 )
+                            self.__dirs[nx,ny] = ch
+                        elif self.__getd( nx, ny ) == L + 1:
+                            p = _parent( self.__dirs[nx,ny], nx, ny )
+                            if p.x != cx or p.y != cy:
+                                if self.__compare( cx, cy, p.x, p.y ) > 0: continue
+                                self.__dirs[nx,ny] = ch
+                        else:
+                            continue
+
+                        if not self.__mark[nx,ny]:
+                            self.__mark[nx,ny] = 1
+                            _push( &nxt, nx, ny )
+
+                tmp = cur
+                cur = nxt
+                nxt = tmp
+                nxt.size = 0
+                L += 1
+
+        finally:
+            PyMem_Free( cur.data )
+            PyMem_Free( nxt.data )
+
+        return changed
+
+    def update_cell( self, row, column, value ):
+        """Change one cell of the maze and repair the solution in place.
+
+        Only the region whose shortest paths go through the cell is solved
+        again, the result is identical to a fresh ``analyze()`` of the
+        changed maze. A weighted maze is solved again as a whole.
+
+        Returns True if any other cell gained or lost its path to a castle.
+        """
+        sx, sy = self._distances.shape[0], self._distances.shape[1]
+        if not ( 0 <= row < sx and 0 <= column < sy ):
+            raise IndexError('The cell is out of the maze.')
+
+        if self.__dirs is None:
+            self.__unpack()
+        if self.__costs is not None:
+            return self.__update_weighted( row + 1, column + 1, value )
+
+        cdef int x = row + 1, y = column + 1
+        cdef int old = _dir_kind( self.__dirs[x,y] ), new = _kind( value )
+        cdef bint changed = False
+
+        if old == new:
+            return False
+
+        if old == WALL: self.__walkable += 1
+        if new == WALL: self.__walkable -= 1
+        if self.__dist_size == 2 and self.__walkable >= 65535:
+            self.__widen()
+
+        if old == CASTLE or new == WALL:
+            changed = self.__remove( x, y, new == WALL )
+        if new == CASTLE or ( old == WALL and new == FREE ):
+            changed = self.__insert( x, y, new == CASTLE )
+
+        self.is_reachable = self.__unreached == 0
+        return changed
+
+def analyze(array, threads = 1, compact = False, packed = False, cache = None, key = None, weighted = False,
+            out = None, budget = 1 << 26):
+    """Solve the maze
+
+    With threads > 1 big BFS levels are expanded in parallel. With compact
+    the distances are stored as uint16 (if the longest path fits) or uint32
+    and the cells without a path get the largest value of the type instead
+    of -1. With packed the directions are kept in 2 bits per cell and
+    decoded on the first use of ``directions`` or ``update_cell``.
+
+    With a ``cache.Solution_cache`` a maze solved before is not solved
+    again, its solution is mapped from the cache file copy-on-write; with
+    a ``cache.Solution_memo`` it is copied from memory. ``key`` is the key
+    of the maze in the cache if already known, ``cache.key( array )`` by
+    default. The caches keep the plain int32 solutions only.
+
+    With weighted the empty cells and dudes are terrain: stepping onto a
+    cell costs its value, at least 1, and the distances are the sums of the
+    costs, found by a bucket-queue Dijkstra in one thread. A maze of walls,
+    empty cells and castles gets the same solution as without weighted.
+
+    With ``out = ( distances, directions )``, int32 and 'S1' arrays of the
+    shape of the maze such as writable ``numpy.memmap``s, the solution is
+    written into them by ``analyze_into`` with about ``budget`` bytes of
+    memory, for mazes larger than the memory. It then returns a
+    ``Solved_mapped`` holding the two arrays, as a ``Solved_maze`` needs a
+    framed copy in memory for its paths and updates.
+    """
+    if out is not None:
+        if threads != 1 or compact or packed or cache is not None or weighted:
+            raise ValueError('Solutions written to out are plain ones, in one thread and not cached.')
+        distances, directions = out
+        return Solved_mapped( distances, directions, analyze_into( array, distances, directions, budget ) )
+    if cache is None:
+        return Solved_maze( array, threads, compact, packed, weighted )
+    if compact or packed or weighted:
+        raise ValueError('The cache keeps plain solutions, not compact, packed or weighted ones.')
+
+    array = numpy.asarray( array )
+    if key is None:
+        key = cache.key( array )
+    hit = cache.get( key )
+    if hit is not None:
+        dist, dirs, unreached = hit
+        return ( <Solved_maze>Solved_maze.__new__( Solved_maze ) )._cached( dist, dirs, unreached )
+
+    solved = Solved_maze( array, threads )
+    cache.put( key, *solved._framed() )
+    return solved
+
+
+cdef class Solved_batch:
+    """Solutions of a stack of same-shaped mazes
+
+    ``distances`` and ``directions`` have the shape (N, H, W) and hold the
+    same values as ``Solved_maze`` for every maze, ``is_reachable`` is
+    a boolean array of length N.
+    """
+
+    cdef readonly object distances
+    cdef readonly object directions
+    cdef readonly object is_reachable
 
     @cython.wraparound(False)
     @cython.boundscheck(False)
-    cdef __bfs( self, starts, int sx, int sy ):
+    def __init__(self, stack):
+
+        stack = numpy.ascontiguousarray( stack, dtype=numpy.int32 )
+        if stack.ndim != 3:
+            raise ValueError('Expected a stack of 2-D mazes.')
 
-        cdef int ** q = <int **>PyMem_Malloc( (2) *sizeof(int * ))
-        q[0] = <int *>PyMem_Malloc( (sx*sy) *sizeof(int))
-        q[1] = <int *>PyMem_Malloc( (sx*sy) *sizeof(int))
-        cdef int time = 0
-        cdef int p0 = 0, p1 = 0
+        cdef int n = stack.shape[0], sx = stack.shape[1], sy = stack.shape[2]
         cdef int i
-        cdef int[2] size
-        size[0] = size[1] = 0
-        cdef int x,y
+        cdef const int [:,:,::1] a = stack
 
-        for s in starts:
-            x,y = s
-            size[0] = self.__update_queue(size[0], q[0], x, y, b'X',0 )
+        self.distances = numpy.empty( (n,sx,sy), dtype=numpy.int32 )
+        self.directions = numpy.empty( (n,sx,sy), dtype=('a',1) )
+        self.is_reachable = numpy.empty( n, dtype=numpy.bool_ )
 
-        while True:
+        cdef int [:,:,::1] dist = self.distances
+        cdef char [:,:,::1] dirs = self.directions.view(numpy.int8)
+        cdef numpy.npy_bool [::1] reachable = self.is_reachable.view(numpy.uint8)
+
+        if n == 0 or sx * sy == 0:
+            self.is_reachable[:] = True
+            return
+
+        #one queue shared by all the mazes
+        cdef int * q = <int *>PyMem_Malloc( (sx*sy) * sizeof(int) )
+        if q == NULL: raise MemoryError()
+
+        try:
+            with nogil:
+                for i in range(n):
+                    _init_directions( &a[i,0,0], &dirs[i,0,0], sx*sy )
+                    reachable[i] = _bfs( &dist[i,0,0], &dirs[i,0,0], q, sx, sy ) == 0
+        finally:
+            PyMem_Free(q)
+
+def analyze_batch(stack):
+    """Solve a 3-D array (N, H, W) or a list of same-shaped mazes at once"""
+    return Solved_batch( stack )
+
+#FIFO of cell indices keeping at most two buffers in memory, the rest
+#goes to a temporary file between them
+cdef struct spill_queue:
+    Py_ssize_t * head
+    Py_ssize_t * tail
+    Py_ssize_t head_pos
+    Py_ssize_t head_size
+    Py_ssize_t tail_size
+    Py_ssize_t capacity
+    FILE * f
+    Py_ssize_t read
+    Py_ssize_t written
+    bint error
 
-            time += 1
-            p1 = time & 1
-            p0 = p1 ^ 1
-            size[p1] = 0
-            if size[p0] == 0: break
 
-            for i in range( size[p0] ):
-                x = q[p0][ i*2 ]
-                y = q[p0][ i*2 + 1 ]
+cdef inline void _spill_push( spill_queue * q, Py_ssize_t v ) nogil:
+    q.tail[ q.tail_size ] = v
+    q.tail_size += 1
+    if q.tail_size < q.capacity: return
+    if q.f == NULL:
+        q.f = tmpfile()
+        if q.f == NULL:
+            q.error = True
+            q.tail_size = 0
+            return
+    fseek( q.f, q.written * sizeof(Py_ssize_t), SEEK_SET )
+    if <Py_ssize_t>fwrite( q.tail, sizeof(Py_ssize_t), q.capacity, q.f ) != q.capacity:
+        q.error = True
+    q.written += q.capacity
+    q.tail_size = 0
+
+
+cdef inline bint _spill_pop( spill_queue * q, Py_ssize_t * v ) nogil:
+    cdef Py_ssize_t * swap
+    if q.head_pos == q.head_size:
+        if q.read < q.written:
+            fseek( q.f, q.read * sizeof(Py_ssize_t), SEEK_SET )
+            q.head_size = min( q.capacity, q.written - q.read )
+            if <Py_ssize_t>fread( q.head, sizeof(Py_ssize_t), q.head_size, q.f ) != q.head_size:
+                q.error = True
+            q.read += q.head_size
+            if q.read == q.written:
+                q.read = q.written = 0
+        elif q.tail_size:
+            swap = q.head
+            q.head = q.tail
+            q.tail = swap
+            q.head_size = q.tail_size
+            q.tail_size = 0
+        else:
+            return False
+        q.head_pos = 0
+    v[0] = q.head[ q.head_pos ]
+    q.head_pos += 1
+    return True
+
+
+@cython.wraparound(False)
+@cython.boundscheck(False)
+cdef Py_ssize_t _bfs_spill( int * dist, char * dirs, spill_queue * q, Py_ssize_t sx, Py_ssize_t sy ) nogil:
+    """``_bfs`` over a queue that spills to disk, the castles are queued.
+    Returns the number of cells discovered, -1 on an I/O error."""
+    cdef Py_ssize_t c, v, x, y, found = 0
+    cdef int k
+
+    while _spill_pop( q, &c ):
+        x = c // sy
+        y = c - x * sy
+        for k in range(4):
+            if k == 0: v = c - sy if x > 0 else -1
+            elif k == 1: v = c + sy if x < sx - 1 else -1
+            elif k == 2: v = c - 1 if y > 0 else -1
+            else: v = c + 1 if y < sy - 1 else -1
+            if v >= 0 and dirs[v] == b' ':
+                dirs[v] = DIRECTION_CHARS[k]
+                dist[v] = dist[c] + 1
+                _spill_push( q, v )
+                found += 1
+        if q.error: return -1
+
+    return found
+
+
+cdef class Solved_mapped:
+    """Solution that ``analyze`` wrote into the caller's arrays
+
+    ``distances`` and ``directions`` are those arrays, with the same values
+    as the ones of ``Solved_maze``.
+    """
+
+    cdef readonly object distances
+    cdef readonly object directions
+    cdef readonly bint is_reachable
 
-                size[p1] = self.__update_queue( size[p1], q[p1], x-1, y, b'v', time )
-                size[p1] = self.__update_queue( size[p1], q[p1], x+1, y, b'^', time )
-                size[p1] = self.__update_queue( size[p1], q[p1], x, y-1, b'>', time )
-                size[p1] = self.__update_queue( size[p1], q[p1], x, y+1, b'<', time )
+    def __init__(self, distances, directions, bint is_reachable):
+        self.distances = distances
+        self.directions = directions
+        self.is_reachable = is_reachable
 
 
-        PyMem_Free(q[0])
-        PyMem_Free(q[1])
-        PyMem_Free(q)
+def analyze_into(array, distances, directions, budget = 1 << 26):
+    """Solve a maze larger than the memory, e.g. a ``numpy.memmap``
 
-    cdef coords __move_step( self, char ch , int x, int y ):
+    ``distances`` (int32) and ``directions`` ('S1') are arrays of the shape
+    of ``array`` to write the solution to, typically writable memmaps.
+    They get the same values as ``analyze(array)`` gives. Besides the
+    mapped pages, about ``budget`` bytes of memory are used: the BFS queue
+    keeps two buffers of ``budget / 4`` bytes and spills the rest to a
+    temporary file, and the maze is read in blocks of rows whose
+    temporaries (about 12 bytes per cell) take the other half.
 
-        if ch == ord('v'): return coords(x+1, y)
-        if ch == ord('^'): return coords(x-1, y)
-        if ch == ord('>'): return coords(x, y+1)
-        if ch == ord('<'): return coords(x, y-1)
-        raise Exception("Wrong move")
+    Returns whether every empty cell has a path to a castle.
+    """
+    shape = numpy.shape( array )
+    if len( shape ) != 2 or numpy.shape( distances ) != shape or numpy.shape( directions ) != shape:
+        raise ValueError( 'array, distances and directions must have the same 2-D shape' )
+    cdef int[:, ::1] dist = distances
+    cdef char[:, ::1] dirs = directions
+    cdef Py_ssize_t sx = shape[0], sy = shape[1], r, walkable = 0, found
+    cdef Py_ssize_t rows = max( 1, budget // ( 2 * 12 * max( sy, 1 ) ) )
+    cdef Py_ssize_t v
+    if sx == 0 or sy == 0:
+        return True
+
+    cdef spill_queue q
+    q.capacity = max( 16, budget // ( 4 * sizeof(Py_ssize_t) ) )
+    q.head = <Py_ssize_t *>malloc( q.capacity * sizeof(Py_ssize_t) )
+    q.tail = <Py_ssize_t *>malloc( q.capacity * sizeof(Py_ssize_t) )
+    q.head_pos = q.head_size = q.tail_size = q.read = q.written = 0
+    q.f = NULL
+    q.error = False
+    try:
+        if q.head == NULL or q.tail == NULL:
+            raise MemoryError()
+
+        for r in range( 0, sx, rows ):
+            block = numpy.asarray( array[ r : r + rows ] )
+            walls = block < 0
+            castles = block == 1
+            walkable += block.size - numpy.count_nonzero( walls )
+            distances[ r : r + rows ] = numpy.where( castles, 0, -1 )
+            directions[ r : r + rows ] = numpy.where( walls, b'#', numpy.where( castles, b'X', b' ' ) )
+            for v in numpy.flatnonzero( castles ):
+                _spill_push( &q, r * sy + v )
+                walkable -= 1
+            if q.error:
+                raise OSError( 'cannot spill the BFS queue to a temporary file' )
+            del block, walls, castles
+
+        with nogil:
+            found = _bfs_spill( &dist[0,0], &dirs[0,0], &q, sx, sy )
+        if found < 0:
+            raise OSError( 'cannot spill the BFS queue to a temporary file' )
+        return found == walkable
+    finally:
+        free( q.head )
+        free( q.tail )
+        if q.f != NULL:
+            fclose( q.f )
+
+
+#open list of A*: f in the high half of the key, h in the low one
+cdef struct open_entry:
+    long long key
+    int cell
+
+
+cdef inline void _heap_push( open_entry * heap, Py_ssize_t * size, long long key, int cell ) nogil:
+    cdef Py_ssize_t i = size[0], p
+    size[0] += 1
+    while i > 0:
+        p = ( i - 1 ) >> 1
+        if heap[p].key <= key: break
+        heap[i] = heap[p]
+        i = p
+    heap[i].key = key
+    heap[i].cell = cell
+
+
+cdef inline int _heap_pop( open_entry * heap, Py_ssize_t * size ) nogil:
+    cdef int top = heap[0].cell
+    cdef Py_ssize_t i = 0, c, n
+    cdef open_entry last
+    size[0] -= 1
+    n = size[0]
+    last = heap[n]
+    while True:
+        c = 2 * i + 1
+        if c >= n: break
+        if c + 1 < n and heap[c+1].key < heap[c].key: c += 1
+        if last.key <= heap[c].key: break
+        heap[i] = heap[c]
+        i = c
+    heap[i] = last
+    return top
+
+
+cdef int _grow( void ** buf, Py_ssize_t * capacity, Py_ssize_t need, size_t item ) nogil:
+    """Make room for ``need`` items in a realloc'ed buffer, -1 without memory"""
+    cdef Py_ssize_t c = capacity[0]
+    cdef void * p
+    if need <= c: return 0
+    while c < need: c = max( 2 * c, 1024 )
+    p = realloc( buf[0], c * item )
+    if p == NULL: return -1
+    buf[0] = p
+    capacity[0] = c
+    return 0
+
+
+cdef inline int _step( int c, int k, int sx, int sy ) nogil:
+    """Cell reached from c by the move k (up, down, left, right), -1 outside"""
+    return _neighbour( c, k, sx, sy )
+
+
+cdef inline int _back( int c, int k, int sy ) nogil:
+    """Cell the move k came from to reach c"""
+    if k == 0: return c + sy
+    if k == 1: return c - sy
+    if k == 2: return c + 1
+    return c - 1
+
+
+PATH_METHODS = ('astar', 'bidirectional', 'jps')
+
+
+cdef class Path_finder:
+    """Shortest paths between two cells of one maze, without solving all of it
+
+    Walls are the negative cells, every other cell can be walked through.
+    The per-cell buffers are allocated zeroed on the first query, so only
+    the pages of the visited cells are touched, and they are reused by the
+    next queries: a query costs the cells it visits. ``visited`` is the
+    number of cells the last query expanded (for 'jps' also the cells its
+    horizontal jumps passed).
+
+    Jump Point Search ('jps') orders the shortest paths horizontal moves
+    first: a vertical run turns only where a wall behind the turn forces
+    it. Vertical jumps look up the next wall or forced turn of the column
+    in a table built by the first 'jps' query, so open space costs nothing.
+    """
+
+    cdef object _array
+    cdef const int [:,::1] _a
+    cdef int _sx, _sy
+    cdef unsigned int _gen
+    #per side (from the start, from the goal): query of the last visit, distance, move
+    cdef unsigned int * _seen[2]
+    cdef int * _g[2]
+    cdef char * _move[2]
+    cdef unsigned int * _closed
+    #jump point of a cell reached by 'jps'
+    cdef int * _parent
+    #rows of the walls and forced turns of every column, moving down and up
+    cdef object _jump_rows
+    cdef const int [::1] _down_rows
+    cdef const int [::1] _up_rows
+    cdef const Py_ssize_t [::1] _down_start
+    cdef const Py_ssize_t [::1] _up_start
+    cdef open_entry * _open
+    cdef Py_ssize_t _open_capacity
+    cdef int * _queue[2]
+    cdef Py_ssize_t _queue_capacity[2]
+    cdef readonly Py_ssize_t visited
+
+    def __cinit__( self ):
+        cdef int side
+        for side in range(2):
+            self._seen[side] = NULL
+            self._g[side] = NULL
+            self._move[side] = NULL
+            self._queue[side] = NULL
+            self._queue_capacity[side] = 0
+        self._closed = NULL
+        self._parent = NULL
+        self._jump_rows = None
+        self._open = NULL
+        self._open_capacity = 0
+        self._gen = 0
+
+    def __init__( self, array ):
+        array = numpy.ascontiguousarray( array, dtype=numpy.int32 )
+        if array.ndim != 2:
+            raise ValueError('a maze is a 2-D array')
+        if array.size >= INT_MAX:
+            raise ValueError('The maze is too big for int32 cell indices.')
+        self._array = array
+        self._a = array
+        self._sx, self._sy = array.shape[0], array.shape[1]
+        self.visited = 0
+
+    def __dealloc__( self ):
+        cdef int side
+        for side in range(2):
+            free( self._seen[side] )
+            free( self._g[side] )
+            free( self._move[side] )
+            free( self._queue[side] )
+        free( self._closed )
+        free( self._parent )
+        free( self._open )
+
+    cdef int __buffers( self, int sides ) except -1:
+        """Allocate the per-cell buffers of the sides used, start a new query"""
+        cdef size_t n = max( <size_t>self._sx * self._sy, 1 )
+        cdef int side
+        for side in range( sides ):
+            if self._seen[side] == NULL:
+                self._seen[side] = <unsigned int *>calloc( n, sizeof(unsigned int) )
+                self._g[side] = <int *>malloc( n * sizeof(int) )
+                self._move[side] = <char *>malloc( n )
+                if self._seen[side] == NULL or self._g[side] == NULL or self._move[side] == NULL:
+                    raise MemoryError()
+        if sides == 1 and self._closed == NULL:
+            self._closed = <unsigned int *>calloc( n, sizeof(unsigned int) )
+            if self._closed == NULL: raise MemoryError()
+        if sides == 1 and self._jump_rows is not None and self._parent == NULL:
+            self._parent = <int *>malloc( n * sizeof(int) )
+            if self._parent == NULL: raise MemoryError()
+
+        self._gen += 1
+        if self._gen == 0:
+            #the stamps wrapped around, forget them all
+            for side in range(2):
+                if self._seen[side] != NULL: memset( self._seen[side], 0, n * sizeof(unsigned int) )
+            if self._closed != NULL: memset( self._closed, 0, n * sizeof(unsigned int) )
+            self._gen = 1
+        return 0
 
     @cython.wraparound(False)
     @cython.boundscheck(False)
-    def path(self, _x, _y ):
+    @cython.cdivision(True)
+    cdef int __astar( self, int s, int t ) nogil except -2:
+        """A* with the Manhattan distance, returns the length of the path or -1"""
+        cdef unsigned int gen = self._gen
+        cdef unsigned int * seen = self._seen[0]
+        cdef unsigned int * closed = self._closed
+        cdef int * g = self._g[0]
+        cdef char * move = self._move[0]
+        cdef const int * a = &self._a[0,0]
+        cdef int sx = self._sx, sy = self._sy
+        cdef int tx = t // sy, ty = t % sy
+        cdef int c, v, k, d, h
+        cdef Py_ssize_t size = 0
+
+        seen[s] = gen
+        g[s] = 0
+        move[s] = -1
+        if _grow( <void **>&self._open, &self._open_capacity, 1, sizeof(open_entry) ):
+            with gil: raise MemoryError()
+        h = abs( s // sy - tx ) + abs( s % sy - ty )
+        _heap_push( self._open, &size, ( <long long>h << 32 ) | h, s )
+
+        while size:
+            c = _heap_pop( self._open, &size )
+            if closed[c] == gen: continue
+            closed[c] = gen
+            self.visited += 1
+            if c == t: return g[c]
+
+            d = g[c] + 1
+            for k in range(4):
+                v = _step( c, k, sx, sy )
+                if v < 0 or a[v] < 0 or closed[v] == gen: continue
+                if seen[v] == gen and g[v] <= d: continue
+                seen[v] = gen
+                g[v] = d
+                move[v] = k
+                #ties go to the cell nearer to the goal
+                h = abs( v // sy - tx ) + abs( v % sy - ty )
+                if _grow( <void **>&self._open, &self._open_capacity, size + 1, sizeof(open_entry) ):
+                    with gil: raise MemoryError()
+                _heap_push( self._open, &size, ( <long long>( d + h ) << 32 ) | h, v )
+
+        return -1
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef int __bidirectional( self, int s, int t, int * meet ) nogil except -2:
+        """BFS from both ends, a level of the smaller frontier at a time.
+
+        The meetings are collected over the whole level where the searches
+        first meet, the shortest of them is a shortest path.
+        Returns its length or -1, ``meet`` is its cell seen from both sides.
+        """
+        cdef unsigned int gen = self._gen
+        cdef const int * a = &self._a[0,0]
+        cdef int sx = self._sx, sy = self._sy
+        cdef Py_ssize_t head[2]
+        cdef Py_ssize_t tail[2]
+        cdef Py_ssize_t end
+        cdef int side, other, c, v, k, d, best = -1
+        cdef int ends[2]
+
+        ends[0] = s
+        ends[1] = t
+        for side in range(2):
+            if _grow( <void **>&self._queue[side], &self._queue_capacity[side], 1, sizeof(int) ):
+                with gil: raise MemoryError()
+            self._seen[side][ ends[side] ] = gen
+            self._g[side][ ends[side] ] = 0
+            self._move[side][ ends[side] ] = -1
+            self._queue[side][0] = ends[side]
+            head[side] = 0
+            tail[side] = 1
+        self.visited = 2
+        if s == t:
+            meet[0] = s
+            return 0
+
+        while head[0] < tail[0] and head[1] < tail[1]:
+            side = 0 if tail[0] - head[0] <= tail[1] - head[1] else 1
+            other = 1 - side
+            end = tail[side]
+            while head[side] < end:
+                c = self._queue[side][ head[side] ]
+                head[side] += 1
+                d = self._g[side][c] + 1
+                for k in range(4):
+                    v = _step( c, k, sx, sy )
+                    if v < 0 or a[v] < 0 or self._seen[side][v] == gen: continue
+                    self._seen[side][v] = gen
+                    self._g[side][v] = d
+                    self._move[side][v] = k
+                    if _grow( <void **>&self._queue[side], &self._queue_capacity[side], tail[side] + 1, sizeof(int) ):
+                        with gil: raise MemoryError()
+                    self._queue[side][ tail[side] ] = v
+                    tail[side] += 1
+                    self.visited += 1
+                    if self._seen[other][v] == gen and ( best < 0 or d + self._g[other][v] < best ):
+                        best = d + self._g[other][v]
+                        meet[0] = v
+            if best >= 0:
+                return best
+
+        return -1
+
+    cdef __jump_table( self ):
+        """Per column the rows where a vertical jump stops: walls and forced turns"""
+        a = numpy.asarray( self._array )
+        blocked = numpy.ones( ( self._sx + 2, self._sy + 2 ), dtype=bool )
+        blocked[1:-1,1:-1] = a < 0
+        free = ~blocked
+        cell, left, right = free[1:-1,1:-1], free[1:-1,:-2], free[1:-1,2:]
+        #moving down into a cell, a free side is forced if the cell above it is blocked
+        down = blocked[1:-1,1:-1] | cell & ( left & blocked[:-2,:-2] | right & blocked[:-2,2:] )
+        up = blocked[1:-1,1:-1] | cell & ( left & blocked[2:,:-2] | right & blocked[2:,2:] )
+
+        tables = []
+        for stops in ( down, up ):
+            columns, rows = numpy.nonzero( stops.T )
+            start = numpy.zeros( self._sy + 1, dtype=numpy.intp )
+            numpy.cumsum( numpy.bincount( columns, minlength = self._sy ), out = start[1:] )
+            tables += [ rows.astype( numpy.int32 ), start ]
+        self._down_rows, self._down_start, self._up_rows, self._up_start = tables
+        self._jump_rows = tables
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef int __vjump( self, int r, int c, int dr, int gr, int gc ) nogil:
+        """Row of the jump point reached from (r, c) moving by dr rows, -1 if none"""
+        cdef Py_ssize_t lo, hi, mid
+        cdef int e
+        if dr > 0:
+            #first stop below r
+            lo, hi = self._down_start[c], self._down_start[c+1]
+            while lo < hi:
+                mid = ( lo + hi ) >> 1
+                if self._down_rows[mid] <= r: lo = mid + 1
+                else: hi = mid
+            e = self._down_rows[lo] if lo < self._down_start[c+1] else self._sx
+            if gc == c and r < gr <= e: return gr
+        else:
+            #last stop above r
+            lo, hi = self._up_start[c], self._up_start[c+1]
+            while lo < hi:
+                mid = ( lo + hi ) >> 1
+                if self._up_rows[mid] < r: lo = mid + 1
+                else: hi = mid
+            e = self._up_rows[lo-1] if lo > self._up_start[c] else -1
+            if gc == c and e <= gr < r: return gr
+        if e < 0 or e >= self._sx or self._a[e,c] < 0: return -1
+        return e
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef int __hjump( self, int r, int c, int dc, int gr, int gc ) nogil:
+        """Column of the jump point reached from (r, c) moving by dc columns, -1 if none
+
+        A cell is a jump point if a vertical jump from it finds one.
+        """
+        while True:
+            c += dc
+            if c < 0 or c >= self._sy or self._a[r,c] < 0: return -1
+            self.visited += 1
+            if r == gr and c == gc: return c
+            if self.__vjump( r, c, 1, gr, gc ) >= 0 or self.__vjump( r, c, -1, gr, gc ) >= 0: return c
 
-        cdef coords p = coords(_x,_y)
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    @cython.cdivision(True)
+    cdef int __jps( self, int s, int t ) nogil except -2:
+        """A* over the jump points, returns the length of the path or -1"""
+        cdef unsigned int gen = self._gen
+        cdef unsigned int * seen = self._seen[0]
+        cdef unsigned int * closed = self._closed
+        cdef int * g = self._g[0]
+        cdef char * move = self._move[0]
+        cdef int * parent = self._parent
+        cdef int sx = self._sx, sy = self._sy
+        cdef int tx = t // sy, ty = t % sy
+        cdef int c, v, k, d, h, r, col, dr, j, n
+        cdef int dirs[4]
+        cdef Py_ssize_t size = 0
+
+        seen[s] = gen
+        g[s] = 0
+        move[s] = -1
+        parent[s] = -1
+        if _grow( <void **>&self._open, &self._open_capacity, 1, sizeof(open_entry) ):
+            with gil: raise MemoryError()
+        h = abs( s // sy - tx ) + abs( s % sy - ty )
+        _heap_push( self._open, &size, ( <long long>h << 32 ) | h, s )
+
+        while size:
+            c = _heap_pop( self._open, &size )
+            if closed[c] == gen: continue
+            closed[c] = gen
+            self.visited += 1
+            if c == t: return g[c]
+
+            #moves 0 up, 1 down, 2 left, 3 right
+            r, col = c // sy, c % sy
+            k = move[c]
+            n = 0
+            if k < 0:
+                dirs[0], dirs[1], dirs[2], dirs[3] = 0, 1, 2, 3
+                n = 4
+            elif k >= 2:
+                dirs[0], dirs[1], dirs[2] = k, 0, 1
+                n = 3
+            else:
+                dirs[0] = k
+                n = 1
+                dr = -1 if k == 0 else 1
+                #a free side whose cell behind is blocked
+                if col > 0 and self._a[r,col-1] >= 0 and not ( 0 <= r - dr < sx and self._a[r-dr,col-1] >= 0 ):
+                    dirs[n] = 2
+                    n += 1
+                if col < sy - 1 and self._a[r,col+1] >= 0 and not ( 0 <= r - dr < sx and self._a[r-dr,col+1] >= 0 ):
+                    dirs[n] = 3
+                    n += 1
+
+            for j in range(n):
+                k = dirs[j]
+                if k < 2:
+                    v = self.__vjump( r, col, -1 if k == 0 else 1, tx, ty )
+                    if v < 0: continue
+                    d = g[c] + abs( v - r )
+                    v = v * sy + col
+                else:
+                    v = self.__hjump( r, col, -1 if k == 2 else 1, tx, ty )
+                    if v < 0: continue
+                    d = g[c] + abs( v - col )
+                    v = r * sy + v
+                if closed[v] == gen: continue
+                if seen[v] == gen and g[v] <= d: continue
+                seen[v] = gen
+                g[v] = d
+                move[v] = k
+                parent[v] = c
+                h = abs( v // sy - tx ) + abs( v % sy - ty )
+                if _grow( <void **>&self._open, &self._open_capacity, size + 1, sizeof(open_entry) ):
+                    with gil: raise MemoryError()
+                _heap_push( self._open, &size, ( <long long>( d + h ) << 32 ) | h, v )
+
+        return -1
+
+    cdef __jump_points( self, int t ):
+        """Jump points from the start to ``t`` as an (K, 2) int32 array"""
+        cdef int sy = self._sy
+        cdef int c = t
+        points = []
+        while c >= 0:
+            points.append( ( c // sy, c % sy ) )
+            c = self._parent[c]
+        return numpy.array( points[::-1], dtype=numpy.int32 ).reshape( -1, 2 )
+
+    def path( self, start, goal, method = 'astar', compressed = False ):
+        """Shortest path from ``start`` to ``goal`` as an (L, 2) int32 array of rows and columns
+
+        ``method`` is 'astar' (A* with the Manhattan distance),
+        'bidirectional' (BFS from both ends) or 'jps' (Jump Point Search).
+        All find a shortest path, not necessarily the same one.
+
+        With ``compressed`` only the start, the cells where the path turns
+        and the goal are returned; 'jps' gets them from its jump points
+        without walking the path.
+        """
+        if method not in PATH_METHODS:
+            raise ValueError( 'unknown method {!r}, expected one of {}'.format( method, PATH_METHODS ) )
+        cdef int sx = self._sx, sy = self._sy
+        for x, y in ( start, goal ):
+            if not ( 0 <= x < sx and 0 <= y < sy ):
+                raise IndexError('The cell is out of the maze.')
+            if self._a[x,y] < 0:
+                raise ValueError('The cell is a wall.')
+
+        cdef int s = start[0] * sy + start[1], t = goal[0] * sy + goal[1]
+        cdef int length, meet = t, i, c
+        cdef bint astar = method != 'bidirectional', jps = method == 'jps'
+
+        if jps and self._jump_rows is None:
+            self.__jump_table()
+        self.__buffers( 1 if astar else 2 )
+        self.visited = 0
+        with nogil:
+            if jps:
+                length = self.__jps( s, t )
+            elif astar:
+                length = self.__astar( s, t )
+            else:
+                length = self.__bidirectional( s, t, &meet )
+        if length < 0:
+            raise ValueError('The path doesn\'t exists.')
 
+        if jps:
+            points = self.__jump_points( t )
+            return _corners( points ) if compressed else _expand( points )
 
-        if self._directions[p.x,p.y] == ord('#'):  raise ValueError('The path doesn\'t exists.')
-        if self._directions[p.x,p.y] == ord(' '):  raise ValueError('The path doesn\'t exists.')
-        ret = []
+        ret = numpy.empty( (length+1, 2), dtype=numpy.int32 )
+        cdef int [:,::1] out = ret
 
+        #back from the meeting to the start, then on to the goal
+        c = meet
+        i = self._g[0][c]
         while True:
+            out[i,0] = c // sy
+            out[i,1] = c % sy
+            if i == 0: break
+            c = _back( c, self._move[0][c], sy )
+            i -= 1
+        c = meet
+        i = length - self._g[1][c] if not astar else length
+        while i < length:
+            c = _back( c, self._move[1][c], sy )
+            i += 1
+            out[i,0] = c // sy
+            out[i,1] = c % sy
+
+        return _corners( ret ) if compressed else ret
+
+
+def _corners( points ):
+    """The first and last points and those where a path of straight runs turns"""
+    if len( points ) <= 2:
+        return points
+    step = numpy.sign( numpy.diff( points, axis = 0 ) )
+    turn = ( step[1:] != step[:-1] ).any( axis = 1 )
+    return numpy.concatenate( [ points[:1], points[1:-1][turn], points[-1:] ] )
+
+
+def _expand( points ):
+    """Every cell of a path given by points joined by straight runs"""
+    run = numpy.diff( points, axis = 0 )
+    steps = numpy.repeat( numpy.sign( run ), numpy.abs( run ).sum( axis = 1 ), axis = 0 )
+    return numpy.concatenate( [ points[:1], points[0] + numpy.cumsum( steps, axis = 0 ) ] ).astype( numpy.int32 )
+
+
+def shortest_path(array, start, goal, method = 'astar', compressed = False):
+    """Shortest path between two cells, see ``Path_finder.path``
+
+    Only the cells around the path are visited, unlike ``analyze``. For
+    several queries on one maze keep a ``Path_finder``, which also saves
+    converting the maze to int32.
+    """
+    return Path_finder( array ).path( start, goal, method, compressed )
+
+
+#distance between two entrances of a cluster without a path inside it
+DEF NO_ENTRY = 65535
+#runs of free cells along a border this long get an entrance at each end
+DEF LONG_RUN = 6
+
+
+cdef class Path_index:
+    """Hierarchical index of a maze for many path queries (HPA*)
+
+    The maze is cut into square clusters of ``cluster`` cells. Every run of
+    free cells along the border of two clusters gets an entrance on both
+    sides, in its middle or at both ends of a long run, and every cluster
+    keeps a table of the distances between its entrances inside it. A query
+    searches from the entrances around the start to those around the goal
+    over the tables, so it costs two cluster BFS and the entrances it
+    visits, not the cells.
+
+    The distances are near-optimal: a path crosses the borders at the
+    entrances only. ``update_cell`` rebuilds only the clusters of the cell
+    and those sharing the border it lies on.
+    """
+
+    cdef unsigned char [:,::1] _free
+    cdef int _sx, _sy, _rows, _columns, _k
+    cdef readonly int cluster
+    #per cluster: cells of the entrances, their number on the up, down,
+    #left and right border, and the k x k table of distances between them
+    cdef int ** _cells
+    cdef int * _counts
+    cdef unsigned short ** _tables
+    #search over the entrances, indexed cluster * _k + entrance
+    cdef unsigned int _gen
+    cdef unsigned int * _seen
+    cdef unsigned int * _closed
+    cdef int * _g
+    cdef int * _parent
+    cdef open_entry * _open
+    cdef Py_ssize_t _open_capacity
+    #BFS inside one cluster, indexed by the cell in the cluster
+    cdef int * _local_dist
+    cdef char * _local_move
+    cdef int * _local_queue
+    #distances from the start and to the goal of the entrances of their clusters
+    cdef int * _from_start
+    cdef int * _to_goal
+    cdef readonly Py_ssize_t visited
+
+    def __cinit__( self ):
+        self._cells = NULL
+        self._counts = NULL
+        self._tables = NULL
+        self._seen = self._closed = NULL
+        self._g = self._parent = NULL
+        self._open = NULL
+        self._open_capacity = 0
+        self._local_dist = self._local_queue = NULL
+        self._local_move = NULL
+        self._from_start = self._to_goal = NULL
+        self._rows = self._columns = 0
+        self._gen = 0
+
+    def __init__( self, array, int cluster = 16 ):
+        array = numpy.asarray( array )
+        if array.ndim != 2:
+            raise ValueError('a maze is a 2-D array')
+        if not 2 <= cluster <= 255:
+            raise ValueError('The cluster size must be between 2 and 255.')
+        if array.size >= INT_MAX:
+            raise ValueError('The maze is too big for int32 cell indices.')
+
+        self._free = ( array >= 0 ).view( numpy.uint8 ).copy()
+        self._sx, self._sy = array.shape[0], array.shape[1]
+        self.cluster = cluster
+        self._rows = ( self._sx + cluster - 1 ) // cluster
+        self._columns = ( self._sy + cluster - 1 ) // cluster
+        #at most one entrance per two cells of a border
+        self._k = 4 * ( ( cluster + 1 ) // 2 )
+
+        cdef Py_ssize_t n = <Py_ssize_t>self._rows * self._columns
+        cdef Py_ssize_t nodes = max( n * self._k, 1 )
+        self._cells = <int **>calloc( max( n, 1 ), sizeof(int *) )
+        self._tables = <unsigned short **>calloc( max( n, 1 ), sizeof(unsigned short *) )
+        self._counts = <int *>calloc( max( n, 1 ) * 4, sizeof(int) )
+        self._seen = <unsigned int *>calloc( nodes, sizeof(unsigned int) )
+        self._closed = <unsigned int *>calloc( nodes, sizeof(unsigned int) )
+        self._g = <int *>malloc( nodes * sizeof(int) )
+        self._parent = <int *>malloc( nodes * sizeof(int) )
+        self._local_dist = <int *>malloc( cluster * cluster * sizeof(int) )
+        self._local_queue = <int *>malloc( cluster * cluster * sizeof(int) )
+        self._local_move = <char *>malloc( cluster * cluster )
+        self._from_start = <int *>malloc( self._k * sizeof(int) )
+        self._to_goal = <int *>malloc( self._k * sizeof(int) )
+        if ( self._cells == NULL or self._tables == NULL or self._counts == NULL or self._seen == NULL
+             or self._closed == NULL or self._g == NULL or self._parent == NULL or self._local_dist == NULL
+             or self._local_queue == NULL or self._local_move == NULL or self._from_start == NULL
+             or self._to_goal == NULL ):
+            raise MemoryError()
+
+        cdef int c
+        for c in range( n ):
+            self.__build( c )
+
+    def __dealloc__( self ):
+        cdef Py_ssize_t c
+        for c in range( <Py_ssize_t>self._rows * self._columns ):
+            if self._cells != NULL: free( self._cells[c] )
+            if self._tables != NULL: free( self._tables[c] )
+        free( self._cells )
+        free( self._tables )
+        free( self._counts )
+        free( self._seen )
+        free( self._closed )
+        free( self._g )
+        free( self._parent )
+        free( self._open )
+        free( self._local_dist )
+        free( self._local_queue )
+        free( self._local_move )
+        free( self._from_start )
+        free( self._to_goal )
+
+    @property
+    def nodes( self ):
+        """Number of entrances of all the clusters"""
+        cdef Py_ssize_t c, n = 0
+        for c in range( <Py_ssize_t>self._rows * self._columns ):
+            n += self.__count( c )
+        return n
+
+    cdef inline int __count( self, int c ) nogil:
+        return self._counts[ 4*c ] + self._counts[ 4*c + 1 ] + self._counts[ 4*c + 2 ] + self._counts[ 4*c + 3 ]
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef int __border( self, int c, int b, int * cells ) nogil:
+        """Entrances of the border b (up, down, left, right) of cluster c, returns their number"""
+        cdef int i = c // self._columns, j = c % self._columns, C = self.cluster
+        cdef int r0 = i * C, c0 = j * C
+        cdef int r1 = min( r0 + C, self._sx ), c1 = min( c0 + C, self._sy )
+        cdef int own, other, first, last, p, n = 0, begin = -1
+
+        if b == 0 and i > 0: own, other, first, last = r0, r0 - 1, c0, c1
+        elif b == 1 and i < self._rows - 1: own, other, first, last = r1 - 1, r1, c0, c1
+        elif b == 2 and j > 0: own, other, first, last = c0, c0 - 1, r0, r1
+        elif b == 3 and j < self._columns - 1: own, other, first, last = c1 - 1, c1, r0, r1
+        else: return 0
+
+        #an entrance in the middle of every run free on both sides, or at
+        #both ends of a long run
+        for p in range( first, last + 1 ):
+            if p < last and ( ( b < 2 and self._free[own,p] and self._free[other,p] ) or
+                              ( b >= 2 and self._free[p,own] and self._free[p,other] ) ):
+                if begin < 0: begin = p
+                continue
+            if begin < 0: continue
+            if p - begin < LONG_RUN:
+                cells[n] = ( begin + p - 1 ) // 2
+                n += 1
+            else:
+                cells[n] = begin
+                cells[n+1] = p - 1
+                n += 2
+            begin = -1
+
+        for p in range( n ):
+            if b < 2: cells[p] = own * self._sy + cells[p]
+            else: cells[p] = cells[p] * self._sy + own
+        return n
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef void __local_bfs( self, int c, int source ) nogil:
+        """BFS inside cluster c from the cell ``source``, into _local_dist and _local_move"""
+        cdef int i = c // self._columns, j = c % self._columns, C = self.cluster
+        cdef int r0 = i * C, c0 = j * C
+        cdef int h = min( r0 + C, self._sx ) - r0, w = min( c0 + C, self._sy ) - c0
+        cdef int head = 0, tail = 1, x, k, v, r, col
+
+        for x in range( h * w ):
+            self._local_dist[x] = -1
+        x = ( source // self._sy - r0 ) * w + source % self._sy - c0
+        self._local_dist[x] = 0
+        self._local_move[x] = -1
+        self._local_queue[0] = x
+        while head < tail:
+            x = self._local_queue[head]
+            head += 1
+            for k in range(4):
+                v = _neighbour( x, k, h, w )
+                if v < 0 or self._local_dist[v] >= 0: continue
+                r = r0 + v // w
+                col = c0 + v % w
+                if not self._free[r,col]: continue
+                self._local_dist[v] = self._local_dist[x] + 1
+                self._local_move[v] = k
+                self._local_queue[tail] = v
+                tail += 1
+
+    cdef inline int __local( self, int c, int cell ) nogil:
+        """Index of a cell of cluster c in the local BFS arrays"""
+        cdef int C = self.cluster
+        cdef int r0 = ( c // self._columns ) * C, c0 = ( c % self._columns ) * C
+        cdef int w = min( c0 + C, self._sy ) - c0
+        return ( cell // self._sy - r0 ) * w + cell % self._sy - c0
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef int __build( self, int c ) except -1:
+        """Find the entrances of cluster c and the distances between them"""
+        cdef int cells[4 * 256]
+        cdef int b, n = 0, m, l, d
+        cdef int * kept
+        cdef unsigned short * table
+
+        for b in range(4):
+            self._counts[ 4*c + b ] = self.__border( c, b, cells + n )
+            n += self._counts[ 4*c + b ]
+
+        kept = <int *>malloc( max( n, 1 ) * sizeof(int) )
+        table = <unsigned short *>malloc( max( n * n, 1 ) * sizeof(unsigned short) )
+        if kept == NULL or table == NULL:
+            free( kept )
+            free( table )
+            raise MemoryError()
+        for l in range( n ):
+            kept[l] = cells[l]
+        with nogil:
+            for l in range( n ):
+                self.__local_bfs( c, kept[l] )
+                for m in range( n ):
+                    d = self._local_dist[ self.__local( c, kept[m] ) ]
+                    table[ l*n + m ] = <unsigned short>d if d >= 0 else NO_ENTRY
+
+        free( self._cells[c] )
+        free( self._tables[c] )
+        self._cells[c] = kept
+        self._tables[c] = table
+        return 0
+
+    cdef inline int __cluster( self, int cell ) nogil:
+        return ( cell // self._sy // self.cluster ) * self._columns + cell % self._sy // self.cluster
+
+    @cython.cdivision(True)
+    cdef inline int __partner( self, int c, int l ) nogil:
+        """Node across the border from entrance l of cluster c"""
+        cdef int b = 0, other
+        while l >= self._counts[ 4*c + b ]:
+            l -= self._counts[ 4*c + b ]
+            b += 1
+        if b == 0: other, b = c - self._columns, 1
+        elif b == 1: other, b = c + self._columns, 0
+        elif b == 2: other, b = c - 1, 3
+        else: other, b = c + 1, 2
+        while b > 0:
+            b -= 1
+            l += self._counts[ 4*other + b ]
+        return other * self._k + l
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    @cython.cdivision(True)
+    cdef int __search( self, int s, int t, int * last ) nogil except -2:
+        """A* over the entrances from the start cell to the goal cell
+
+        Returns the length of the path or -1, ``last`` is the node the path
+        leaves for the goal, -1 if it stays in the cluster of both.
+        """
+        cdef int cs = self.__cluster( s ), ct = self.__cluster( t ), k = self._k
+        cdef int ns = self.__count( cs ), nt = self.__count( ct )
+        cdef int tx = t // self._sy, ty = t % self._sy
+        cdef int best = INT_MAX, l, m, u, v, c, n, d, h, cell
+        cdef unsigned int gen
+        cdef unsigned short * table
+        cdef Py_ssize_t size = 0
+
+        self.__local_bfs( ct, t )
+        for m in range( nt ):
+            self._to_goal[m] = self._local_dist[ self.__local( ct, self._cells[ct][m] ) ]
+        if cs == ct and self._local_dist[ self.__local( ct, s ) ] >= 0:
+            best = self._local_dist[ self.__local( ct, s ) ]
+        last[0] = -1
+
+        self.__local_bfs( cs, s )
+        self._gen += 1
+        if self._gen == 0:
+            memset( self._seen, 0, <size_t>self._rows * self._columns * k * sizeof(unsigned int) )
+            memset( self._closed, 0, <size_t>self._rows * self._columns * k * sizeof(unsigned int) )
+            self._gen = 1
+        gen = self._gen
+
+        for l in range( ns ):
+            cell = self._cells[cs][l]
+            d = self._local_dist[ self.__local( cs, cell ) ]
+            if d < 0: continue
+            u = cs * k + l
+            self._seen[u] = gen
+            self._g[u] = d
+            self._parent[u] = -1
+            h = abs( cell // self._sy - tx ) + abs( cell % self._sy - ty )
+            if _grow( <void **>&self._open, &self._open_capacity, size + 1, sizeof(open_entry) ):
+                with gil: raise MemoryError()
+            _heap_push( self._open, &size, ( <long long>( d + h ) << 32 ) | h, u )
+
+        while size:
+            if ( self._open[0].key >> 32 ) >= best: break
+            u = _heap_pop( self._open, &size )
+            if self._closed[u] == gen: continue
+            self._closed[u] = gen
+            self.visited += 1
+            c = u // k
+            l = u - c * k
+            if c == ct and self._to_goal[l] >= 0 and self._g[u] + self._to_goal[l] < best:
+                best = self._g[u] + self._to_goal[l]
+                last[0] = u
+
+            n = self.__count( c )
+            table = self._tables[c]
+            for m in range( -1, n ):
+                if m < 0:
+                    v = self.__partner( c, l )
+                    d = 1
+                else:
+                    if m == l or table[ l*n + m ] == NO_ENTRY: continue
+                    v = c * k + m
+                    d = table[ l*n + m ]
+                d += self._g[u]
+                if self._closed[v] == gen: continue
+                if self._seen[v] == gen and self._g[v] <= d: continue
+                self._seen[v] = gen
+                self._g[v] = d
+                self._parent[v] = u
+                cell = self._cells[ v // k ][ v % k ]
+                h = abs( cell // self._sy - tx ) + abs( cell % self._sy - ty )
+                if _grow( <void **>&self._open, &self._open_capacity, size + 1, sizeof(open_entry) ):
+                    with gil: raise MemoryError()
+                _heap_push( self._open, &size, ( <long long>( d + h ) << 32 ) | h, v )
+
+        return best if best < INT_MAX else -1
+
+    cdef __cell( self, point ):
+        row, column = point
+        if not ( 0 <= row < self._sx and 0 <= column < self._sy ):
+            raise IndexError('The cell is out of the maze.')
+        if not self._free[row,column]:
+            raise ValueError('The cell is a wall.')
+        return row * self._sy + column
+
+    cdef int __query( self, start, goal, int * last ) except -1:
+        cdef int s = self.__cell( start ), t = self.__cell( goal ), length
+        self.visited = 0
+        with nogil:
+            length = self.__search( s, t, last )
+        if length < 0:
+            raise ValueError('The path doesn\'t exists.')
+        return length
+
+    def distance( self, start, goal ):
+        """Length of a near-shortest path from ``start`` to ``goal``"""
+        cdef int last
+        return self.__query( start, goal, &last )
+
+    def path( self, start, goal, bint refine = True ):
+        """Near-shortest path from ``start`` to ``goal``
+
+        Returns an (L, 2) int32 array of all the cells of the path, of the
+        length ``distance`` gives. Without ``refine`` only the start, the
+        entrances it goes through and the goal are returned.
+        """
+        cdef int last, u, k = self._k, length
+        cdef int s = self.__cell( start ), t = self.__cell( goal )
+        length = self.__query( start, goal, &last )
+
+        #waypoints as (cell, cluster), back from the goal
+        points = [ ( t, self.__cluster( t ) ) ]
+        u = last
+        while u >= 0:
+            points.append( ( self._cells[ u // k ][ u % k ], u // k ) )
+            u = self._parent[u]
+        points.append( ( s, self.__cluster( s ) ) )
+        points.reverse()
+        if not refine:
+            return numpy.array( [ divmod( cell, self._sy ) for cell, _ in points ], dtype=numpy.int32 )
+
+        ret = numpy.empty( ( length + 1, 2 ), dtype=numpy.int32 )
+        cdef int [:,::1] out = ret
+        cdef int i = 0, a, b, c, x, w, C = self.cluster
+        out[0,0], out[0,1] = s // self._sy, s % self._sy
+        for ( a, c ), ( b, _ ) in zip( points[:-1], points[1:] ):
+            if self.__cluster( b ) != c or a == b:
+                #across a border, or two entrances at one cell
+                if a != b:
+                    i += 1
+                    out[i,0], out[i,1] = b // self._sy, b % self._sy
+                continue
+            #inside the cluster, back along the BFS from b
+            self.__local_bfs( c, b )
+            w = min( ( c % self._columns ) * C + C, self._sy ) - ( c % self._columns ) * C
+            x = self.__local( c, a )
+            while self._local_move[x] >= 0:
+                x = _back( x, self._local_move[x], w )
+                i += 1
+                out[i,0] = ( c // self._columns ) * C + x // w
+                out[i,1] = ( c % self._columns ) * C + x % w
+        return ret
+
+    def update_cell( self, row, column, value ):
+        """Change one cell and rebuild the clusters it affects
+
+        The cluster of the cell is rebuilt, and the one across the border
+        if the cell lies on it. Returns the number of clusters rebuilt.
+        """
+        if not ( 0 <= row < self._sx and 0 <= column < self._sy ):
+            raise IndexError('The cell is out of the maze.')
+        cdef bint free = value >= 0
+        if self._free[row,column] == free:
+            return 0
+        self._free[row,column] = free
+
+        cdef int C = self.cluster, i = row // C, j = column // C
+        cdef int c = i * self._columns + j
+        clusters = [ c ]
+        if row % C == 0 and i > 0: clusters.append( c - self._columns )
+        if ( row % C == C - 1 or row == self._sx - 1 ) and i < self._rows - 1: clusters.append( c + self._columns )
+        if column % C == 0 and j > 0: clusters.append( c - 1 )
+        if ( column % C == C - 1 or column == self._sy - 1 ) and j < self._columns - 1: clusters.append( c + 1 )
+        for c in clusters:
+            self.__build( c )
+        return len( clusters )
+
+
+#kinds of cells while a maze is contracted into corridors
+cdef enum:
+    CORRIDOR = 1
+    COVERED = 2
+    JUNCTION = 3
+
+
+@cython.wraparound(False)
+@cython.boundscheck(False)
+cdef int _corridor( signed char * kind, int c, int v, int sx, int sy, int * run, int * end ) nogil:
+    """Walk from the node c through its neighbour v to the next node, returns the steps
+
+    The cells inside are marked COVERED and stored in ``run`` unless NULL,
+    ``end`` gets the node reached and the cell before it.
+    """
+    cdef int prev = c, length = 1, j, w = -1
+    while kind[v] != JUNCTION:
+        kind[v] = COVERED
+        if run != NULL: run[ length - 1 ] = v
+        for j in range(4):
+            w = _neighbour( v, j, sx, sy )
+            if w >= 0 and w != prev and kind[w] != WALL: break
+        prev = v
+        v = w
+        length += 1
+    end[0] = v
+    end[1] = prev
+    return length
+
+
+cdef void _cover( signed char * kind, int sx, int sy ) nogil:
+    """Mark the corridors between nodes, make one cell of every closed ring a node"""
+    cdef int n = sx * sy, c, j, v
+    cdef int end[2]
+    for c in range( n ):
+        if kind[c] == JUNCTION:
+            for j in range(4):
+                v = _neighbour( c, j, sx, sy )
+                if v >= 0 and kind[v] == CORRIDOR:
+                    _corridor( kind, c, v, sx, sy, NULL, end )
+    for c in range( n ):
+        if kind[c] == CORRIDOR:
+            kind[c] = JUNCTION
+            for j in range(4):
+                v = _neighbour( c, j, sx, sy )
+                if v >= 0 and kind[v] != WALL: break
+            _corridor( kind, c, v, sx, sy, NULL, end )
+
+
+cdef Py_ssize_t _upper( const Py_ssize_t * a, Py_ssize_t size, Py_ssize_t x ) nogil:
+    """First index of the sorted a[:size] with a value over x"""
+    cdef Py_ssize_t lo = 0, hi = size, mid
+    while lo < hi:
+        mid = ( lo + hi ) >> 1
+        if a[mid] <= x: lo = mid + 1
+        else: hi = mid
+    return lo
+
+
+cdef struct spot:
+    int node        #node of the cell, -1 inside a corridor
+    int edge        #else an edge through the cell
+    int position    #and the steps from its source to the cell
+    int source
+
+#where a path between two spots runs through the graph: the node it enters
+#at and the one it leaves at, each with the side of the spot's edge they
+#are on (0 its source, 1 its target); first is -1 along one corridor
+cdef struct route:
+    int first
+    int first_side
+    int last
+    int last_side
+
+
+cdef class Corridor_graph:
+    """A maze contracted into a graph of the corridors between junctions
+
+    The nodes are the free cells that do not just continue a corridor:
+    junctions, dead ends, castles and one cell of every closed ring. Every
+    corridor of free cells between two nodes is an edge in both directions,
+    as long as its steps. The graph is kept in CSR arrays: the edges of node
+    u are ``offsets[u]`` to ``offsets[u+1]``, going to ``targets`` with
+    ``lengths``, and the cells inside the corridor of edge e, in the order
+    they are walked, are ``runs[ run_offsets[e] : run_offsets[e+1] ]`` as
+    flat indices ``row * width + column``. ``nodes`` are the rows and
+    columns of the nodes, numbered in row-major order.
+
+    Generated mazes are mostly corridors one cell wide, so the graph is much
+    smaller than the maze and its searches visit the junctions only.
+    ``visited`` is the number of nodes the last search settled.
+
+    A perfect maze contracts into a ``forest``: then a path is the only one
+    between its ends, found by climbing a rooted tree from both ends to
+    their common ancestor, and the distances to the castles take two passes
+    over the tree instead of a search.
+    """
+
+    cdef readonly object nodes, offsets, targets, lengths, run_offsets, runs
+    cdef int _sx, _sy, _n
+    #per cell: node, -1 for walls, -2 - r for a corridor cell found at runs[r]
+    cdef int [::1] _where
+    cdef int [::1] _cells
+    cdef int [::1] _castles
+    cdef Py_ssize_t [::1] _offsets
+    cdef Py_ssize_t [::1] _run_offsets
+    cdef int [::1] _targets
+    cdef int [::1] _lengths
+    cdef int [::1] _runs
+    #the same corridor in the other direction
+    cdef int [::1] _twins
+    #Dijkstra over the nodes, stamped by the search
+    cdef unsigned int _gen
+    cdef unsigned int * _seen
+    cdef unsigned int * _closed
+    cdef int * _g
+    cdef int * _via
+    cdef int * _parent
+    cdef open_entry * _open
+    #spanning forest by BFS from the first node of every component: the
+    #parent, the edge from it, the steps from the root, and the BFS order
+    cdef int * _up
+    cdef int * _up_edge
+    cdef int * _depth
+    cdef int * _order
+    cdef readonly bint forest
+    cdef readonly Py_ssize_t visited
+
+    def __cinit__( self ):
+        self._up = NULL
+        self._up_edge = NULL
+        self._depth = NULL
+        self._order = NULL
+        self._seen = NULL
+        self._closed = NULL
+        self._g = NULL
+        self._via = NULL
+        self._parent = NULL
+        self._open = NULL
+        self._gen = 0
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    def __init__( self, array ):
+        array = numpy.asarray( array )
+        if array.ndim != 2:
+            raise ValueError('a maze is a 2-D array')
+        if array.size >= INT_MAX // 2:
+            raise ValueError('The maze is too big for int32 cell indices.')
+        cdef int sx = array.shape[0], sy = array.shape[1]
+        self._sx, self._sy = sx, sy
+
+        free = numpy.zeros( ( sx + 2, sy + 2 ), dtype=numpy.int8 )
+        free[1:-1,1:-1] = array >= 0
+        degree = free[:-2,1:-1] + free[2:,1:-1] + free[1:-1,:-2] + free[1:-1,2:]
+        kinds = numpy.where( ( degree != 2 ) | ( array == 1 ), JUNCTION, CORRIDOR ).astype( numpy.int8 )
+        kinds[ array < 0 ] = WALL
+        kinds = numpy.append( kinds.ravel(), numpy.int8( WALL ) )
+        cdef signed char [::1] kind = kinds
+        with nogil:
+            _cover( &kind[0], sx, sy )
 
-            ret.append( (p.x,p.y) )
-            ch = self._directions[p.x,p.y]
-            if ch == ord('X'): break;
-            p = self.__move_step( ch, p.x, p.y )
+        cells = numpy.flatnonzero( kinds == JUNCTION ).astype( numpy.int32 )
+        cdef int n = len( cells )
+        offsets = numpy.zeros( n + 1, dtype=numpy.intp )
+        numpy.cumsum( degree.ravel()[ cells ], out = offsets[1:] )
+        cdef Py_ssize_t edges = offsets[n]
+        where = numpy.full( sx * sy, -1, dtype=numpy.int32 )
+        where[ cells ] = numpy.arange( n, dtype=numpy.int32 )
+        self._where = where
+        self._cells = cells
+        self._castles = cells[ array.ravel()[ cells ] == 1 ]
+        self._offsets = offsets
+        self._n = n
 
+        #every cell inside a corridor is walked once in each direction
+        targets = numpy.empty( edges, dtype=numpy.int32 )
+        lengths = numpy.empty( edges, dtype=numpy.int32 )
+        twins = numpy.empty( edges, dtype=numpy.int32 )
+        run_offsets = numpy.zeros( edges + 1, dtype=numpy.intp )
+        inside = 2 * ( numpy.count_nonzero( kinds ) - n )
+        runs = numpy.empty( inside + 1, dtype=numpy.int32 )
+        self._targets, self._lengths, self._twins = targets, lengths, twins
+        self._run_offsets = run_offsets
+        self._runs = runs
+
+        cdef int u, c, j, v, w, b, length, i
+        cdef int end[2]
+        cdef Py_ssize_t e = 0, r = 0
+        with nogil:
+            for u in range( n ):
+                c = self._cells[u]
+                for j in range(4):
+                    v = _neighbour( c, j, sx, sy )
+                    if v < 0 or kind[v] == WALL: continue
+                    length = _corridor( &kind[0], c, v, sx, sy, &self._runs[r], end )
+                    for i in range( length - 1 ):
+                        if self._where[ self._runs[ r + i ] ] == -1:
+                            self._where[ self._runs[ r + i ] ] = -2 - <int>( r + i )
+                    self._targets[e] = self._where[ end[0] ]
+                    self._lengths[e] = length
+                    #the edge of the target that leaves through the last cell
+                    b = 0
+                    for i in range(4):
+                        w = _neighbour( end[0], i, sx, sy )
+                        if w == end[1]: break
+                        if w >= 0 and kind[w] != WALL: b += 1
+                    self._twins[e] = <int>( self._offsets[ self._targets[e] ] + b )
+                    r += length - 1
+                    e += 1
+                    self._run_offsets[e] = r
+
+        self.nodes = numpy.column_stack( [ cells // max( sy, 1 ), cells % max( sy, 1 ) ] ).astype( numpy.int32 ).reshape( -1, 2 )
+        self.offsets, self.targets, self.lengths = offsets, targets, lengths
+        self.run_offsets, self.runs = run_offsets, runs[:inside]
+        self.visited = 0
+
+        cdef size_t m = max( n, 1 )
+        self._seen = <unsigned int *>calloc( m, sizeof(unsigned int) )
+        self._closed = <unsigned int *>calloc( m, sizeof(unsigned int) )
+        self._g = <int *>malloc( m * sizeof(int) )
+        self._via = <int *>malloc( m * sizeof(int) )
+        self._parent = <int *>malloc( m * sizeof(int) )
+        #a node is pushed once per edge into it, and once more as a start
+        self._open = <open_entry *>malloc( ( edges + n + 2 ) * sizeof(open_entry) )
+        self._up = <int *>malloc( m * sizeof(int) )
+        self._up_edge = <int *>malloc( m * sizeof(int) )
+        self._depth = <int *>malloc( m * sizeof(int) )
+        self._order = <int *>malloc( m * sizeof(int) )
+        if ( self._seen == NULL or self._closed == NULL or self._g == NULL or self._via == NULL
+             or self._parent == NULL or self._open == NULL or self._up == NULL or self._up_edge == NULL
+             or self._depth == NULL or self._order == NULL ):
+            raise MemoryError()
+        with nogil:
+            self.forest = edges == 2 * ( n - self.__span() )
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef int __span( self ) nogil:
+        """Build the spanning forest, returns the number of trees"""
+        cdef int root, u, v, head = 0, tail = 0, trees = 0
+        cdef Py_ssize_t e
+        for u in range( self._n ):
+            self._up[u] = -2
+        for root in range( self._n ):
+            if self._up[root] != -2: continue
+            trees += 1
+            self._up[root] = self._up_edge[root] = -1
+            self._depth[root] = 0
+            self._order[ tail ] = root
+            tail += 1
+            while head < tail:
+                u = self._order[ head ]
+                head += 1
+                for e in range( self._offsets[u], self._offsets[u+1] ):
+                    v = self._targets[e]
+                    if self._up[v] != -2: continue
+                    self._up[v] = u
+                    self._up_edge[v] = <int>e
+                    self._depth[v] = self._depth[u] + self._lengths[e]
+                    self._order[ tail ] = v
+                    tail += 1
+        return trees
+
+    def __dealloc__( self ):
+        free( self._seen )
+        free( self._closed )
+        free( self._g )
+        free( self._via )
+        free( self._parent )
+        free( self._open )
+        free( self._up )
+        free( self._up_edge )
+        free( self._depth )
+        free( self._order )
+
+    def __len__( self ):
+        return self._n
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef spot __locate( self, int c ) nogil:
+        cdef spot s
+        cdef int w = self._where[c]
+        cdef Py_ssize_t r
+        s.node = w if w >= 0 else -1
+        s.edge = -1
+        s.position = 0
+        s.source = w
+        if w < -1:
+            r = -2 - w
+            s.edge = <int>( _upper( &self._run_offsets[0], self._run_offsets.shape[0], r ) - 1 )
+            s.position = <int>( r - self._run_offsets[ s.edge ] ) + 1
+            s.source = <int>( _upper( &self._offsets[0], self._offsets.shape[0], s.edge ) - 1 )
+        return s
+
+    cdef spot __spot( self, point ) except *:
+        row, column = point
+        if not ( 0 <= row < self._sx and 0 <= column < self._sy ):
+            raise IndexError('The cell is out of the maze.')
+        if self._where[ row * self._sy + column ] == -1:
+            raise ValueError('The cell is a wall.')
+        return self.__locate( row * self._sy + column )
+
+    def locate( self, point ):
+        """Where a free cell is in the graph: ( node, edge, position )
+
+        A node has the edge -1 and the position 0, a cell inside a corridor
+        has the node -1, an edge through it and the steps from its source.
+        """
+        cdef spot s = self.__spot( point )
+        return s.node, s.edge, s.position
+
+    cdef void __begin( self ) nogil:
+        """Start a new search"""
+        self._gen += 1
+        if self._gen == 0:
+            #the stamps wrapped around, forget them all
+            memset( self._seen, 0, max( self._n, 1 ) * sizeof(unsigned int) )
+            memset( self._closed, 0, max( self._n, 1 ) * sizeof(unsigned int) )
+            self._gen = 1
+        self.visited = 0
+
+    cdef inline void __reach( self, int v, int d, int via, int parent, Py_ssize_t * size ) nogil:
+        if self._seen[v] != self._gen or d < self._g[v]:
+            self._seen[v] = self._gen
+            self._g[v] = d
+            self._via[v] = via
+            self._parent[v] = parent
+            _heap_push( self._open, size, d, v )
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef int __dijkstra( self, Py_ssize_t size, int limit, spot * goal, route * r ) nogil:
+        """Settle the ``size`` nodes pushed so far and those they reach, by distance
+
+        Stops at ``limit`` steps. With a ``goal`` returns the length of the
+        shortest path to it under ``limit``, or -1, and sets the end of ``r``.
+        """
+        cdef Py_ssize_t e
+        cdef int u, d, best = limit, x0 = -1, x1 = -1, tail0 = 0, tail1 = 0
+        cdef unsigned int gen = self._gen
+        if goal != NULL:
+            x0, tail0 = goal.source, goal.position
+            if goal.node < 0:
+                x1, tail1 = self._targets[ goal.edge ], self._lengths[ goal.edge ] - goal.position
+
+        while size:
+            u = _heap_pop( self._open, &size )
+            if self._closed[u] == gen: continue
+            self._closed[u] = gen
+            d = self._g[u]
+            if d >= best: break
+            self.visited += 1
+            if u == x0 and d + tail0 < best:
+                best = d + tail0
+                r.last, r.last_side = u, 0
+            if u == x1 and d + tail1 < best:
+                best = d + tail1
+                r.last, r.last_side = u, 1
+            for e in range( self._offsets[u], self._offsets[u+1] ):
+                self.__reach( self._targets[e], d + self._lengths[e], <int>e, u, &size )
+        return best if best < limit else -1
+
+    cdef inline int __exits( self, spot s, int * nodes, int * steps ) nogil:
+        """Nodes a path from the spot can enter the graph at, with the steps to them"""
+        if s.node >= 0:
+            nodes[0], steps[0] = s.node, 0
+            return 1
+        nodes[0], steps[0] = s.source, s.position
+        nodes[1], steps[1] = self._targets[ s.edge ], self._lengths[ s.edge ] - s.position
+        return 2
+
+    cdef int __climb( self, int a, int b ) nogil:
+        """Steps between two nodes of the forest, -1 in different trees"""
+        cdef int da = self._depth[a], db = self._depth[b]
+        while a != b:
+            #the deeper node cannot be the common ancestor
+            if self._depth[a] >= self._depth[b]:
+                if self._up[a] < 0: return -1
+                a = self._up[a]
+            else:
+                b = self._up[b]
+        return da + db - 2 * self._depth[a]
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef int __search( self, spot s, spot t, route * r ) nogil:
+        """Length of a shortest path between two spots, -1 without one"""
+        cdef Py_ssize_t size = 0
+        cdef int best = INT_MAX, d, i, j, u, ns, nt
+        cdef int from_nodes[2]
+        cdef int from_steps[2]
+        cdef int to_nodes[2]
+        cdef int to_steps[2]
+        r.first = -1
+        self.visited = 0
+        if s.node < 0 and t.node < 0:
+            if t.edge == s.edge:
+                best = abs( t.position - s.position )
+            elif t.edge == self._twins[ s.edge ]:
+                best = abs( self._lengths[ t.edge ] - t.position - s.position )
+        ns = self.__exits( s, from_nodes, from_steps )
+        nt = self.__exits( t, to_nodes, to_steps )
+
+        if self.forest:
+            for i in range( ns ):
+                for j in range( nt ):
+                    d = self.__climb( from_nodes[i], to_nodes[j] )
+                    if d >= 0 and d + from_steps[i] + to_steps[j] < best:
+                        best = d + from_steps[i] + to_steps[j]
+                        r.first, r.first_side = from_nodes[i], i
+                        r.last, r.last_side = to_nodes[j], j
+            return best if best < INT_MAX else -1
+
+        self.__begin()
+        for i in range( ns ):
+            self.__reach( from_nodes[i], from_steps[i], -1, -1, &size )
+        #a path through the graph has to be shorter than along the corridor
+        d = self.__dijkstra( size, best, &t, r )
+        if d < 0:
+            return best if best < INT_MAX else -1
+        u = r.last
+        while self._via[u] >= 0:
+            u = self._parent[u]
+        r.first = u
+        r.first_side = 0 if s.node >= 0 or u == s.source and self._g[u] == s.position else 1
+        return d
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef inline int __cell( self, int e, int p, int source ) nogil:
+        """Cell p steps along the edge e from its source"""
+        if p == 0: return self._cells[ source ]
+        if p == self._lengths[e]: return self._cells[ self._targets[e] ]
+        return self._runs[ self._run_offsets[e] + p - 1 ]
+
+    cdef list __segments( self, route r ):
+        """Edges from the first to the last node of a route as ( edge, source, backwards )"""
+        cdef int a = r.first, b = r.last
+        up, down = [], []
+        if self.forest:
+            while a != b:
+                if self._depth[a] >= self._depth[b]:
+                    up.append( ( self._up_edge[a], self._up[a], True ) )
+                    a = self._up[a]
+                else:
+                    down.append( ( self._up_edge[b], self._up[b], False ) )
+                    b = self._up[b]
+        else:
+            while self._via[b] >= 0:
+                down.append( ( self._via[b], self._parent[b], False ) )
+                b = self._parent[b]
+        return up + down[::-1]
+
+    def distance( self, start, goal ):
+        """Length of a shortest path from ``start`` to ``goal``"""
+        cdef spot s = self.__spot( start ), t = self.__spot( goal )
+        cdef route r
+        cdef int length
+        with nogil:
+            length = self.__search( s, t, &r )
+        if length < 0:
+            raise ValueError('The path doesn\'t exists.')
+        return length
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    def path( self, start, goal, bint expand = True ):
+        """Shortest path from ``start`` to ``goal``
+
+        Returns an (L, 2) int32 array of rows and columns of all the cells
+        of the path, the corridors expanded from their runs. Without
+        ``expand`` only the start, the nodes it goes through and the goal.
+        """
+        cdef spot s = self.__spot( start ), t = self.__spot( goal )
+        cdef route r
+        cdef int length, e, p, q, step, source, i = 0
+        with nogil:
+            length = self.__search( s, t, &r )
+        if length < 0:
+            raise ValueError('The path doesn\'t exists.')
+
+        flat = numpy.empty( length + 1, dtype=numpy.int32 )
+        cdef int [::1] out = flat
+        segments = [] if r.first < 0 else self.__segments( r )
+        if r.first < 0:
+            #along one corridor
+            q = t.position if t.edge == s.edge else self._lengths[ s.edge ] - t.position
+        elif s.node < 0:
+            q = 0 if r.first_side == 0 else self._lengths[ s.edge ]
+        else:
+            q = s.position
+        if s.node >= 0:
+            out[0] = self._cells[ s.node ]
+        else:
+            step = 1 if q >= s.position else -1
+            for p in range( s.position, q + step, step ):
+                out[i] = self.__cell( s.edge, p, s.source )
+                i += 1
+            i -= 1
+
+        for e, source, backwards in segments:
+            if backwards:
+                for p in range( self._lengths[e] - 1, -1, -1 ):
+                    i += 1
+                    out[i] = self.__cell( e, p, source )
+            else:
+                for p in range( 1, self._lengths[e] + 1 ):
+                    i += 1
+                    out[i] = self.__cell( e, p, source )
+
+        if r.first >= 0 and t.node < 0:
+            if r.last_side == 0:
+                for p in range( 1, t.position + 1 ):
+                    i += 1
+                    out[i] = self.__cell( t.edge, p, t.source )
+            else:
+                for p in range( self._lengths[ t.edge ] - 1, t.position - 1, -1 ):
+                    i += 1
+                    out[i] = self.__cell( t.edge, p, t.source )
+
+        if not expand:
+            points = [ flat[0] ]
+            if r.first >= 0:
+                points.append( self._cells[ r.first ] )
+                for e, source, backwards in segments:
+                    points.append( self._cells[ source ] if backwards else self._cells[ self._targets[e] ] )
+            points.append( flat[length] )
+            #the start or the goal may be the first or last node
+            flat = numpy.array( [ x for k, x in enumerate( points ) if k == 0 or x != points[k-1] ], dtype=numpy.int32 )
+        return numpy.column_stack( [ flat // self._sy, flat % self._sy ] ).astype( numpy.int32 )
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    def distances( self ):
+        """Distances of all cells to the nearest castle, as ``analyze( array ).distances``
+
+        The distances of the nodes come from a Dijkstra from the castles, or
+        in a forest from the nearest castle below every node and then above
+        it. The cells inside every corridor get the shorter way to one of
+        its ends.
+        """
+        cdef Py_ssize_t size = 0, e
+        cdef int u, v, p, du, dv, length, d, c, i
+        cdef route r
+        ret = numpy.full( ( self._sx, self._sy ), -1, dtype=numpy.int32 )
+        if self._n == 0:
+            return ret
+        cdef int [::1] out = ret.ravel()
+        with nogil:
+            self.__begin()
+            if self.forest:
+                for u in range( self._n ):
+                    self._g[u] = INT_MAX
+                for u in range( self._castles.shape[0] ):
+                    self._g[ self._where[ self._castles[u] ] ] = 0
+                for i in range( self._n - 1, 0, -1 ):
+                    u = self._order[i]
+                    if self._up[u] >= 0 and self._g[u] < INT_MAX:
+                        d = self._g[u] + self._lengths[ self._up_edge[u] ]
+                        if d < self._g[ self._up[u] ]: self._g[ self._up[u] ] = d
+                for i in range( self._n ):
+                    u = self._order[i]
+                    if self._up[u] >= 0 and self._g[ self._up[u] ] < INT_MAX:
+                        d = self._g[ self._up[u] ] + self._lengths[ self._up_edge[u] ]
+                        if d < self._g[u]: self._g[u] = d
+                    if self._g[u] < INT_MAX: self._closed[u] = self._gen
+            else:
+                for u in range( self._castles.shape[0] ):
+                    self.__reach( self._where[ self._castles[u] ], 0, -1, -1, &size )
+                self.__dijkstra( size, INT_MAX, NULL, &r )
+            for u in range( self._n ):
+                du = self._g[u] if self._closed[u] == self._gen else -1
+                out[ self._cells[u] ] = du
+                for e in range( self._offsets[u], self._offsets[u+1] ):
+                    #every corridor once, from the smaller of its two edges
+                    if self._twins[e] < e: continue
+                    v = self._targets[e]
+                    dv = self._g[v] if self._closed[v] == self._gen else -1
+                    length = self._lengths[e]
+                    for p in range( 1, length ):
+                        c = self._runs[ self._run_offsets[e] + p - 1 ]
+                        if du < 0 and dv < 0: d = -1
+                        elif dv < 0 or du >= 0 and du + p <= dv + length - p: d = du + p
+                        else: d = dv + length - p
+                        out[c] = d
         return ret
 
-def analyze(array):
-    return Solved_maze( array )
+
+def compress(array):
+    """Corridor graph of a maze, see ``Corridor_graph``"""
+    return Corridor_graph( array )
+
 
 def main():
     Z = maze_generator.generate_maze(10,10,1,1)
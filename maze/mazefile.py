@@ -0,0 +1,142 @@
+"""Binary maze files
+
+A file starts with a header of 40 bytes, little endian:
+
+    magic       4s  b'MAZE'
+    version     B   1
+    encoding    B   0 for one int8 per cell, 1 for one bit per cell set on walls
+    reserved    2x
+    height      Q
+    width       Q
+    castle      qq  row and column of the castle in the bit encoding, -1 if none
+
+and the rows follow. In the bit encoding every row takes ceil(width / 8)
+bytes, so the rows can be read and written one block at a time.
+
+Files not starting with the magic are read as the text of ``numpy.savetxt``,
+which the application used to save mazes with.
+"""
+import struct
+
+import numpy
+
+MAGIC = b'MAZE'
+VERSION = 1
+INT8 = 0
+BITS = 1
+
+HEADER = struct.Struct( '<4sBB2xQQqq' )
+
+
+def _header( f ):
+    data = f.read( HEADER.size )
+    if len( data ) < HEADER.size:
+        raise ValueError( 'truncated .maze file' )
+    magic, version, encoding, height, width, row, column = HEADER.unpack( data )
+    if magic != MAGIC:
+        raise ValueError( 'not a maze file' )
+    if version > VERSION:
+        raise ValueError( 'maze file version {} is newer than {}'.format( version, VERSION ) )
+    return encoding, height, width, ( row, column )
+
+
+def save( path, array, encoding = INT8 ):
+    """Writes a maze, with one int8 per cell or in the bit encoding (BITS)
+
+    The bit encoding takes an eighth of the space but only keeps walls,
+    free cells and one castle; all walls are read back as -1.
+    """
+    array = numpy.asarray( array )
+    if array.ndim != 2:
+        raise ValueError( 'a maze is a 2-D array' )
+    if encoding == BITS:
+        return write_rows( path, [ array ], array.shape[1] )
+    if encoding != INT8:
+        raise ValueError( 'unknown encoding {!r}'.format( encoding ) )
+    if array.size and ( array.min() < -128 or array.max() > 127 ):
+        raise ValueError( 'cell values must fit into int8' )
+
+    height, width = array.shape
+    with open( path, 'wb' ) as f:
+        f.write( HEADER.pack( MAGIC, VERSION, INT8, height, width, -1, -1 ) )
+        # in blocks, so that saving a memmap does not copy all of it
+        step = max( 1, ( 1 << 24 ) // max( width, 1 ) )
+        for start in range( 0, height, step ):
+            array[ start : start + step ].astype( numpy.int8 ).tofile( f )
+    return height, width
+
+
+def load( path, mmap = True ):
+    """Reads a maze file, or a text maze of ``numpy.savetxt``
+
+    With ``mmap`` the int8 encoding is mapped copy-on-write: the maze is
+    not read until used and changes to it do not go to the file. The bit
+    encoding is decoded into an int8 array and text into an int32 one.
+    """
+    with open( path, 'rb' ) as f:
+        text = f.read( len( MAGIC ) ) != MAGIC
+        if not text:
+            f.seek( 0 )
+            encoding, height, width, castle = _header( f )
+    if text:
+        return numpy.loadtxt( path, ndmin = 2 ).astype( numpy.int32 )
+
+    if encoding == BITS:
+        array = numpy.empty( ( height, width ), dtype=numpy.int8 )
+        start = 0
+        for rows in read_rows( path ):
+            array[ start : start + len( rows ) ] = rows
+            start += len( rows )
+        return array
+    if encoding != INT8:
+        raise ValueError( 'unknown maze file encoding {}'.format( encoding ) )
+    if mmap and height and width:
+        return numpy.memmap( path, dtype=numpy.int8, mode='c', offset=HEADER.size, shape=( height, width ) )
+    with open( path, 'rb' ) as f:
+        f.seek( HEADER.size )
+        return numpy.fromfile( f, dtype=numpy.int8, count=height * width ).reshape( height, width )
+
+
+def write_rows( path, rows, width ):
+    """Writes blocks of rows in the bit encoding, as they come
+
+    ``rows`` is an iterable of arrays of the shape (k, width), e.g.
+    ``maze_generator.generate_rows``. Only walls (negative values), free
+    cells (0) and one castle (1) can be stored. Returns the shape written.
+    """
+    height = 0
+    castle = ( -1, -1 )
+    with open( path, 'wb' ) as f:
+        f.write( HEADER.pack( MAGIC, VERSION, BITS, 0, width, *castle ) )
+        for block in rows:
+            block = numpy.asarray( block ).reshape( -1, width )
+            if ( block > 1 ).any():
+                raise ValueError( 'only walls, free cells and a castle fit in one bit' )
+            found = numpy.argwhere( block == 1 )
+            if len( found ):
+                if len( found ) > 1 or castle[0] >= 0:
+                    raise ValueError( 'only one castle fits in one bit' )
+                castle = ( height + int( found[0,0] ), int( found[0,1] ) )
+            numpy.packbits( block < 0, axis = 1 ).tofile( f )
+            height += len( block )
+        f.seek( 0 )
+        f.write( HEADER.pack( MAGIC, VERSION, BITS, height, width, *castle ) )
+    return height, width
+
+
+def read_rows( path, block = 1024 ):
+    """Yields the maze of a file as int32 arrays of up to ``block`` rows"""
+    with open( path, 'rb' ) as f:
+        encoding, height, width, castle = _header( f )
+        line = ( width + 7 ) // 8 if encoding == BITS else width
+        for start in range( 0, height, block ):
+            count = min( block, height - start )
+            data = numpy.fromfile( f, dtype=numpy.uint8 if encoding == BITS else numpy.int8, count = count * line )
+            if encoding == BITS:
+                walls = numpy.unpackbits( data.reshape( count, line ), axis = 1, count = width )
+                rows = -walls.astype( numpy.int32 )
+                if start <= castle[0] < start + count:
+                    rows[ castle[0] - start, castle[1] ] = 1
+            else:
+                rows = data.reshape( count, width ).astype( numpy.int32 )
+            yield rows
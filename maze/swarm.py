@@ -0,0 +1,203 @@
+"""Many dudes at once, with their state in NumPy arrays
+
+The rules of the actor behaviors, applied to all dudes that finish
+a move at the same time by array operations instead of one coroutine
+per dude.
+"""
+import numpy
+
+from . import maze_solver
+from .actor import DIR, KINDS
+
+# moves in the order of actor.DIR: turning left is +1, turning right -1
+MOVES = numpy.array( [ d[1] for d in DIR ], dtype=numpy.int32 )
+CASTLE = 4
+NO_PATH = 5
+
+RIGHT_HAND, CONFUSED, FAST, ACCELERATED, TELEPORTED = 2, 3, 4, 5, 6
+
+_CODES = numpy.full( 256, NO_PATH, dtype=numpy.int8 )
+for _i, (_ch, _move) in enumerate( DIR ):
+    _CODES[ ord(_ch) ] = _i
+_CODES[ ord('X') ] = CASTLE
+
+
+class Swarm:
+    def __init__(self, array, dudes = None, kinds = None, seed = None, solved = None):
+        """Dudes of one maze, moving on a virtual clock
+
+        :param array: the maze
+        :param dudes: (N, 2) positions of the dudes, by default the cells
+            of ``array`` with values 2 to 6 (the kinds of ``actor.KINDS``)
+        :param kinds: (N,) kinds of the dudes (the values of ``actor.KINDS``),
+            by default taken from ``array``
+        :param seed: seed or ``numpy.random.Generator`` of the random rules
+        :param solved: the ``analyze`` of ``array``, if already at hand
+
+        The clock starts at -1.0, so that the starting jump ends at 0.0 and
+        the finish times are counted like the game time. Dudes standing
+        where there is no path, or of a kind without a behavior, never move
+        and never finish.
+        """
+        array = numpy.asarray( array )
+        if dudes is None:
+            dudes = numpy.argwhere( numpy.isin( array, list( KINDS ) ) )
+        dudes = numpy.asarray( dudes, dtype=numpy.int32 ).reshape( -1, 2 )
+        if kinds is None:
+            kinds = array[ dudes[:,0], dudes[:,1] ]
+
+        self.random = numpy.random.default_rng( seed )
+        if solved is None:
+            solved = maze_solver.analyze( array )
+        self.solved = solved
+        self.shape = array.shape
+        self.distances = solved.distances
+        self.codes = _CODES[ numpy.asarray( solved.directions ).view( numpy.uint8 ) ]
+        # walkable cells, with a frame of walls
+        self.ok = numpy.zeros( ( array.shape[0] + 2, array.shape[1] + 2 ), dtype=bool )
+        self.ok[1:-1,1:-1] = array >= 0
+
+        n = len( dudes )
+        self.kind = numpy.asarray( kinds, dtype=numpy.int8 ).copy()
+        self.row = dudes[:,0].copy()
+        self.column = dudes[:,1].copy()
+        self.target_row = self.row.copy()
+        self.target_column = self.column.copy()
+        self.move = numpy.full( n, -1, dtype=numpy.int8 )     # -1 jumping, shivering
+        self.last = numpy.full( n, -1, dtype=numpy.int8 )
+        self.speed = numpy.ones( n )
+        self.begin = numpy.ones( n, dtype=bool )
+        self.duration = numpy.ones( n )                        # the starting jump
+        self.until = numpy.zeros( n )
+        self.finish = numpy.full( n, numpy.nan )
+        self.active = ( self.codes[ self.row, self.column ] != NO_PATH ) & numpy.isin( self.kind, list( self._RULES ) )
+        self.now = -1.0
+
+    def _ok(self, row, column, move):
+        return self.ok[ row + MOVES[move,0] + 1, column + MOVES[move,1] + 1 ]
+
+    def _right_hand(self, idx, code):
+        row, column, last = self.row[idx], self.column[idx], self.last[idx]
+        right = ( last - 1 ) % 4
+        # before the first move the "right" cell is the dude's own
+        right_ok = ( last < 0 ) | self._ok( row, column, right )
+        move = numpy.where( ~right_ok, last, numpy.where( self.begin[idx], code, right ) )
+        self.begin[ idx[~right_ok] ] = False
+
+        for i in range(4):
+            blocked = ~self._ok( row, column, move )
+            if not blocked.any(): break
+            move[blocked] = ( move[blocked] + 1 ) % 4
+
+        speed = 1.0 - self.random.integers( 0, 100, len(idx) ) / 100.0
+        self.speed[idx] = speed * 0.7 + self.speed[idx] * 0.3
+        return move, self.speed[idx]
+
+    def _confused(self, idx, code):
+        row, column, last = self.row[idx], self.column[idx], self.last[idx]
+        ok = numpy.stack( [ self._ok( row, column, numpy.int8(m) ) for m in range(4) ], axis = 1 )
+        # does not go back, unless in a dead end
+        back = numpy.zeros_like( ok )
+        back[ numpy.arange( len(idx) ), ( last + 2 ) % 4 ] = last >= 0
+        ok &= ~back | ( ok.sum( axis = 1 ) == 1 )[:, None]
+
+        count = ok.cumsum( axis = 1 )
+        pick = ( self.random.random( len(idx) ) * count[:,-1] ).astype( numpy.int32 )
+        move = ( count <= pick[:, None] ).sum( axis = 1 )
+        return move, numpy.ones( len(idx) )
+
+    def _accelerated(self, idx, code):
+        self.speed[idx] = numpy.where( code == self.last[idx], self.speed[idx] * 0.9, 1.0 )
+        return code, self.speed[idx]
+
+    def _teleported(self, idx, code):
+        move = code.astype( numpy.int32 )
+        duration = numpy.ones( len(idx) )
+        pending = numpy.arange( len(idx) )
+        while pending.size:
+            tries = pending[ self.random.random( pending.size ) < 2 / 11 ]
+            row = self.random.integers( 0, self.shape[0], tries.size )
+            column = self.random.integers( 0, self.shape[1], tries.size )
+            good = self.ok[ row + 1, column + 1 ] & ( self.distances[ row, column ] > 5 )
+            jumps = tries[good]
+            # 8 shivers, then the dude appears at the new place
+            move[jumps] = -1
+            duration[jumps] = 0.8
+            self.target_row[ idx[jumps] ] = row[good]
+            self.target_column[ idx[jumps] ] = column[good]
+            pending = tries[~good]
+        return move, duration
+
+    _RULES = {
+        RIGHT_HAND: _right_hand,
+        CONFUSED: _confused,
+        FAST: lambda self, idx, code: ( code, numpy.full( len(idx), 0.57 ) ),
+        ACCELERATED: _accelerated,
+        TELEPORTED: _teleported,
+    }
+
+    def _land(self, idx):
+        self.row[idx] = self.target_row[idx]
+        self.column[idx] = self.target_column[idx]
+        code = self.codes[ self.row[idx], self.column[idx] ]
+
+        castle = code == CASTLE
+        self.finish[ idx[castle] ] = self.until[ idx[castle] ]
+        self.active[ idx[castle] ] = False
+        idx, code = idx[~castle], code[~castle]
+
+        kinds = self.kind[idx]
+        for kind, rule in self._RULES.items():
+            mask = kinds == kind
+            if not mask.any(): continue
+            sub = idx[mask]
+            move, duration = rule( self, sub, code[mask] )
+            move = numpy.asarray( move, dtype=numpy.int8 )
+            step = move >= 0
+            self.target_row[ sub[step] ] = self.row[ sub[step] ] + MOVES[ move[step], 0 ]
+            self.target_column[ sub[step] ] = self.column[ sub[step] ] + MOVES[ move[step], 1 ]
+            self.move[sub] = move
+            self.last[ sub[step] ] = move[step]
+            self.duration[sub] = duration
+            self.until[sub] += duration
+
+    def update_cell(self, row, column, value):
+        """Follows a change of a cell, made by ``solved.update_cell``
+
+        The dudes take the new directions from the cells they land on next.
+        """
+        self.ok[ row + 1, column + 1 ] = value >= 0
+        self.distances = self.solved.distances
+        self.codes = _CODES[ numpy.asarray( self.solved.directions ).view( numpy.uint8 ) ]
+
+    def tick(self, dt):
+        """Advances the clock by ``dt`` seconds
+
+        Every move that ends within the tick is finished at its exact time,
+        so the finish times of the dudes without random decisions do not
+        depend on ``dt``.
+        """
+        self.now += dt
+        while True:
+            idx = numpy.flatnonzero( self.active & ( self.until <= self.now ) )
+            if not idx.size: break
+            self._land( idx )
+
+    def run(self, limit = 3600.0, dt = 1.0):
+        """Ticks until every dude finished or the clock passed ``limit``
+
+        Returns the finish times, NaN for dudes that did not finish.
+        """
+        while self.active.any() and self.now < limit:
+            self.tick( dt )
+        finish = self.finish.copy()
+        finish[ finish > limit ] = numpy.nan
+        return finish
+
+    @property
+    def positions(self):
+        """(N, 2) float positions of the dudes at the current time"""
+        progress = numpy.clip( 1 - ( self.until - self.now ) / self.duration, 0, 1 )
+        step = self.move >= 0
+        move = MOVES[ numpy.where( step, self.move, 0 ) ] * ( step * progress )[:, None]
+        return numpy.column_stack( [ self.row, self.column ] ) + move
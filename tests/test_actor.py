@@ -0,0 +1,60 @@
+import subprocess
+import sys
+
+import numpy
+import pytest
+
+import maze
+from maze.actor import simulate
+
+
+def corridor(length, dude):
+    array = numpy.zeros((1, length), dtype=numpy.int32)
+    array[0, 0] = 1
+    array[0, -1] = dude
+    return array
+
+
+def test_fast_dude_time():
+    assert simulate(corridor(11, 4)) == [pytest.approx(10 * 0.57)]
+
+
+def test_accelerated_dude_time():
+    assert simulate(corridor(4, 5)) == [pytest.approx(1 + 0.9 + 0.81)]
+
+
+def test_no_path():
+    array = corridor(5, 4)
+    array[0, 2] = -1
+    assert simulate(array) == [None]
+
+
+def test_limit():
+    assert simulate(corridor(11, 4), limit=5) == [None]
+
+
+def test_same_seed_same_times():
+    random = numpy.random.RandomState(0)
+    array = maze.generate_maze(21, 21)
+    free = numpy.argwhere(array == 0)
+    for i, (row, column) in enumerate(free[random.choice(len(free), 10, replace=False)]):
+        array[row, column] = 2 + i % 5
+    times = simulate(array, seed=7)
+    assert len(times) == 10
+    assert simulate(array, seed=7) == times
+
+
+def test_randomized_maze():
+    array = maze.randomize(maze.generate_maze(21, 21, seed=3), rng=3)
+    assert (array > 6).any()
+    times = simulate(array, seed=1)
+    assert len(times) == numpy.isin(array, [2, 3, 4, 5, 6]).sum()
+
+
+def test_no_qt():
+    code = ('import sys, numpy, maze\n'
+            'array = numpy.zeros((3, 3), dtype=numpy.int32); array[0, 0] = 1; array[2, 2] = 4\n'
+            'maze.simulate(array)\n'
+            'print([m for m in ("PyQt5", "quamash") if m in sys.modules])')
+    out = subprocess.check_output([sys.executable, '-c', code])
+    assert out.strip() == b'[]'
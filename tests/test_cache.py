@@ -0,0 +1,165 @@
+import os
+
+import numpy
+import pytest
+
+import maze
+from maze import cache, maze_solver
+
+
+@pytest.fixture
+def array():
+    return maze.generate_maze(41, 31, seed=2)
+
+
+def same(a, b):
+    assert (a.distances == b.distances).all()
+    assert (a.directions == b.directions).all()
+    assert a.is_reachable == b.is_reachable
+
+
+def test_hit_is_mapped(tmp_path, array):
+    solutions = cache.Solution_cache(str(tmp_path))
+    fresh = maze_solver.analyze(array, cache=solutions)
+    cached = maze_solver.analyze(array, cache=solutions)
+    assert isinstance(cached.distances, numpy.memmap)
+    assert len(os.listdir(str(tmp_path))) == 1
+    same(cached, fresh)
+    same(cached, maze_solver.analyze(array))
+
+
+def test_dudes_share_the_solution(tmp_path, array):
+    solutions = cache.Solution_cache(str(tmp_path))
+    maze_solver.analyze(array, cache=solutions)
+    key = cache.fingerprint(array)
+    row, column = numpy.argwhere(array == 0)[0]
+    array[row, column] = 3
+    assert cache.fingerprint(array) == key
+    maze_solver.analyze(array, cache=solutions)
+    assert len(os.listdir(str(tmp_path))) == 1
+
+
+def test_update_cell_stays_in_memory(tmp_path, array):
+    solutions = cache.Solution_cache(str(tmp_path))
+    maze_solver.analyze(array, cache=solutions)
+    cached = maze_solver.analyze(array, cache=solutions)
+    row, column = numpy.argwhere(array == 0)[10]
+    cached.update_cell(row, column, -1)
+    array[row, column] = -1
+    same(cached, maze_solver.analyze(array))
+    array[row, column] = 0
+    same(maze_solver.analyze(array, cache=solutions), maze_solver.analyze(array))
+
+
+def test_unreachable(tmp_path):
+    array = numpy.zeros((5, 5), dtype=int)
+    array[2, :] = -1
+    array[0, 0] = 1
+    solutions = cache.Solution_cache(str(tmp_path))
+    maze_solver.analyze(array, cache=solutions)
+    cached = maze_solver.analyze(array, cache=solutions)
+    assert not cached.is_reachable
+    same(cached, maze_solver.analyze(array))
+    cached.update_cell(2, 2, 0)
+    assert cached.is_reachable
+
+
+def test_lru_eviction(tmp_path):
+    mazes = [maze.generate_maze(21, 21, seed=seed) for seed in range(4)]
+    size = cache.HEADER.size + 23 * 23 * 5
+    solutions = cache.Solution_cache(str(tmp_path), budget=3 * size)
+    for array in mazes[:3]:
+        maze_solver.analyze(array, cache=solutions)
+    os.utime(os.path.join(str(tmp_path), cache.fingerprint(mazes[1]) + cache.SUFFIX), (0, 0))
+    maze_solver.analyze(mazes[0], cache=solutions)
+    maze_solver.analyze(mazes[3], cache=solutions)
+
+    kept = sorted(os.listdir(str(tmp_path)))
+    assert kept == sorted(cache.fingerprint(a) + cache.SUFFIX for a in (mazes[0], mazes[2], mazes[3]))
+
+
+def test_too_big_for_budget(tmp_path, array):
+    solutions = cache.Solution_cache(str(tmp_path), budget=100)
+    same(maze_solver.analyze(array, cache=solutions), maze_solver.analyze(array))
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_corrupt_file_is_a_miss(tmp_path, array):
+    solutions = cache.Solution_cache(str(tmp_path))
+    with open(os.path.join(str(tmp_path), cache.fingerprint(array) + cache.SUFFIX), 'wb') as f:
+        f.write(b'junk')
+    same(maze_solver.analyze(array, cache=solutions), maze_solver.analyze(array))
+
+
+def test_compact_not_cached(tmp_path, array):
+    with pytest.raises(ValueError):
+        maze_solver.analyze(array, compact=True, cache=cache.Solution_cache(str(tmp_path)))
+
+
+def test_zobrist_edit(array):
+    key = cache.zobrist(array)
+    for (row, column), value in [((1, 1), -1), ((1, 1), 0), ((3, 5), 1), ((3, 5), 4), ((0, 0), 0), ((2, 2), 1)]:
+        key = cache.zobrist_edit(key, row, column, array[row, column], value)
+        array[row, column] = value
+        assert key == cache.zobrist(array)
+
+
+def test_zobrist_shape():
+    assert cache.zobrist(numpy.zeros((2, 6))) != cache.zobrist(numpy.zeros((3, 4)))
+    assert cache.zobrist(-numpy.eye(3)) != cache.zobrist(-numpy.eye(3)[::-1])
+
+
+def test_memo_hits_and_misses(array):
+    memo = cache.Solution_memo()
+    first = maze_solver.analyze(array, cache=memo)
+    row, column = numpy.argwhere(array == 0)[5]
+    array[row, column] = -1
+    maze_solver.analyze(array, cache=memo)
+    array[row, column] = 0
+    again = maze_solver.analyze(array, cache=memo)
+    assert (memo.hits, memo.misses, len(memo)) == (1, 2, 2)
+    same(again, first)
+
+
+def test_memo_copies(array):
+    memo = cache.Solution_memo()
+    maze_solver.analyze(array, cache=memo).update_cell(1, 1, -1)
+    cached = maze_solver.analyze(array, cache=memo)
+    same(cached, maze_solver.analyze(array))
+    cached.update_cell(1, 1, -1)
+    same(maze_solver.analyze(array, cache=memo), maze_solver.analyze(array))
+
+
+def test_memo_budget():
+    mazes = [maze.generate_maze(21, 21, seed=seed) for seed in range(4)]
+    memo = cache.Solution_memo(budget=3 * 23 * 23 * 5)
+    for array in mazes[:3]:
+        maze_solver.analyze(array, cache=memo)
+    maze_solver.analyze(mazes[0], cache=memo)
+    maze_solver.analyze(mazes[3], cache=memo)
+    assert len(memo) == 3 and memo.size <= memo.budget
+    assert memo.get(cache.zobrist(mazes[1])) is None
+    assert memo.get(cache.zobrist(mazes[0])) is not None
+
+
+def test_memo_key(array):
+    memo = cache.Solution_memo()
+    key = cache.zobrist(array)
+    maze_solver.analyze(array, cache=memo, key=key)
+    maze_solver.analyze(array, cache=memo, key=key)
+    assert memo.hits == 1
+
+
+def test_memo_store(array):
+    memo = cache.Solution_memo()
+    key = cache.zobrist(array)
+    solved = maze_solver.analyze(array, cache=memo, key=key)
+    row, column = numpy.argwhere(array == 0)[5]
+    key = cache.zobrist_edit(key, row, column, 0, -1)
+    array[row, column] = -1
+    solved.update_cell(row, column, -1)
+    solved.store(memo, key)
+    same(maze_solver.analyze(array, cache=memo, key=key), maze_solver.analyze(array))
+    assert memo.hits == 1
+    with pytest.raises(ValueError):
+        maze_solver.analyze(array, compact=True).store(memo, key)
@@ -2,6 +2,8 @@ import maze
 import random
 import numpy
 import pytest
+import subprocess
+import sys
 
 
 def gen_norm():
@@ -30,6 +32,119 @@ def gen_notreachable():
     array = maze.randomize( array )
     return maze.analyze(array)
 
+def test_headless_import():
+    """Solver and generator load without Qt and matplotlib"""
+    code = ( 'import sys, numpy, maze\n'
+             'maze.analyze( maze.generate_maze(11, 11) )\n'
+             'print( [m for m in ("PyQt5", "matplotlib") if m in sys.modules] )' )
+    out = subprocess.check_output( [ sys.executable, '-c', code ] )
+    assert out.strip() == b'[]'
+
+def test_lazy_attributes():
+    assert maze.analyze is maze.maze_solver.analyze
+    assert 'analyze' in dir( maze )
+    with pytest.raises( AttributeError ):
+        maze.no_such_thing
+
+@pytest.mark.parametrize( 'shape', [ (10, 10), (11, 11), (8, 13), (51, 81) ] )
+def test_generate_shape( shape ):
+    array = maze.generate_maze( shape[1], shape[0], seed = 1 )
+    assert array.shape == shape
+    assert ( array[0] == -1 ).all() and ( array[-1] == -1 ).all()
+    assert ( array[:,0] == -1 ).all() and ( array[:,-1] == -1 ).all()
+    assert ( array == 1 ).sum() == 1
+    assert set( numpy.unique( array ) ) <= { -1, 0, 1 }
+
+def test_generate_seed():
+    assert ( maze.generate_maze( 41, 31, seed = 9 ) == maze.generate_maze( 41, 31, seed = 9 ) ).all()
+    assert ( maze.generate_maze( 41, 31, seed = 9 ) != maze.generate_maze( 41, 31, seed = 10 ) ).any()
+    random.seed( 4 )
+    array = maze.generate_maze( 41, 31 )
+    random.seed( 4 )
+    assert ( maze.generate_maze( 41, 31 ) == array ).all()
+
+def test_generate_large_filled():
+    """Big mazes have walls everywhere, not only near the aisles started first"""
+    array = maze.generate_maze( 401, 401, seed = 2 )
+    for part in ( array[:200,:200], array[200:,200:] ):
+        assert ( part < 0 ).mean() > 0.4
+
+def test_generate_many_workers():
+    one = maze.generate_many( 40, 21, 15, seed = 6 )
+    assert one.shape == ( 40, 21 - 6, 21 )
+    assert ( ( one == 1 ).sum( axis = (1, 2) ) == 1 ).all()
+    assert len( { array.tobytes() for array in one } ) == 40
+    for workers in ( 2, 3, 8 ):
+        assert ( maze.generate_many( 40, 21, 15, seed = 6, workers = workers ) == one ).all()
+
+def test_generate_many_out():
+    out = numpy.full( ( 5, 11, 13 ), 7, dtype = numpy.int32 )
+    assert maze.generate_many( 5, 13, 11, seed = 1, out = out ) is out
+    assert ( out == maze.generate_many( 5, 13, 11, seed = 1 ) ).all()
+    # a wrong array is not touched
+    for wrong in ( numpy.full( ( 4, 11, 13 ), 7, dtype = numpy.int32 ),
+                   numpy.full( ( 5, 11, 13 ), 7, dtype = numpy.int64 ),
+                   numpy.full( ( 5, 13, 11 ), 7, dtype = numpy.int32 ).transpose( 0, 2, 1 ) ):
+        with pytest.raises( ValueError ):
+            maze.generate_many( 5, 13, 11, out = wrong )
+        assert ( wrong == 7 ).all()
+
+@pytest.mark.parametrize( 'method', [ 'kruskal', 'eller', 'wilson' ] )
+@pytest.mark.parametrize( 'shape', [ (3, 3), (11, 21), (10, 10), (4, 7), (81, 101) ] )
+def test_generate_perfect( method, shape ):
+    """Every free cell is reachable by exactly one path"""
+    array = maze.generate_maze( shape[1], shape[0], seed = 3, method = method )
+    assert array.shape == shape
+    assert ( array == 1 ).sum() == 1
+    free = array >= 0
+    joins = ( free[:,1:] & free[:,:-1] ).sum() + ( free[1:] & free[:-1] ).sum()
+    assert joins == free.sum() - 1
+    assert ( maze.analyze( array ).distances[ free ] >= 0 ).all()
+
+@pytest.mark.parametrize( 'method', [ 'kruskal', 'eller', 'wilson' ] )
+def test_generate_perfect_seed( method ):
+    one = maze.generate_many( 10, 31, 21, seed = 2, method = method )
+    assert ( maze.generate_many( 10, 31, 21, seed = 2, method = method, workers = 3 ) == one ).all()
+    assert len( { array.tobytes() for array in one } ) == 10
+
+@pytest.mark.parametrize( 'shape', [ (11, 21), (10, 10), (1000, 7) ] )
+@pytest.mark.parametrize( 'block', [ 1, 2, 7, 1024 ] )
+def test_generate_rows( shape, block ):
+    array = maze.generate_maze( shape[1], shape[0], seed = 8, method = 'eller' )
+    blocks = list( maze.generate_rows( shape[1], shape[0], seed = 8, block = block ) )
+    assert all( len( rows ) <= block for rows in blocks )
+    assert ( numpy.concatenate( blocks ) == array ).all()
+
+@pytest.mark.parametrize( 'method', [ 'walk', 'kruskal', 'eller', 'wilson' ] )
+@pytest.mark.parametrize( 'shape', [ (0, 5), (5, 0), (0, 0), (-1, 5) ] )
+def test_generate_empty( method, shape ):
+    with pytest.raises( ValueError ):
+        maze.generate_maze( shape[1], shape[0], seed = 1, method = method )
+    with pytest.raises( ValueError ):
+        maze.generate_many( 2, shape[1], shape[0], seed = 1, method = method )
+
+def test_generate_unknown_method():
+    with pytest.raises( ValueError ):
+        maze.generate_maze( 11, 11, method = 'prim' )
+
+def test_randomize_values():
+    array = maze.generate_maze( 101, 101 )
+    out = maze.randomize( array, numpy.random.default_rng( 3 ) )
+    assert out.shape == array.shape
+    assert ( out[ array == 1 ] == 1 ).all()
+    assert set( out[ array < 0 ] ) == set( range( -10, 0 ) )
+    assert set( out[ array == 0 ] ) == { 0 } | set( range( 2, 11 ) )
+    changed = ( out != array )[ array == 0 ].mean()
+    assert 0.6 < changed < 0.73
+
+def test_randomize_seed():
+    array = maze.generate_maze( 31, 31 )
+    assert ( maze.randomize( array, 5 ) == maze.randomize( array, 5 ) ).all()
+    random.seed( 5 )
+    out = maze.randomize( array )
+    random.seed( 5 )
+    assert ( maze.randomize( array ) == out ).all()
+
 ##### NORMAL #####
 
 def test_normaldist():
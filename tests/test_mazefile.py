@@ -0,0 +1,88 @@
+import numpy
+import pytest
+
+import maze
+from maze import mazefile
+
+
+@pytest.mark.parametrize('shape', [(11, 21), (10, 16), (3, 3), (301, 77)])
+def test_rows_round_trip(tmp_path, shape):
+    path = tmp_path / 'rows.maze'
+    array = maze.generate_maze(shape[1], shape[0], seed=1, method='eller')
+    assert mazefile.write_rows(path, maze.generate_rows(shape[1], shape[0], seed=1, block=5), shape[1]) == shape
+    assert (numpy.concatenate(list(mazefile.read_rows(path, block=4))) == array).all()
+
+
+def test_rows_are_bits(tmp_path):
+    path = tmp_path / 'rows.maze'
+    mazefile.write_rows(path, maze.generate_rows(801, 101, seed=1), 801)
+    assert path.stat().st_size == mazefile.HEADER.size + 101 * 101
+
+
+def test_rows_only_walls_and_castle(tmp_path):
+    array = maze.generate_maze(11, 11, seed=1)
+    array[3, 3] = 2
+    with pytest.raises(ValueError):
+        mazefile.write_rows(tmp_path / 'dude.maze', [array], 11)
+
+
+def test_not_a_maze(tmp_path):
+    path = tmp_path / 'text.maze'
+    path.write_bytes(b'0 0 -1\n' * 10)
+    with pytest.raises(ValueError):
+        next(mazefile.read_rows(path))
+
+
+@pytest.mark.parametrize('size', (4, 20, 39))
+def test_truncated_header(tmp_path, size):
+    path = tmp_path / 'short.maze'
+    mazefile.write_rows(path, [maze.generate_maze(11, 7, seed=1)], 11)
+    path.write_bytes(path.read_bytes()[:size])
+    with pytest.raises(ValueError, match='truncated'):
+        mazefile.load(path)
+    with pytest.raises(ValueError, match='truncated'):
+        next(mazefile.read_rows(path))
+
+
+@pytest.fixture
+def dudes():
+    array = maze.randomize(maze.generate_maze(41, 23, seed=2), 2)
+    return array
+
+
+def test_save_load_int8(tmp_path, dudes):
+    path = tmp_path / 'dudes.maze'
+    mazefile.save(path, dudes)
+    assert path.stat().st_size == mazefile.HEADER.size + dudes.size
+    loaded = maze.load(path)
+    assert isinstance(loaded, numpy.memmap)
+    assert (loaded == dudes).all()
+    assert (maze.load(path, mmap=False) == dudes).all()
+
+
+def test_load_copy_on_write(tmp_path, dudes):
+    path = tmp_path / 'dudes.maze'
+    mazefile.save(path, dudes)
+    loaded = maze.load(path)
+    loaded[1, 1] = 5
+    assert (maze.load(path) == dudes).all()
+
+
+def test_save_load_bits(tmp_path):
+    path = tmp_path / 'bits.maze'
+    array = maze.generate_maze(41, 23, seed=2)
+    mazefile.save(path, array, mazefile.BITS)
+    assert (maze.load(path) == array).all()
+    with pytest.raises(ValueError):
+        mazefile.save(path, maze.randomize(array, 2), mazefile.BITS)
+
+
+def test_load_text(tmp_path, dudes):
+    path = tmp_path / 'dudes.txt'
+    numpy.savetxt(path, dudes)
+    assert (maze.load(path) == dudes).all()
+
+
+def test_save_too_big_values(tmp_path):
+    with pytest.raises(ValueError):
+        mazefile.save(tmp_path / 'big.maze', numpy.full((3, 3), 300))
@@ -3,7 +3,8 @@ from itertools import product
 import numpy
 import pytest
 
-from maze import analyze
+from maze import analyze, generate_maze
+from maze.maze_solver import analyze_batch, analyze_into, shortest_path, Path_finder, Path_index, compress
 
 
 S = (1, 5, 20, 100)
@@ -258,6 +259,551 @@ def test_s_shape_paths(s_shape):
         path = path[1:]
 
 """
+@pytest.fixture(params=range(20))
+def edited(request):
+    rng = numpy.random.RandomState(request.param)
+    h, w = rng.randint(1, 30, size=2)
+    maze = rng.choice([-1, 0, 1, 2], size=(h, w), p=[.3, .64, .03, .03])
+    amaze = analyze(maze)
+    return rng, maze, amaze
+
+
+def test_update_cell_same_as_analyze(edited):
+    rng, maze, amaze = edited
+    h, w = maze.shape
+    for _ in range(100):
+        row, column = rng.randint(h), rng.randint(w)
+        value = rng.choice([-1, 0, 1, 2], p=[.5, .35, .1, .05])
+        maze[row, column] = value
+        amaze.update_cell(row, column, value)
+        fresh = analyze(maze)
+        assert (amaze.distances == fresh.distances).all()
+        assert (amaze.directions == fresh.directions).all()
+        assert amaze.is_reachable == fresh.is_reachable
+
+
+def test_update_cell_reports_reachability():
+    maze = zeros(3, 5)
+    maze[0, 0] = 1
+    maze[0:2, 2] = -1
+    amaze = analyze(maze)
+    assert amaze.update_cell(2, 0, -1) is False
+    assert amaze.update_cell(2, 2, -1) is True
+    assert not amaze.is_reachable
+    assert (amaze.directions[:, 3:] == b' ').all()
+    assert amaze.update_cell(0, 2, 0) is True
+    assert amaze.is_reachable
+    assert lt(amaze.path(1, 3)) == \
+        [(1, 3), (0, 3), (0, 2), (0, 1), (0, 0)]
+
+
+def test_update_cell_out_of_maze():
+    maze = zeros(3, 3)
+    amaze = analyze(maze)
+    with pytest.raises(IndexError):
+        amaze.update_cell(3, 0, -1)
+
+
+@pytest.mark.parametrize('size', (7, 1200))
+def test_threads_same_as_serial(size):
+    rng = numpy.random.RandomState(size)
+    maze = rng.choice([-1, 0, 1], size=(size, size), p=[.3, .6995, .0005])
+    serial = analyze(maze)
+    threaded = analyze(maze, threads=4)
+    assert (serial.distances == threaded.distances).all()
+    assert (serial.directions == threaded.directions).all()
+    assert serial.is_reachable == threaded.is_reachable
+
+
+def compact_distances(distances, dtype):
+    return numpy.where(distances < 0, numpy.iinfo(dtype).max, distances)
+
+
+def test_compact_uint16(edited):
+    rng, maze, _ = edited
+    amaze = analyze(maze)
+    compact = analyze(maze, compact=True)
+    assert compact.distances.dtype == numpy.uint16
+    assert (compact.distances ==
+            compact_distances(amaze.distances, numpy.uint16)).all()
+    assert (compact.directions == amaze.directions).all()
+    assert compact.is_reachable == amaze.is_reachable
+
+
+def test_compact_update_cell(edited):
+    rng, maze, _ = edited
+    maze = maze.copy()
+    compact = analyze(maze, compact=True)
+    h, w = maze.shape
+    for _ in range(30):
+        row, column = rng.randint(h), rng.randint(w)
+        value = rng.choice([-1, 0, 1])
+        maze[row, column] = value
+        compact.update_cell(row, column, value)
+    fresh = analyze(maze)
+    assert (compact.distances ==
+            compact_distances(fresh.distances, numpy.uint16)).all()
+    assert (compact.directions == fresh.directions).all()
+
+
+def test_compact_long_path_uint32():
+    # a snake corridor with paths longer than uint16 allows
+    maze = numpy.full((400, 400), -1, dtype=numpy.int8)
+    maze[::2, :] = 0
+    maze[1::4, -1] = 0
+    maze[3::4, 0] = 0
+    maze[0, 0] = 1
+    amaze = analyze(maze)
+    compact = analyze(maze, compact=True)
+    assert amaze.distances.max() > 65535
+    assert compact.distances.dtype == numpy.uint32
+    assert (compact.distances ==
+            compact_distances(amaze.distances, numpy.uint32)).all()
+    assert (compact.directions == amaze.directions).all()
+
+
+def test_packed_same_as_bytes(edited):
+    rng, maze, _ = edited
+    amaze = analyze(maze)
+    packed = analyze(maze, packed=True)
+    h, w = maze.shape
+    for row in range(h):
+        for column in range(w):
+            if amaze.distances[row, column] < 0:
+                with pytest.raises(ValueError):
+                    packed.path_array(row, column)
+                continue
+            path = packed.path_array(row, column)
+            assert path.dtype == numpy.int32
+            assert lt(path) == amaze.path(row, column)
+    assert (packed.directions == amaze.directions).all()
+
+
+def test_path_array_out_of_maze():
+    amaze = analyze(zeros(3, 3), packed=True)
+    with pytest.raises(IndexError):
+        amaze.path_array(0, 3)
+
+
+def test_paths_union_same_as_paths(edited):
+    rng, maze, amaze = edited
+    sources = numpy.argwhere(maze >= 2)
+    expected = numpy.zeros(maze.shape, dtype=numpy.uint8)
+    line = {b'^': 0, b'>': 1, b'v': 2, b'<': 3}
+    for source in sources:
+        try:
+            path = amaze.path(*source)
+        except ValueError:
+            continue
+        line_in = line[amaze.directions[path[0]]]
+        for p in path:
+            expected[p] |= 1 << line_in
+            if amaze.directions[p] == b'X':
+                break
+            line_out = line[amaze.directions[p]]
+            expected[p] |= 1 << line_out
+            line_in = (line_out + 2) % 4
+    assert (amaze.paths_union(sources) == expected).all()
+
+
+def test_paths_union_corner():
+    maze = zeros(2, 2)
+    maze[0, 0] = 1
+    amaze = analyze(maze)
+    # bits: up 1, right 2, down 4, left 8
+    assert amaze.paths_union([(1, 1), (0, 1)]).tolist() == \
+        [[4 | 2, 8], [1 | 2, 8]]
+
+
+def test_analyze_batch_same_as_analyze():
+    rng = numpy.random.RandomState(3)
+    stack = rng.choice([-1, 0, 1], size=(40, 9, 13), p=[.3, .67, .03])
+    batch = analyze_batch(stack)
+    assert batch.distances.shape == batch.directions.shape == stack.shape
+    for maze, distances, directions, reachable in zip(
+            stack, batch.distances, batch.directions, batch.is_reachable):
+        amaze = analyze(maze)
+        assert (amaze.distances == distances).all()
+        assert (amaze.directions == directions).all()
+        assert amaze.is_reachable == reachable
+
+
+def test_analyze_batch_list():
+    mazes = [zeros(4, 6) for _ in range(3)]
+    mazes[1][0, 0] = 1
+    batch = analyze_batch(mazes)
+    assert list(batch.is_reachable) == [False, True, False]
+    check_meshgrid(batch.distances[1])
+
+
+def test_analyze_batch_needs_stack():
+    with pytest.raises(ValueError):
+        analyze_batch(zeros(4, 6))
+
+
+@pytest.mark.parametrize('budget', (64, 4096, 1 << 26))
+def test_analyze_into_memmaps(tmp_path, budget):
+    rng = numpy.random.RandomState(5)
+    maze = rng.choice([-1, 0, 1], size=(60, 45), p=[.3, .69, .01]).astype(numpy.int8)
+    array = numpy.memmap(tmp_path / 'maze', dtype=numpy.int8, mode='w+', shape=maze.shape)
+    array[:] = maze
+    distances = numpy.memmap(tmp_path / 'distances', dtype=numpy.int32, mode='w+', shape=maze.shape)
+    directions = numpy.memmap(tmp_path / 'directions', dtype='S1', mode='w+', shape=maze.shape)
+    reachable = analyze_into(array, distances, directions, budget)
+    amaze = analyze(maze)
+    assert (distances == amaze.distances).all()
+    assert (directions == amaze.directions).all()
+    assert reachable == amaze.is_reachable
+
+
+def test_analyze_out(tmp_path):
+    maze = random_maze(7, shape=(50, 33)).astype(numpy.int8)
+    array = numpy.memmap(tmp_path / 'maze', dtype=numpy.int8, mode='w+', shape=maze.shape)
+    array[:] = maze
+    distances = numpy.memmap(tmp_path / 'distances', dtype=numpy.int32, mode='w+', shape=maze.shape)
+    directions = numpy.memmap(tmp_path / 'directions', dtype='S1', mode='w+', shape=maze.shape)
+    solved = analyze(array, out=(distances, directions), budget=256)
+    assert solved.distances is distances and solved.directions is directions
+    amaze = analyze(maze)
+    assert (distances == amaze.distances).all()
+    assert (directions == amaze.directions).all()
+    assert solved.is_reachable == amaze.is_reachable
+    with pytest.raises(ValueError):
+        analyze(array, out=(distances, directions), compact=True)
+
+
+def test_analyze_into_reachable():
+    maze = zeros(30, 20)
+    maze[29, 19] = 1
+    distances = numpy.empty(maze.shape, dtype=numpy.int32)
+    directions = numpy.empty(maze.shape, dtype='S1')
+    assert analyze_into(maze, distances, directions, 64)
+    check_meshgrid(distances[::-1, ::-1])
+
+
+def test_analyze_into_shape():
+    with pytest.raises(ValueError):
+        analyze_into(zeros(4, 6), numpy.empty((4, 6), dtype=numpy.int32),
+                     numpy.empty((6, 4), dtype='S1'))
+
+
+def random_maze(seed, shape=(40, 50)):
+    rng = numpy.random.RandomState(seed)
+    return rng.choice([-1, 0, 1], size=shape, p=[.3, .69, .01]).astype(numpy.int32)
+
+
+def dijkstra(maze):
+    """Reference weighted distances: stepping onto a cell costs max(value, 1)"""
+    import heapq
+    dist = numpy.full(maze.shape, -1, dtype=numpy.int64)
+    heap = [(0, r, c) for r, c in numpy.argwhere(maze == 1).tolist()]
+    dist[maze == 1] = 0
+    while heap:
+        d, r, c = heapq.heappop(heap)
+        if d > dist[r, c]:
+            continue
+        for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+            if 0 <= nr < maze.shape[0] and 0 <= nc < maze.shape[1] and maze[nr, nc] >= 0 and maze[nr, nc] != 1:
+                nd = d + max(int(maze[nr, nc]), 1)
+                if dist[nr, nc] < 0 or nd < dist[nr, nc]:
+                    dist[nr, nc] = nd
+                    heapq.heappush(heap, (nd, nr, nc))
+    return dist
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_weighted_unit_costs(seed):
+    maze = random_maze(seed)
+    plain, weighted = analyze(maze), analyze(maze, weighted=True)
+    assert (plain.distances == weighted.distances).all()
+    assert (plain.directions == weighted.directions).all()
+    assert plain.is_reachable == weighted.is_reachable
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_weighted_costs(seed):
+    maze = random_maze(seed)
+    free = maze == 0
+    maze[free] = numpy.random.RandomState(seed).randint(0, 11, size=numpy.count_nonzero(free))
+    amaze = analyze(maze, weighted=True)
+    assert (amaze.distances == dijkstra(maze)).all()
+
+    # every direction leads to a neighbour closer by the cost of the cell
+    moves = {b'v': (1, 0), b'^': (-1, 0), b'>': (0, 1), b'<': (0, -1)}
+    for (r, c), d in numpy.ndenumerate(amaze.distances):
+        if d > 0:
+            dr, dc = moves[amaze.directions[r, c]]
+            assert amaze.distances[r + dr, c + dc] == d - max(maze[r, c], 1)
+
+
+def test_weighted_path_prefers_cheap_cells():
+    maze = zeros(3, 5)
+    maze[1, 1:4] = 10
+    maze[1, 0] = 1
+    amaze = analyze(maze, weighted=True)
+    assert amaze.distances[1, 3] == 14
+    assert amaze.distances[1, 4] == 6
+    assert amaze.path(1, 4) == [(1, 4), (0, 4), (0, 3), (0, 2), (0, 1), (0, 0), (1, 0)]
+
+
+@pytest.mark.parametrize('packed', (False, True))
+def test_weighted_update_cell(packed):
+    maze = random_maze(7)
+    free = maze == 0
+    maze[free] = numpy.random.RandomState(7).randint(0, 11, size=numpy.count_nonzero(free))
+    amaze = analyze(maze, weighted=True, packed=packed)
+    for i, (r, c) in enumerate(numpy.argwhere(maze >= -1)[::23]):
+        value = (-1, 0, 1, 9, 4)[i % 5]
+        amaze.update_cell(r, c, value)
+        maze[r, c] = value
+        fresh = analyze(maze, weighted=True)
+        assert (amaze.distances == fresh.distances).all()
+        assert (amaze.directions == fresh.directions).all()
+        assert amaze.is_reachable == fresh.is_reachable
+
+
+def test_weighted_options():
+    with pytest.raises(ValueError):
+        analyze(zeros(3, 3), weighted=True, compact=True)
+    with pytest.raises(ValueError):
+        analyze(zeros(3, 3) + 2 ** 30, weighted=True)
+
+
+def check_path(maze, path, start, goal, length):
+    assert len(path) == length + 1
+    assert tuple(path[0]) == start and tuple(path[-1]) == goal
+    assert (numpy.abs(numpy.diff(path, axis=0)).sum(axis=1) == 1).all()
+    assert (maze[path[:, 0], path[:, 1]] >= 0).all()
+
+
+@pytest.mark.parametrize('method', ('astar', 'bidirectional', 'jps'))
+@pytest.mark.parametrize('seed', range(6))
+def test_shortest_path(method, seed):
+    maze = random_maze(seed, shape=(25 + seed, 40 - seed))
+    maze[maze == 1] = 0
+    rng = numpy.random.RandomState(seed)
+    free = numpy.argwhere(maze == 0)
+    finder = Path_finder(maze)
+    for i in range(20):
+        start, goal = tuple(free[rng.randint(len(free))]), tuple(free[rng.randint(len(free))])
+        target = maze.copy()
+        target[goal] = 1
+        length = analyze(target).distances[start]
+        if length < 0:
+            with pytest.raises(ValueError):
+                finder.path(start, goal, method)
+        else:
+            check_path(maze, finder.path(start, goal, method), start, goal, length)
+
+
+@pytest.mark.parametrize('method', ('astar', 'bidirectional', 'jps'))
+def test_shortest_path_same_cell(method):
+    maze = zeros(3, 4)
+    assert shortest_path(maze, (1, 2), (1, 2), method).tolist() == [[1, 2]]
+
+
+@pytest.mark.parametrize('method', ('astar', 'bidirectional', 'jps'))
+def test_shortest_path_visits_few_cells(method):
+    maze = zeros(500, 500)
+    finder = Path_finder(maze)
+    check_path(maze, finder.path((250, 240), (250, 260), method), (250, 240), (250, 260), 20)
+    assert finder.visited < 1000
+
+
+@pytest.mark.parametrize('method', ('astar', 'bidirectional', 'jps'))
+@pytest.mark.parametrize('seed', range(4))
+def test_shortest_path_compressed(method, seed):
+    maze = random_maze(seed, shape=(30, 30))
+    maze[maze == 1] = 0
+    free = numpy.argwhere(maze == 0)
+    finder = Path_finder(maze)
+    for start, goal in zip(free[::7], free[::-11]):
+        start, goal = tuple(start), tuple(goal)
+        try:
+            path = finder.path(start, goal, method)
+        except ValueError:
+            continue
+        corners = finder.path(start, goal, method, compressed=True)
+        assert tuple(corners[0]) == start and tuple(corners[-1]) == goal
+        # straight runs between the corners, turning at every corner
+        assert ((corners[1:] == corners[:-1]).sum(axis=1) == 1).all() or len(corners) == 1
+        steps = numpy.sign(numpy.diff(corners, axis=0))
+        assert (steps[1:] != steps[:-1]).any(axis=1).all()
+        assert numpy.abs(numpy.diff(corners, axis=0)).sum() == len(path) - 1
+
+
+def test_jps_open_board():
+    maze = zeros(2000, 2000)
+    maze[1000, 500:1500] = -1
+    finder = Path_finder(maze)
+    path = finder.path((10, 20), (1990, 1900), 'jps')
+    check_path(maze, path, (10, 20), (1990, 1900), 1980 + 1880)
+    assert finder.visited < 10000
+    assert len(finder.path((10, 20), (1990, 1900), 'jps', compressed=True)) <= 4
+
+
+def test_shortest_path_errors():
+    maze = zeros(5, 5)
+    maze[2, :] = -1
+    with pytest.raises(ValueError):
+        shortest_path(maze, (0, 0), (4, 4))
+    with pytest.raises(ValueError):
+        shortest_path(maze, (0, 0), (2, 2))
+    with pytest.raises(IndexError):
+        shortest_path(maze, (0, 0), (5, 0))
+    with pytest.raises(ValueError):
+        shortest_path(maze, (0, 0), (1, 1), method='dfs')
+
+
+@pytest.mark.parametrize('cluster', (4, 5, 16))
+@pytest.mark.parametrize('seed', range(4))
+def test_path_index(cluster, seed):
+    maze = random_maze(seed, shape=(30 + seed, 41 - seed))
+    maze[maze == 1] = 0
+    rng = numpy.random.RandomState(seed)
+    free = numpy.argwhere(maze == 0)
+    index = Path_index(maze, cluster=cluster)
+    for i in range(20):
+        start, goal = tuple(free[rng.randint(len(free))]), tuple(free[rng.randint(len(free))])
+        target = maze.copy()
+        target[goal] = 1
+        length = analyze(target).distances[start]
+        if length < 0:
+            with pytest.raises(ValueError):
+                index.distance(start, goal)
+            continue
+        # near-optimal: never shorter than the shortest path
+        distance = index.distance(start, goal)
+        assert distance >= length
+        check_path(maze, index.path(start, goal), start, goal, distance)
+        waypoints = index.path(start, goal, refine=False)
+        assert tuple(waypoints[0]) == start and tuple(waypoints[-1]) == goal
+
+
+def test_path_index_same_cluster():
+    maze = zeros(40, 40)
+    index = Path_index(maze)
+    assert index.distance((1, 1), (1, 1)) == 0
+    check_path(maze, index.path((2, 3), (10, 12)), (2, 3), (10, 12), 17)
+    check_path(maze, index.path((2, 3), (35, 30)), (2, 3), (35, 30), 60)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_path_index_update_cell(seed):
+    maze = random_maze(seed, shape=(37, 29))
+    maze[maze == 1] = 0
+    rng = numpy.random.RandomState(seed)
+    index = Path_index(maze, cluster=8)
+    for i in range(30):
+        row, column = rng.randint(maze.shape[0]), rng.randint(maze.shape[1])
+        value = -1 if maze[row, column] >= 0 else 0
+        maze[row, column] = value
+        assert 1 <= index.update_cell(row, column, value) <= 3
+        fresh = Path_index(maze, cluster=8)
+        assert index.nodes == fresh.nodes
+        free = numpy.argwhere(maze == 0)
+        start, goal = tuple(free[rng.randint(len(free))]), tuple(free[rng.randint(len(free))])
+        try:
+            expected = fresh.distance(start, goal)
+        except ValueError:
+            with pytest.raises(ValueError):
+                index.distance(start, goal)
+            continue
+        assert index.distance(start, goal) == expected
+
+
+def test_path_index_errors():
+    maze = zeros(10, 10)
+    maze[5, :] = -1
+    index = Path_index(maze, cluster=4)
+    with pytest.raises(ValueError):
+        index.distance((0, 0), (9, 9))
+    with pytest.raises(ValueError):
+        index.path((0, 0), (5, 5))
+    with pytest.raises(IndexError):
+        index.distance((0, 0), (10, 0))
+    with pytest.raises(IndexError):
+        index.update_cell(-1, 0, 0)
+
+
+def corridor_mazes():
+    yield random_maze(0, shape=(30, 41))
+    yield generate_maze(41, 31, seed=1)
+    for seed, method in enumerate(('kruskal', 'eller', 'wilson')):
+        yield generate_maze(31 + 2 * seed, 27, seed=seed, method=method)
+
+
+@pytest.mark.parametrize('maze', corridor_mazes())
+def test_compress_distances(maze):
+    assert (compress(maze).distances() == analyze(maze).distances).all()
+
+
+def test_compress_forest():
+    assert compress(generate_maze(41, 31, seed=1, method='kruskal')).forest
+    # a loop of corridor is a node with two edges to itself
+    maze = zeros(4, 4) - 1
+    maze[1:3, 1:3] = 0
+    graph = compress(maze)
+    assert not graph.forest
+    assert len(graph) == 1 and graph.targets.tolist() == [0, 0] and graph.lengths.tolist() == [4, 4]
+    assert graph.distance((1, 2), (2, 1)) == 2
+
+
+def test_compress_arrays():
+    maze = numpy.array([[0, 0, 0, -1],
+                        [-1, -1, 0, -1],
+                        [1, 0, 0, 0]])
+    graph = compress(maze)
+    # the dead ends, the castle and the junction
+    assert graph.nodes.tolist() == [[0, 0], [2, 0], [2, 2], [2, 3]]
+    assert graph.offsets.tolist() == [0, 1, 2, 5, 6]
+    assert graph.targets.tolist() == [2, 2, 0, 1, 3, 2]
+    assert graph.lengths.tolist() == [4, 2, 4, 2, 1, 1]
+    assert graph.run_offsets.tolist() == [0, 3, 4, 7, 8, 8, 8]
+    assert graph.runs.tolist() == [1, 2, 6, 9, 6, 2, 1, 9]
+    assert graph.locate((0, 2)) == (-1, 0, 2)
+    assert graph.locate((2, 2)) == (2, -1, 0)
+
+
+@pytest.mark.parametrize('maze', corridor_mazes())
+def test_compress_paths(maze):
+    maze[maze == 1] = 0
+    rng = numpy.random.RandomState(0)
+    free = numpy.argwhere(maze == 0)
+    graph = compress(maze)
+    for i in range(30):
+        start, goal = tuple(free[rng.randint(len(free))]), tuple(free[rng.randint(len(free))])
+        target = maze.copy()
+        target[goal] = 1
+        length = analyze(target).distances[start]
+        if length < 0:
+            with pytest.raises(ValueError):
+                graph.path(start, goal)
+            continue
+        assert graph.distance(start, goal) == length
+        path = graph.path(start, goal)
+        check_path(maze, path, start, goal, length)
+        # the nodes on the way, in the order of the path
+        points = graph.path(start, goal, expand=False)
+        assert tuple(points[0]) == start and tuple(points[-1]) == goal
+        cells = [tuple(cell) for cell in path.tolist()]
+        order = [cells.index(tuple(point)) for point in points.tolist()]
+        assert order == sorted(set(order))
+
+
+def test_compress_errors():
+    maze = zeros(5, 5)
+    maze[2, :] = -1
+    graph = compress(maze)
+    with pytest.raises(ValueError):
+        graph.distance((0, 0), (4, 4))
+    with pytest.raises(ValueError):
+        graph.path((0, 0), (2, 2))
+    with pytest.raises(IndexError):
+        graph.locate((5, 0))
+    assert graph.path((1, 1), (1, 1)).tolist() == [[1, 1]]
+
+
 # Helper functions bellow
 
 
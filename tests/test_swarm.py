@@ -0,0 +1,85 @@
+import numpy
+import pytest
+
+import maze
+from maze.actor import simulate
+from maze.swarm import Swarm
+
+
+@pytest.fixture(scope='module')
+def dudes():
+    random = numpy.random.RandomState(3)
+    array = maze.generate_maze(21, 21, seed=3)
+    free = numpy.argwhere(array == 0)
+    for i, (row, column) in enumerate(free[random.choice(len(free), 25, replace=False)]):
+        array[row, column] = 2 + i % 5
+    return array
+
+
+@pytest.mark.parametrize('kind', (4, 5))
+def test_same_times_as_simulate(dudes, kind):
+    """Dudes without random decisions finish as in actor.simulate"""
+    expected = [t for t, k in zip(simulate(dudes, limit=200), dudes[dudes >= 2]) if k == kind]
+    swarm = Swarm(dudes)
+    times = swarm.run(limit=200)[swarm.kind == kind]
+    assert times == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('dt', (0.05, 0.3, 7.0))
+def test_times_do_not_depend_on_tick(dudes, dt):
+    swarm = Swarm(dudes)
+    expected = swarm.run(limit=200)
+    followers = (swarm.kind == 4) | (swarm.kind == 5)
+    times = Swarm(dudes).run(limit=200, dt=dt)
+    assert times[followers] == pytest.approx(expected[followers])
+
+
+def test_same_seed_same_times(dudes):
+    assert numpy.array_equal(Swarm(dudes, seed=1).run(limit=200),
+                             Swarm(dudes, seed=1).run(limit=200), equal_nan=True)
+
+
+def test_no_path():
+    array = numpy.zeros((1, 5), dtype=numpy.int32)
+    array[0, 0] = 1
+    array[0, 2] = -1
+    array[0, 4] = 2
+    assert numpy.isnan(Swarm(array).run()).all()
+
+
+def test_positions_between_cells():
+    array = numpy.zeros((1, 5), dtype=numpy.int32)
+    array[0, 0] = 1
+    swarm = Swarm(array, dudes=[(0, 4)], kinds=[4])
+    swarm.tick(1.0 + 0.57 / 2)
+    assert swarm.positions.tolist() == [pytest.approx([0, 3.5])]
+
+
+def test_stays_on_free_cells(dudes):
+    swarm = Swarm(dudes, dudes=numpy.repeat(numpy.argwhere(dudes >= 2), 40, axis=0),
+                  kinds=numpy.repeat(dudes[dudes >= 2], 40), seed=0)
+    for i in range(100):
+        swarm.tick(0.5)
+        assert (dudes[swarm.row, swarm.column] >= 0).all()
+
+
+def test_randomized_maze():
+    array = maze.randomize(maze.generate_maze(21, 21, seed=3), rng=3)
+    assert (array > 6).any()
+    swarm = Swarm(array, seed=1)
+    assert len(swarm.kind) == len(simulate(array, seed=1))
+    swarm.run(limit=50)
+    # a dude of a kind without a behavior stays where it is
+    swarm = Swarm(array, dudes=[(1, 1)], kinds=[9])
+    assert numpy.isnan(swarm.run(limit=5)).all() and swarm.row[0] == 1
+
+
+def test_follows_a_changed_cell():
+    array = numpy.zeros((1, 7), dtype=numpy.int32)
+    array[0, 0] = array[0, 6] = 1
+    solved = maze.analyze(array)
+    swarm = Swarm(array, dudes=[(0, 4)], kinds=[4], solved=solved)
+    array[0, 5] = -1
+    solved.update_cell(0, 5, -1)
+    swarm.update_cell(0, 5, -1)
+    assert swarm.run().tolist() == [pytest.approx(4 * 0.57)]